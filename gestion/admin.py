@@ -1,12 +1,141 @@
-from django.contrib import admin
-from .models import Autor, Libro, Lector, Prestamo, Multa
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.filters import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db import transaction
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from .models import (
+    Autor, Libro, Lector, Prestamo, Multa, OperacionOdoo, MetadatoISBN, MovimientoStock, Portada, SaldoLector,
+    Reserva, IngestaCatalogo,
+)
+from .busqueda import buscador
+from .cambios import marcar_cambio, MULTAS
+from .estadisticas import invalidar_resumen
+from .paginacion import PaginadorEstimado
+from .saldos import actualizar_saldos
+from .stock import (
+    ajustar_stock, registrar_prestamo, registrar_devolucion, registrar_devoluciones, anular_devolucion, hay_copia_para,
+    StockInsuficiente, DEVUELTO, MAX_LOTE,
+)
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin 
 
-class LibroAdmin(admin.ModelAdmin):
+# --- CHANGELISTS PARA TABLAS GRANDES ---
+class FiltroAutocompletar(admin.FieldListFilter):
+    """
+    Filtro por una relación con miles de filas (lectores, autores): en lugar de una
+    opción por fila muestra el buscador con autocompletado del admin, que consulta
+    el 'search_fields' del admin de la relación. Solo se carga la fila elegida.
+    """
+    template = 'admin/filtro_autocompletar.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        # Por 'pk': el admin no admite 'lector__user__exact' (la clave primaria de Lector es su usuario)
+        self.lookup_kwarg = f'{field_path}__pk__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = field.verbose_name
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        relacionado = self.field.remote_field.model
+        admin_relacionado = changelist.model_admin.admin_site.get_model_admin(relacionado)
+        opciones = relacionado._default_manager.all()
+        if isinstance(admin_relacionado.list_select_related, (list, tuple)):
+            opciones = opciones.select_related(*admin_relacionado.list_select_related)
+        campo = forms.ModelChoiceField(
+            opciones, required=False, widget=AutocompleteSelect(self.field, changelist.model_admin.admin_site),
+        )
+        yield {
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'parametro': self.lookup_kwarg,
+            'buscador': campo.widget.render(self.lookup_kwarg, self.lookup_val),
+        }
+
+
+class FiltroDecada(admin.SimpleListFilter):
+    """ Año de publicación por décadas: las opciones son fijas, sin un SELECT DISTINCT sobre todo el catálogo. """
+    title = 'publicación'
+    parameter_name = 'decada'
+    DESDE = 1900
+
+    def lookups(self, request, model_admin):
+        actual = timezone.now().year // 10 * 10
+        decadas = [(str(decada), f"{decada}s") for decada in range(actual, self.DESDE - 1, -10)]
+        return decadas + [('antes', f"Antes de {self.DESDE}")]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'antes':
+            return queryset.filter(publicacion__lt=self.DESDE)
+        if self.value() and self.value().isdigit():
+            decada = int(self.value())
+            return queryset.filter(publicacion__gte=decada, publicacion__lt=decada + 10)
+        return queryset
+
+
+class AdminEscalable(admin.ModelAdmin):
+    """
+    Base de los changelist que deben seguir siendo rápidos con millones de filas:
+    conteo estimado, sin el segundo COUNT(*) del total sin filtros ni los conteos
+    por opción de los filtros (facets).
+    """
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        # Scripts de select2 para los FiltroAutocompletar del changelist
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class AutorAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'nacionalidad', 'fecha_nacimiento')
+    search_fields = ('apellido', 'nombre')
+    ordering = ('apellido', 'nombre')
+
+
+@admin.register(Lector)
+class LectorAdmin(admin.ModelAdmin):
+    list_display = ('user', 'identificacion', 'telefono')
+    list_select_related = ('user',)
+    search_fields = ('identificacion', 'user__username')
+    ordering = ('identificacion',)
+    raw_id_fields = ('user',)
+
+    # El perfil se crea junto con el usuario (LectorInline); aquí sirve para buscar y para el autocompletado
+    def has_add_permission(self, request):
+        return False
+
+
+class LibroAdmin(AdminEscalable):
     list_display = ('titulo', 'autor', 'publicacion', 'copias_disponibles')
-    list_filter = ('autor', 'publicacion')
+    list_select_related = ('autor',)
+    list_filter = (('autor', FiltroAutocompletar), FiltroDecada)
     search_fields = ('titulo', 'autor__nombre', 'autor__apellido')
+    autocomplete_fields = ('autor',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # El índice de texto completo en lugar de LIKE '%...%' sobre toda la tabla
+        if not search_term:
+            return queryset, False
+        return queryset.filter(buscador().q_libros(search_term)), False
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # El stock se ajusta aparte para que quede registrado como movimiento
+        campos = [campo for campo in form.changed_data if campo != 'copias_disponibles']
+        if campos:
+            obj.save(update_fields=campos)
+        if 'copias_disponibles' in form.changed_data:
+            ajustar_stock(obj.pk, form.cleaned_data['copias_disponibles'], usuario=request.user)
 
 class LectorInline(admin.StackedInline):
     model = Lector
@@ -25,20 +154,118 @@ class UsuarioAdmin(BaseUserAdmin):
     get_identificacion.short_description = 'Identificación'
     
     list_display = ('username', 'email', 'get_identificacion', 'is_staff')
+    list_select_related = ('lector',)
     search_fields = ('username', 'email')
 
+class PrestamoAdminForm(forms.ModelForm):
+    class Meta:
+        model = Prestamo
+        fields = '__all__'
+
+    def clean(self):
+        datos = super().clean()
+        libro, lector = datos.get('libro'), datos.get('lector')
+        if not self.instance.pk and libro and lector and not datos.get('devuelto') and not hay_copia_para(libro, lector):
+            raise forms.ValidationError("Ese libro no tiene copias disponibles.")
+        return datos
+
 @admin.register(Prestamo)
-class PrestamoAdmin(admin.ModelAdmin):
+class PrestamoAdmin(AdminEscalable):
+    form = PrestamoAdminForm
     list_display = ('libro', 'lector', 'fecha_prestamo', 'fecha_devolucion_esperada', 'devuelto')
-    list_filter = ('devuelto', 'fecha_prestamo', 'lector')
+    list_select_related = ('libro', 'lector__user')
+    list_filter = ('devuelto', 'fecha_prestamo', ('lector', FiltroAutocompletar), ('libro', FiltroAutocompletar))
     list_editable = ('devuelto',)
     search_fields = ('libro__titulo', 'lector__user__username')
+    autocomplete_fields = ('libro', 'lector')
+    actions = ('marcar_devueltos',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        motor = buscador()
+        return queryset.filter(
+            motor.q_libros(search_term, prefijo='libro__') | motor.q_lectores(search_term, prefijo='lector__')
+        ), False
+
+    @admin.action(description="Marcar como devueltos (repone copias y cobra multas)", permissions=['change'])
+    def marcar_devueltos(self, request, queryset):
+        # Por lotes de registrar_devoluciones: cada uno en su transacción, con su stock, movimientos y multas
+        pendientes = queryset.filter(devuelto=False).order_by('pk').values_list('pk', flat=True)
+        devueltos, ultimo = 0, 0
+        while True:
+            ids = list(pendientes.filter(pk__gt=ultimo)[:MAX_LOTE])
+            if not ids:
+                break
+            ultimo = ids[-1]
+            resultados = registrar_devoluciones(ids, usuario=request.user)
+            devueltos += sum(resultado['estado'] == DEVUELTO for resultado in resultados)
+        self.message_user(request, f"{devueltos} préstamos marcados como devueltos.", messages.SUCCESS)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StockInsuficiente:
+            # Otro préstamo se llevó la última copia después de validar el formulario; el guardado se deshizo
+            self.message_user(request, "Ese libro ya no tiene copias disponibles.", messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            if obj.devuelto:
+                # Préstamo histórico: no mueve stock
+                super().save_model(request, obj, form, change)
+                return
+            # Como el mostrador: entrega la copia apartada del lector si la tiene y si no descuenta una
+            obj.pk = registrar_prestamo(
+                obj.libro_id, obj.lector, obj.fecha_devolucion_esperada, usuario=request.user,
+                fecha_prestamo=obj.fecha_prestamo, notas_entrega=obj.notas_entrega,
+            ).pk
+            return
+        # Marcar/desmarcar 'devuelto' mueve el stock igual que la vista de devolución
+        campos = [campo for campo in form.changed_data if campo != 'devuelto']
+        if campos:
+            obj.save(update_fields=campos)
+        if 'devuelto' in form.changed_data:
+            if obj.devuelto:
+                registrar_devolucion(obj, usuario=request.user)
+            else:
+                try:
+                    anular_devolucion(obj, usuario=request.user)
+                except StockInsuficiente:
+                    # La copia devuelta ya se prestó o se apartó para la lista de espera
+                    obj.devuelto = True
+                    self.message_user(
+                        request, f"No se puede reabrir el préstamo {obj.pk}: el libro no tiene copias disponibles.",
+                        messages.ERROR,
+                    )
 
 @admin.register(Multa)
-class MultaAdmin(admin.ModelAdmin):
+class MultaAdmin(AdminEscalable):
     list_display = ('get_usuario', 'get_libro', 'monto', 'pagada', 'fecha_generacion')
-    list_filter = ('pagada', 'fecha_generacion')
+    list_select_related = ('prestamo__lector__user', 'prestamo__libro')
+    list_filter = ('pagada', 'fecha_generacion', ('prestamo__lector', FiltroAutocompletar))
     list_editable = ('pagada',)
+    raw_id_fields = ('prestamo',)
+    actions = ('marcar_pagadas',)
+
+    @admin.action(description="Marcar como pagadas", permissions=['change'])
+    def marcar_pagadas(self, request, queryset):
+        # UPDATE por lotes en lugar de un save() (y su señal de saldo) por multa
+        pendientes = queryset.filter(pagada=False).order_by('pk').values_list('pk', 'prestamo__lector_id')
+        pagadas, ultimo = 0, 0
+        while True:
+            with transaction.atomic():
+                lote = list(pendientes.filter(pk__gt=ultimo)[:MAX_LOTE])
+                if not lote:
+                    break
+                ultimo = lote[-1][0]
+                pagadas += Multa.objects.filter(pk__in=[pk for pk, _ in lote], pagada=False).update(pagada=True)
+                actualizar_saldos({lector_id for _, lector_id in lote})
+        if pagadas:
+            invalidar_resumen()
+            marcar_cambio(MULTAS)
+        self.message_user(request, f"{pagadas} multas marcadas como pagadas.", messages.SUCCESS)
 
     def get_usuario(self, obj):
         return obj.prestamo.lector.user.username
@@ -48,7 +275,88 @@ class MultaAdmin(admin.ModelAdmin):
         return obj.prestamo.libro.titulo
     get_libro.short_description = 'Libro'
 
+@admin.register(SaldoLector)
+class SaldoLectorAdmin(admin.ModelAdmin):
+    list_display = ('lector', 'deuda', 'multas_pendientes', 'actualizado')
+    list_select_related = ('lector__user',)
+    search_fields = ('lector__identificacion', 'lector__user__username')
+    ordering = ('-deuda', 'lector')
+
+    # Lo mantiene gestion.saldos a partir de las multas; se corrige con 'verificar_saldos'
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    list_display = ('libro', 'lector', 'estado', 'creada', 'vence')
+    list_select_related = ('libro', 'lector__user')
+    list_filter = ('estado',)
+    search_fields = ('libro__titulo', 'lector__identificacion', 'lector__user__username')
+    raw_id_fields = ('libro', 'lector', 'prestamo')
+
+    # El estado lo cambian gestion.reservas y los préstamos: editarlo aquí descuadraría el stock apartado
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(IngestaCatalogo)
+class IngestaCatalogoAdmin(admin.ModelAdmin):
+    list_display = ('archivo', 'formato', 'registros', 'libros', 'autores', 'omitidos', 'terminada', 'actualizada')
+    list_filter = ('terminada', 'formato')
+    readonly_fields = ('huella', 'archivo', 'formato', 'registros', 'libros', 'autores', 'omitidos', 'iniciada', 'actualizada')
+
+    # Se crea desde 'ingestar_catalogo'; borrar una fila obliga a cargar ese archivo desde el principio
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(OperacionOdoo)
+class OperacionOdooAdmin(admin.ModelAdmin):
+    list_display = ('isbn', 'titulo', 'estado', 'intentos', 'proximo_intento', 'odoo_id')
+    list_filter = ('estado',)
+    search_fields = ('isbn', 'titulo')
+    readonly_fields = ('ultimo_error', 'creado', 'actualizado')
+
+@admin.register(MetadatoISBN)
+class MetadatoISBNAdmin(admin.ModelAdmin):
+    list_display = ('isbn', 'consultado', 'ultimo_uso')
+    search_fields = ('isbn',)
+
+@admin.register(Portada)
+class PortadaAdmin(admin.ModelAdmin):
+    list_display = ('libro', 'estado', 'intentos', 'proximo_intento', 'huella', 'actualizado')
+    list_select_related = ('libro',)
+    list_filter = ('estado',)
+    search_fields = ('libro__titulo',)
+    raw_id_fields = ('libro',)
+    readonly_fields = ('huella', 'ancho', 'alto', 'ultimo_error', 'actualizado')
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ('libro', 'cantidad', 'tipo', 'usuario', 'fecha')
+    list_select_related = ('libro', 'usuario')
+    list_filter = ('tipo',)
+    search_fields = ('libro__titulo',)
+    raw_id_fields = ('libro', 'prestamo', 'usuario')
+
+    # El registro es de solo lectura: se escribe únicamente desde gestion.stock
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.unregister(User)
 admin.site.register(User, UsuarioAdmin)
-admin.site.register(Autor)
+admin.site.register(Autor, AutorAdmin)
 admin.site.register(Libro, LibroAdmin)
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+API REST de solo lectura (v1) para kioscos y clientes móviles.
+
+Paginación por cursor (PaginacionCursor), filtros con django-filter, ?fields=
+para pedir solo algunas columnas y respuestas condicionales: el ETag y el
+Last-Modified salen de las marcas de gestion.cambios, así un sondeo repetido
+recibe 304 sin consultar los modelos.
+"""
+import hashlib
+from datetime import datetime, timezone as tz
+
+from django.db.models import Count
+from django.utils import timezone
+from django.views.decorators.http import condition
+from django_filters import rest_framework as filters
+from rest_framework import permissions, routers, viewsets
+
+from .busqueda import buscador
+from .cambios import ultimo_cambio, LIBROS, AUTORES, PRESTAMOS, MULTAS
+from .models import Autor, Libro, Prestamo, Multa
+from .serializers import (
+    AutorSerializer, LibroSerializer, DisponibilidadSerializer, PrestamoSerializer, MultaSerializer,
+)
+
+
+# --- FILTROS ---
+class LibroFiltro(filters.FilterSet):
+    q = filters.CharFilter(method='buscar')
+    titulo = filters.CharFilter(lookup_expr='icontains')
+    publicacion_desde = filters.NumberFilter(field_name='publicacion', lookup_expr='gte')
+    publicacion_hasta = filters.NumberFilter(field_name='publicacion', lookup_expr='lte')
+    disponible = filters.BooleanFilter(method='filtrar_disponible')
+
+    class Meta:
+        model = Libro
+        fields = ('autor', 'estante')
+
+    def buscar(self, queryset, name, value):
+        return queryset.filter(buscador().q_libros(value))
+
+    def filtrar_disponible(self, queryset, name, value):
+        return queryset.filter(copias_disponibles__gt=0) if value else queryset.filter(copias_disponibles=0)
+
+
+class AutorFiltro(filters.FilterSet):
+    nombre = filters.CharFilter(lookup_expr='icontains')
+    apellido = filters.CharFilter(lookup_expr='icontains')
+
+    class Meta:
+        model = Autor
+        fields = ('nacionalidad',)
+
+
+class PrestamoFiltro(filters.FilterSet):
+    vencido = filters.BooleanFilter(method='filtrar_vencido')
+    desde = filters.DateFilter(field_name='fecha_prestamo', lookup_expr='gte')
+    hasta = filters.DateFilter(field_name='fecha_prestamo', lookup_expr='lte')
+
+    class Meta:
+        model = Prestamo
+        fields = ('devuelto', 'libro', 'lector')
+
+    def filtrar_vencido(self, queryset, name, value):
+        vencidos = queryset.filter(devuelto=False, fecha_devolucion_esperada__lt=timezone.now().date())
+        return vencidos if value else queryset.exclude(pk__in=vencidos.values('pk'))
+
+
+class MultaFiltro(filters.FilterSet):
+    lector = filters.NumberFilter(field_name='prestamo__lector')
+    monto_min = filters.NumberFilter(field_name='monto', lookup_expr='gte')
+    monto_max = filters.NumberFilter(field_name='monto', lookup_expr='lte')
+
+    class Meta:
+        model = Multa
+        fields = ('pagada', 'prestamo')
+
+
+# --- RESPUESTAS CONDICIONALES (ETag / Last-Modified) ---
+class CondicionalMixin:
+    """ list y retrieve contestan 304 si los recursos no cambiaron desde la copia del cliente. """
+    recursos = ()
+
+    def marca(self):
+        if not hasattr(self, '_marca'):
+            self._marca = ultimo_cambio(*self.recursos)
+        return self._marca
+
+    def etag(self, request, *args, **kwargs):
+        # Misma URL, formato y usuario (la API navegable muestra su nombre)
+        clave = f"{self.marca()}|{request.get_full_path()}|{request.accepted_renderer.format}|{request.user.pk}"
+        return hashlib.md5(clave.encode()).hexdigest()
+
+    def ultima_modificacion(self, request, *args, **kwargs):
+        return datetime.fromtimestamp(self.marca(), tz=tz.utc)
+
+    def list(self, request, *args, **kwargs):
+        return condition(self.etag, self.ultima_modificacion)(super().list)(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return condition(self.etag, self.ultima_modificacion)(super().retrieve)(request, *args, **kwargs)
+
+
+# --- VISTAS ---
+class LibroViewSet(CondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Libro.objects.select_related('autor')
+    serializer_class = LibroSerializer
+    filterset_class = LibroFiltro
+    permission_classes = (permissions.AllowAny,)
+    ordering = ('titulo', 'id')
+    recursos = (LIBROS,)
+
+
+class DisponibilidadViewSet(CondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Libro.objects.only('id', 'titulo', 'copias_disponibles')
+    serializer_class = DisponibilidadSerializer
+    filterset_class = LibroFiltro
+    permission_classes = (permissions.AllowAny,)
+    ordering = ('id',)
+    recursos = (LIBROS,)
+
+
+class AutorViewSet(CondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Autor.objects.annotate(num_libros=Count('libro'))
+    serializer_class = AutorSerializer
+    filterset_class = AutorFiltro
+    permission_classes = (permissions.AllowAny,)
+    ordering = ('apellido', 'id')
+    recursos = (AUTORES,)
+
+
+class PrestamoViewSet(CondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Prestamo.objects.select_related('libro', 'lector__user')
+    serializer_class = PrestamoSerializer
+    filterset_class = PrestamoFiltro
+    permission_classes = (permissions.IsAdminUser,)
+    ordering = ('-fecha_prestamo', '-id')
+    recursos = (PRESTAMOS,)
+
+
+class MultaViewSet(CondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Multa.objects.select_related('prestamo__libro', 'prestamo__lector__user')
+    serializer_class = MultaSerializer
+    filterset_class = MultaFiltro
+    permission_classes = (permissions.IsAdminUser,)
+    ordering = ('-id',)
+    recursos = (MULTAS,)
+
+
+router = routers.DefaultRouter()
+router.register('libros', LibroViewSet, basename='libro')
+router.register('disponibilidad', DisponibilidadViewSet, basename='disponibilidad')
+router.register('autores', AutorViewSet, basename='autor')
+router.register('prestamos', PrestamoViewSet, basename='prestamo')
+router.register('multas', MultaViewSet, basename='multa')
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class GestionConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'gestion'
+
+    def ready(self):
+        # Conecta las señales que mantienen al día los datos precalculados
+        from . import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from .basedatos import ajustar_sqlite
+        connection_created.connect(ajustar_sqlite, dispatch_uid='gestion.ajustar_sqlite')
@@ -0,0 +1,109 @@
+"""
+Apoyo para las vistas asíncronas (servidas con uvicorn o daphne, ver misitio/asgi.py).
+
+- El ORM se usa con su API asíncrona (aget, acount...) o con sync_to_async,
+  que en modo thread_sensitive ejecuta todo en un solo hilo por petición.
+- El código bloqueante que no toca la base de datos (XML-RPC de Odoo) va a un
+  grupo de hilos acotado, para que un servicio lento no acapare hilos sin límite.
+- Las llamadas externas llevan un plazo total con asyncio.wait_for y, cuando
+  son independientes, se hacen a la vez con asyncio.gather.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .odoo import ClienteOdoo, estado_cola
+from .openlibrary import TIMEOUT as TIMEOUT_OPENLIBRARY, cliente_async
+
+HILOS_BLOQUEANTES = 8
+# Tamaño máximo de una portada que se acepta del servidor de origen
+MAX_BYTES_PORTADA = 5 * 1024 * 1024
+
+_hilos = None
+
+
+def hilos():
+    global _hilos
+    if _hilos is None:
+        _hilos = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASYNC_HILOS', HILOS_BLOQUEANTES), thread_name_prefix='bloqueante'
+        )
+    return _hilos
+
+
+def en_hilo(funcion):
+    """ Versión awaitable de una función bloqueante sin ORM, ejecutada en el grupo acotado. """
+    return sync_to_async(funcion, thread_sensitive=False, executor=hilos())
+
+
+class PortadaNoDisponible(Exception):
+    def __init__(self, mensaje, estado=502):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+async def descargar_portada(url):
+    """ (contenido, content-type) de la imagen en 'url'; PortadaNoDisponible si falla o tarda demasiado. """
+    try:
+        async with cliente_async() as cliente:
+            respuesta = await asyncio.wait_for(cliente.get(url), TIMEOUT_OPENLIBRARY)
+    except TimeoutError:
+        raise PortadaNoDisponible("El servidor de portadas no respondió a tiempo", estado=504)
+    except httpx.HTTPError as e:
+        raise PortadaNoDisponible(str(e))
+    tipo = respuesta.headers.get('content-type', '')
+    if respuesta.status_code != 200 or not tipo.startswith('image/'):
+        raise PortadaNoDisponible(f"Respuesta {respuesta.status_code} ({tipo or 'sin tipo'})", estado=404)
+    if len(respuesta.content) > MAX_BYTES_PORTADA:
+        raise PortadaNoDisponible("La portada es demasiado grande")
+    return respuesta.content, tipo
+
+
+# --- ESTADO DE LOS SERVICIOS EXTERNOS ---
+async def _medir(nombre, corrutina, plazo):
+    inicio = time.perf_counter()
+    try:
+        detalle = await asyncio.wait_for(corrutina, plazo)
+        estado = 'ok'
+    except TimeoutError:
+        detalle, estado = f"sin respuesta en {plazo} s", 'lento'
+    except Exception as e:
+        detalle, estado = str(e), 'error'
+    return nombre, {'estado': estado, 'detalle': detalle, 'ms': round((time.perf_counter() - inicio) * 1000, 1)}
+
+
+async def _ping_openlibrary():
+    async with cliente_async() as cliente:
+        respuesta = await cliente.get(f"{settings.OPENLIBRARY_URL}/api/books", params={'bibkeys': '', 'format': 'json'})
+    respuesta.raise_for_status()
+    return f"HTTP {respuesta.status_code}"
+
+
+def _version_odoo():
+    return ClienteOdoo().common.version().get('server_version', '?')
+
+
+def _resumen_cola():
+    conteos, fallas = estado_cola()
+    return {
+        'conteos': conteos,
+        'fallas': [
+            {'isbn': falla.isbn, 'titulo': falla.titulo, 'intentos': falla.intentos, 'error': falla.ultimo_error}
+            for falla in fallas
+        ],
+    }
+
+
+async def estado_externo():
+    """ Odoo, Open Library y la cola de envíos, consultados en paralelo. """
+    plazo_odoo = settings.ODOO['TIMEOUT']
+    cola, *servicios = await asyncio.gather(
+        sync_to_async(_resumen_cola)(),
+        _medir('odoo', en_hilo(_version_odoo)(), plazo_odoo),
+        _medir('openlibrary', _ping_openlibrary(), TIMEOUT_OPENLIBRARY),
+    )
+    return {'cola_odoo': cola, 'servicios': dict(servicios)}
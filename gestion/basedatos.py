@@ -0,0 +1,92 @@
+"""
+Perfil de base de datos (ver la sección BASE DE DATOS de misitio/settings.py).
+
+- ajustar_sqlite: aplica settings.SQLITE_PRAGMAS (WAL, busy_timeout...) a cada
+  conexión SQLite nueva; se conecta a 'connection_created' en GestionConfig.ready.
+- RouterReplica: las vistas marcadas con @desde_replica leen de la base
+  'replica' si está configurada. Solo para reportes que toleran unos segundos
+  de retraso: lo que se acaba de escribir puede no estar todavía en la réplica.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+REPLICA = 'replica'
+
+_en_reportes = ContextVar('en_reportes', default=False)
+
+
+def ajustar_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if connection.is_in_memory_db():
+        # La base en memoria de las pruebas no admite WAL ni mmap
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('mmap_size', None)
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas.items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+def pragmas_actuales(connection):
+    """ Valores vigentes de los PRAGMA configurados, para mostrarlos en los benchmarks. """
+    if connection.vendor != 'sqlite':
+        return {}
+    with connection.cursor() as cursor:
+        valores = {}
+        for nombre in ('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size'):
+            cursor.execute(f'PRAGMA {nombre}')
+            fila = cursor.fetchone()  # mmap_size no devuelve nada en las bases en memoria
+            valores[nombre] = fila[0] if fila else None
+    return valores
+
+
+def hay_replica():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def leyendo_de_replica():
+    marca = _en_reportes.set(True)
+    try:
+        yield
+    finally:
+        _en_reportes.reset(marca)
+
+
+def desde_replica(vista):
+    """ Las lecturas de la vista (síncrona o asíncrona) van a la réplica, si existe. """
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            with leyendo_de_replica():
+                return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with leyendo_de_replica():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        if _en_reportes.get() and hay_replica():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica tiene los mismos datos que 'default'
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema por la replicación, no por migrate
+        return db != REPLICA
@@ -0,0 +1,262 @@
+"""
+Búsqueda de texto completo para el catálogo y los préstamos.
+
+Cada motor de base de datos tiene su propio buscador:
+  - SQLite: tablas virtuales FTS5 (sin tildes, por prefijo y ordenadas por bm25),
+    sincronizadas con Libro/Autor/Lector mediante señales.
+  - PostgreSQL: las mismas tablas auxiliares, con un tsvector ponderado por
+    fila y un índice GIN; la configuración 'gestion_es' es 'spanish' más
+    'unaccent' (migración 0018). Se ordena por ts_rank.
+  - Cualquier otro: el filtro icontains de siempre.
+"""
+import re
+
+from django.db import connection, OperationalError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABLA_LIBROS = 'gestion_libro_fts'
+TABLA_LECTORES = 'gestion_lector_fts'
+TOKENIZADOR = 'unicode61 remove_diacritics 2'
+
+SQL_CREAR = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_LIBROS} USING fts5(titulo, autor, estante, tokenize='{TOKENIZADOR}')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_LECTORES} USING fts5(identificacion, usuario, tokenize='{TOKENIZADOR}')",
+]
+# Documento ponderado: título, luego autor, luego estante
+DOCUMENTO_LIBRO = (
+    "setweight(to_tsvector('gestion_es', {titulo}), 'A') || "
+    "setweight(to_tsvector('gestion_es', {autor}), 'B') || "
+    "setweight(to_tsvector('gestion_es', {estante}), 'C')"
+)
+DOCUMENTO_LECTOR = "to_tsvector('gestion_es', {identificacion} || ' ' || {usuario})"
+
+
+def palabras(texto):
+    return re.findall(r'\w+', texto or '')
+
+
+# --- BUSCADOR BÁSICO (icontains) ---
+class BuscadorSimple:
+    def q_libros(self, texto, prefijo=''):
+        condicion = Q()
+        for palabra in palabras(texto):
+            condicion &= (
+                Q(**{f'{prefijo}titulo__icontains': palabra}) |
+                Q(**{f'{prefijo}autor__nombre__icontains': palabra}) |
+                Q(**{f'{prefijo}autor__apellido__icontains': palabra}) |
+                Q(**{f'{prefijo}estante__icontains': palabra})
+            )
+        return condicion if condicion else Q(pk__in=[])
+
+    def q_lectores(self, texto, prefijo=''):
+        condicion = Q()
+        for palabra in palabras(texto):
+            condicion &= (
+                Q(**{f'{prefijo}identificacion__icontains': palabra}) |
+                Q(**{f'{prefijo}user__username__icontains': palabra})
+            )
+        return condicion if condicion else Q(pk__in=[])
+
+    def ordenar_libros(self, libros, texto):
+        return libros
+
+    def indexar_libros(self, libros):
+        pass
+
+    def borrar_libro(self, libro_id):
+        pass
+
+    def indexar_lectores(self, lectores):
+        pass
+
+    def borrar_lector(self, lector_id):
+        pass
+
+    def reindexar(self):
+        pass
+
+
+# --- BUSCADOR SQLITE (FTS5) ---
+class BuscadorSQLite(BuscadorSimple):
+    def consulta(self, texto):
+        # Cada palabra entre comillas y con '*' para buscar por prefijo
+        return ' '.join(f'"{palabra}"*' for palabra in palabras(texto))
+
+    def q_libros(self, texto, prefijo=''):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return Q(pk__in=[])
+        ids = RawSQL(f"SELECT rowid FROM {TABLA_LIBROS} WHERE {TABLA_LIBROS} MATCH %s", [consulta])
+        return Q(**{f'{prefijo}id__in': ids})
+
+    def q_lectores(self, texto, prefijo=''):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return Q(pk__in=[])
+        ids = RawSQL(f"SELECT rowid FROM {TABLA_LECTORES} WHERE {TABLA_LECTORES} MATCH %s", [consulta])
+        return Q(**{f'{prefijo}pk__in': ids})
+
+    def ordenar_libros(self, libros, texto):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return libros
+        # En FTS5 'rank' es bm25: los valores más bajos son los más relevantes
+        relevancia = RawSQL(
+            f"SELECT rank FROM {TABLA_LIBROS} WHERE {TABLA_LIBROS} MATCH %s AND rowid = gestion_libro.id",
+            [consulta],
+        )
+        return libros.annotate(relevancia=relevancia).order_by('relevancia', 'titulo')
+
+    def indexar_libros(self, libros):
+        filas = [
+            (libro.pk, libro.titulo, libro.autor.nombre_completo, libro.estante or '')
+            for libro in libros
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLA_LIBROS} WHERE rowid = %s", [(fila[0],) for fila in filas])
+            cursor.executemany(
+                f"INSERT INTO {TABLA_LIBROS} (rowid, titulo, autor, estante) VALUES (%s, %s, %s, %s)", filas
+            )
+
+    def borrar_libro(self, libro_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_LIBROS} WHERE rowid = %s", [libro_id])
+
+    def indexar_lectores(self, lectores):
+        filas = [(lector.pk, lector.identificacion, lector.user.username) for lector in lectores]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLA_LECTORES} WHERE rowid = %s", [(fila[0],) for fila in filas])
+            cursor.executemany(
+                f"INSERT INTO {TABLA_LECTORES} (rowid, identificacion, usuario) VALUES (%s, %s, %s)", filas
+            )
+
+    def borrar_lector(self, lector_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_LECTORES} WHERE rowid = %s", [lector_id])
+
+    def reindexar(self):
+        with connection.cursor() as cursor:
+            for sql in SQL_CREAR:
+                cursor.execute(sql)
+            cursor.execute(f"DELETE FROM {TABLA_LIBROS}")
+            cursor.execute(f"DELETE FROM {TABLA_LECTORES}")
+            cursor.execute(
+                f"INSERT INTO {TABLA_LIBROS} (rowid, titulo, autor, estante) "
+                "SELECT l.id, l.titulo, a.nombre || ' ' || a.apellido, COALESCE(l.estante, '') "
+                "FROM gestion_libro l JOIN gestion_autor a ON a.id = l.autor_id"
+            )
+            cursor.execute(
+                f"INSERT INTO {TABLA_LECTORES} (rowid, identificacion, usuario) "
+                "SELECT l.user_id, l.identificacion, u.username "
+                "FROM gestion_lector l JOIN auth_user u ON u.id = l.user_id"
+            )
+
+
+# --- BUSCADOR POSTGRESQL (tsvector) ---
+class BuscadorPostgres(BuscadorSQLite):
+    """ Mismas tablas auxiliares que SQLite (las crea la migración 0018): 'documento' es un tsvector con índice GIN. """
+
+    def consulta(self, texto):
+        return ' & '.join(f'{palabra}:*' for palabra in palabras(texto))
+
+    def q_libros(self, texto, prefijo=''):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return Q(pk__in=[])
+        ids = RawSQL(f"SELECT rowid FROM {TABLA_LIBROS} WHERE documento @@ to_tsquery('gestion_es', %s)", [consulta])
+        return Q(**{f'{prefijo}id__in': ids})
+
+    def q_lectores(self, texto, prefijo=''):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return Q(pk__in=[])
+        ids = RawSQL(f"SELECT rowid FROM {TABLA_LECTORES} WHERE documento @@ to_tsquery('gestion_es', %s)", [consulta])
+        return Q(**{f'{prefijo}pk__in': ids})
+
+    def ordenar_libros(self, libros, texto):
+        consulta = self.consulta(texto)
+        if not consulta:
+            return libros
+        relevancia = RawSQL(
+            f"SELECT ts_rank(documento, to_tsquery('gestion_es', %s)) FROM {TABLA_LIBROS} WHERE rowid = gestion_libro.id",
+            [consulta],
+        )
+        return libros.annotate(relevancia=relevancia).order_by('-relevancia', 'titulo')
+
+    def indexar_libros(self, libros):
+        filas = [
+            (libro.pk, libro.titulo, libro.autor.nombre_completo, libro.estante or '')
+            for libro in libros
+        ]
+        documento = DOCUMENTO_LIBRO.format(titulo='%s', autor='%s', estante='%s')
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLA_LIBROS} (rowid, documento) VALUES (%s, {documento}) "
+                "ON CONFLICT (rowid) DO UPDATE SET documento = EXCLUDED.documento",
+                filas,
+            )
+
+    def indexar_lectores(self, lectores):
+        filas = [(lector.pk, lector.identificacion, lector.user.username) for lector in lectores]
+        documento = DOCUMENTO_LECTOR.format(identificacion='%s', usuario='%s')
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLA_LECTORES} (rowid, documento) VALUES (%s, {documento}) "
+                "ON CONFLICT (rowid) DO UPDATE SET documento = EXCLUDED.documento",
+                filas,
+            )
+
+    def reindexar(self):
+        documento_libro = DOCUMENTO_LIBRO.format(
+            titulo='l.titulo', autor="a.nombre || ' ' || a.apellido", estante="COALESCE(l.estante, '')"
+        )
+        documento_lector = DOCUMENTO_LECTOR.format(identificacion='l.identificacion', usuario='u.username')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_LIBROS}")
+            cursor.execute(f"DELETE FROM {TABLA_LECTORES}")
+            cursor.execute(
+                f"INSERT INTO {TABLA_LIBROS} (rowid, documento) SELECT l.id, {documento_libro} "
+                "FROM gestion_libro l JOIN gestion_autor a ON a.id = l.autor_id"
+            )
+            cursor.execute(
+                f"INSERT INTO {TABLA_LECTORES} (rowid, documento) SELECT l.user_id, {documento_lector} "
+                "FROM gestion_lector l JOIN auth_user u ON u.id = l.user_id"
+            )
+
+
+_tablas = None
+
+# Cómo saber si las tablas auxiliares existen en cada motor
+SQL_EXISTE = {
+    'sqlite': "SELECT 1 FROM sqlite_master WHERE name = %s",
+    'postgresql': "SELECT 1 FROM pg_class WHERE relname = %s",
+}
+BUSCADORES = {'sqlite': BuscadorSQLite, 'postgresql': BuscadorPostgres}
+
+
+def buscador():
+    """ Devuelve el buscador adecuado para la base de datos configurada. """
+    global _tablas
+    if connection.vendor in BUSCADORES:
+        if _tablas is None:
+            with connection.cursor() as cursor:
+                cursor.execute(SQL_EXISTE[connection.vendor], [TABLA_LIBROS])
+                _tablas = cursor.fetchone() is not None
+        if _tablas:
+            return BUSCADORES[connection.vendor]()
+    return BuscadorSimple()
+
+
+def crear_indices():
+    """ Crea (si hace falta) y llena las tablas FTS5. """
+    global _tablas
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        BuscadorSQLite().reindexar()
+        _tablas = True
+    except OperationalError:
+        # SQLite compilado sin FTS5: se seguirá usando icontains
+        _tablas = False
+
@@ -0,0 +1,137 @@
+"""
+Caché de las páginas públicas del catálogo.
+
+- Backends de caché que cuentan aciertos y fallos por espacio de claves (el
+  prefijo 'gestion:xxx' o el nombre del fragmento de plantilla), para ver en
+  el monitoreo qué tan bien está funcionando cada caché.
+- 'cachear_para_anonimos' guarda la página completa para visitantes sin sesión.
+
+La invalidación es por versión: la clave de cada página o fragmento lleva la
+marca de gestion.cambios, que las señales de Libro y Autor actualizan. Nada se
+borra: las entradas viejas quedan huérfanas y expiran solas.
+"""
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.http import HttpResponse
+
+from .cambios import ultimo_cambio
+
+DURACION_PAGINAS = 60 * 60
+
+_FALTA = object()
+_aciertos = Counter()
+_fallos = Counter()
+_candado = threading.Lock()
+_local = threading.local()
+
+
+def espacio(clave):
+    """ 'gestion:pagina:...' -> 'gestion:pagina'; 'template.cache.navbar.<md5>' -> 'fragmento:navbar'. """
+    if clave.startswith('template.cache.'):
+        return 'fragmento:' + clave.split('.')[2]
+    return ':'.join(clave.split(':')[:2])
+
+
+def _contar(claves, encontradas):
+    with _candado:
+        for clave in claves:
+            (_aciertos if clave in encontradas else _fallos)[espacio(clave)] += 1
+
+
+class EstadisticasMixin:
+    """ Cuenta en get y get_many. Los contadores son del proceso, como las métricas de monitoreo. """
+    def get(self, key, default=None, version=None):
+        valor = super().get(key, _FALTA, version)
+        if not getattr(_local, 'en_get_many', False):
+            _contar([key], [key] if valor is not _FALTA else [])
+        return default if valor is _FALTA else valor
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # El get_many de BaseCache llama a get() por cada clave: no se cuentan dos veces
+        _local.en_get_many = True
+        try:
+            valores = super().get_many(keys, version)
+        finally:
+            _local.en_get_many = False
+        _contar(keys, valores)
+        return valores
+
+
+class LocMemConEstadisticas(EstadisticasMixin, LocMemCache):
+    pass
+
+
+class ArchivoConEstadisticas(EstadisticasMixin, FileBasedCache):
+    pass
+
+
+class RedisConEstadisticas(EstadisticasMixin, RedisCache):
+    pass
+
+
+def _ratio(aciertos, fallos):
+    total = aciertos + fallos
+    return round(aciertos / total, 3) if total else None
+
+
+def estadisticas():
+    """ Aciertos, fallos y ratio de aciertos en total y por espacio de claves. """
+    with _candado:
+        aciertos, fallos = Counter(_aciertos), Counter(_fallos)
+    espacios = {
+        nombre: {'aciertos': aciertos[nombre], 'fallos': fallos[nombre], 'ratio': _ratio(aciertos[nombre], fallos[nombre])}
+        for nombre in sorted(aciertos.keys() | fallos.keys())
+    }
+    total_aciertos, total_fallos = sum(aciertos.values()), sum(fallos.values())
+    return {
+        'backend': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        'aciertos': total_aciertos,
+        'fallos': total_fallos,
+        'ratio': _ratio(total_aciertos, total_fallos),
+        'espacios': espacios,
+    }
+
+
+def reiniciar_estadisticas():
+    with _candado:
+        _aciertos.clear()
+        _fallos.clear()
+
+
+def cachear_para_anonimos(*recursos):
+    """
+    Guarda la respuesta completa de las peticiones GET sin sesión. Los usuarios
+    identificados ven su propio menú, así que para ellos solo se cachean fragmentos.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated or len(get_messages(request)):
+                return vista(request, *args, **kwargs)
+            ruta = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            clave = f'gestion:pagina:{vista.__name__}:{ultimo_cambio(*recursos)}:{ruta}'
+            guardada = cache.get(clave)
+            if guardada is not None:
+                contenido, tipo = guardada
+                return HttpResponse(contenido, content_type=tipo)
+            respuesta = vista(request, *args, **kwargs)
+            # No se guardan exportaciones (streaming), errores ni páginas con token CSRF o cookies propias
+            if (
+                respuesta.status_code == 200 and not respuesta.streaming and not respuesta.cookies
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            ):
+                duracion = getattr(settings, 'CACHE_CATALOGO_SEGUNDOS', DURACION_PAGINAS)
+                cache.set(clave, (respuesta.content, respuesta['Content-Type']), duracion)
+            return respuesta
+        return envoltura
+    return decorador
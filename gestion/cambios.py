@@ -0,0 +1,39 @@
+"""
+Marca de "último cambio" por recurso, guardada en la caché.
+
+Permite contestar 304 (ETag/Last-Modified) sin consultar los modelos. Las
+señales la actualizan en cada guardado; las operaciones en bloque, que no
+disparan señales, llaman a marcar_cambio() ellas mismas. Con varios procesos
+la caché debe ser compartida, si no cada proceso tendría su propia marca.
+"""
+import time
+
+from django.core.cache import cache
+
+LIBROS = 'libros'
+AUTORES = 'autores'
+PRESTAMOS = 'prestamos'
+MULTAS = 'multas'
+RECURSOS = (LIBROS, AUTORES, PRESTAMOS, MULTAS)
+
+
+def _clave(recurso):
+    return f'gestion:cambio:{recurso}'
+
+
+def marcar_cambio(*recursos):
+    ahora = time.time()
+    cache.set_many({_clave(recurso): ahora for recurso in recursos or RECURSOS}, None)
+
+
+def ultimo_cambio(*recursos):
+    """ Marca más reciente (segundos desde epoch) entre los recursos; una sola lectura de caché. """
+    claves = [_clave(recurso) for recurso in recursos]
+    marcas = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in marcas]
+    if faltantes:
+        # Sin marca (caché vacía o reiniciada): se asume que todo cambió ahora
+        ahora = time.time()
+        cache.set_many({clave: ahora for clave in faltantes}, None)
+        marcas.update(dict.fromkeys(faltantes, ahora))
+    return max(marcas.values())
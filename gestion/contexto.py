@@ -0,0 +1,19 @@
+"""
+Variables para los fragmentos {% cache %} de las plantillas.
+
+Son perezosas: la marca de cambios solo se lee de la caché si la plantilla la usa.
+"""
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cache import DURACION_PAGINAS
+from .cambios import ultimo_cambio, LIBROS, AUTORES
+
+
+def cache_catalogo(request):
+    return {
+        'duracion_cache': getattr(settings, 'CACHE_CATALOGO_SEGUNDOS', DURACION_PAGINAS),
+        # Guardar un libro también marca AUTORES (y al revés): el listado de autores cuenta libros
+        'version_catalogo': SimpleLazyObject(lambda: ultimo_cambio(LIBROS, AUTORES)),
+        'version_autores': SimpleLazyObject(lambda: ultimo_cambio(AUTORES)),
+    }
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.db.models import Sum, Q
+from django.utils import timezone
+
+from .models import Libro, Autor, Lector, Prestamo, Multa, SaldoLector
+
+CLAVE_RESUMEN = 'gestion:resumen_panel'
+# Reconstrucción completa periódica como red de seguridad (segundos)
+DURACION_RESUMEN = 15 * 60
+
+
+def calcular_resumen():
+    """ Calcula todas las cifras del panel bibliotecario desde la base de datos. """
+    ahora = timezone.now()
+    hoy = ahora.date()
+    multas = Multa.objects.aggregate(
+        total_deuda=Sum('monto', filter=Q(pagada=False)),
+        total_recaudado=Sum('monto', filter=Q(pagada=True)),
+    )
+    return {
+        'generado': ahora,
+        'fecha': hoy,
+        'total_libros': Libro.objects.count(),
+        'total_autores': Autor.objects.count(),
+        'total_lectores': Lector.objects.count(),
+        'vencidos_count': Prestamo.objects.filter(devuelto=False, fecha_devolucion_esperada__lt=hoy).count(),
+        'total_multas_valor': multas['total_deuda'] or 0,
+        'total_recaudado': multas['total_recaudado'] or 0,
+        'prestamos_recientes': list(
+            Prestamo.objects.select_related('libro', 'lector__user').order_by('-fecha_prestamo')[:10]
+        ),
+        # Los cinco lectores que más deben, leídos del índice parcial de SaldoLector
+        'morosos_top': list(
+            SaldoLector.objects.filter(deuda__gt=0).select_related('lector__user').order_by('-deuda', 'lector_id')[:5]
+        ),
+    }
+
+
+def obtener_resumen(forzar=False):
+    """
+    Devuelve el resumen del panel con una sola lectura de caché.
+    Se reconstruye si no existe, si cambió el día o si se pide forzar.
+    """
+    resumen = None if forzar else cache.get(CLAVE_RESUMEN)
+    if resumen is None or resumen['fecha'] != timezone.now().date():
+        resumen = calcular_resumen()
+        cache.set(CLAVE_RESUMEN, resumen, DURACION_RESUMEN)
+    return resumen
+
+
+def invalidar_resumen():
+    cache.delete(CLAVE_RESUMEN)
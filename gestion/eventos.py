@@ -0,0 +1,287 @@
+"""
+Cambios en vivo para el personal: panel bibliotecario e inventario de bodega.
+
+Las escrituras publican deltas pequeños al confirmarse su transacción: el stock
+nuevo de los libros tocados, los préstamos que se crean o se devuelven (con
+cuántos vencidos suman o restan) y cuánto cambió la deuda pendiente. Las vistas
+'eventos_*' los envían como server-sent events a cada pestaña abierta, que
+actualiza sus cifras sin recargar la página ni recalcular el resumen.
+
+Como con marcar_cambio, las señales cubren los guardados sueltos y las
+operaciones en bloque (stock.py, saldos.py) avisan a mano.
+
+El corredor es local al proceso (BrokerLocal). Cada suscriptor tiene una cola
+acotada: si un cliente lento la llena se descartan sus eventos y recibe
+'recargar', así nunca frena a quien publica ni acumula memoria. Sin nadie
+escuchando no se consulta nada; los eventos saltados quedan marcados y quien
+se reconecta desde antes de ellos recarga la página. Con varios procesos
+(workers de uvicorn, 'acumular_multas' desde cron) cada uno solo ve sus
+propias escrituras: un corredor compartido (p. ej. Redis pub/sub) con la misma
+interfaz (publicar, suscribir, activo) reemplazaría a BrokerLocal.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from functools import partial
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import Libro, Prestamo
+
+PANEL = 'panel'
+BODEGA = 'bodega'
+RECARGAR = 'recargar'
+
+# Eventos pendientes por suscriptor antes de darlo por lento
+MAX_PENDIENTES = 100
+MAX_SUSCRIPTORES = 500
+# Eventos recientes que se reenvían a quien se reconecta (cabecera Last-Event-ID)
+HISTORIAL = 500
+# Tras abrir la página o cerrarse una conexión se sigue publicando este tiempo
+# para que la pestaña que está conectándose (o reconectándose) no pierda nada
+ESPERA_INTERES = 60
+# Préstamos que viajan con detalle en cada evento; del resto solo la cuenta
+MAX_DETALLE = 20
+STOCK_CRITICO = 2
+
+# Los mismos valores que los estados de gestion.stock
+PRESTADO = 'prestado'
+DEVUELTO = 'devuelto'
+
+Evento = namedtuple('Evento', 'numero canal tipo datos')
+
+
+class Saturado(Exception):
+    """ Ya hay MAX_SUSCRIPTORES conexiones abiertas en este proceso. """
+
+
+class Suscripcion:
+    """ Cola acotada de un cliente; se llena desde cualquier hilo y se lee desde su event loop. """
+
+    def __init__(self, broker, canal, loop, maximo):
+        self.broker = broker
+        self.canal = canal
+        self.loop = loop
+        self.cola = asyncio.Queue(maximo)
+        self.desbordada = False
+        self.cerrada = False
+
+    def entregar(self, evento):
+        try:
+            self.loop.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            # El event loop de la conexión ya terminó
+            self.cerrar()
+
+    def _poner(self, evento):
+        if self.cerrada or self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: se descarta lo pendiente y se le pide recargar la página
+            self.desbordada = True
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(Evento(None, self.canal, RECARGAR, {}))
+            self.broker.desbordes += 1
+
+    async def siguiente(self, espera):
+        """ El próximo evento, o None si no llegó ninguno en 'espera' segundos. """
+        try:
+            return await asyncio.wait_for(self.cola.get(), espera)
+        except TimeoutError:
+            return None
+
+    def cerrar(self):
+        if not self.cerrada:
+            self.cerrada = True
+            self.broker._quitar(self)
+
+
+class BrokerLocal:
+    def __init__(self, maximo=MAX_PENDIENTES, historial=HISTORIAL):
+        self.maximo = maximo
+        # Identifica esta instancia: un Last-Event-ID de otro proceso o de antes de reiniciar obliga a recargar
+        self.sesion = uuid.uuid4().hex[:8]
+        self.desbordes = 0
+        self._candado = threading.Lock()
+        self._numero = 0
+        self._recientes = deque(maxlen=historial)
+        self._ultimos = {}
+        self._suscripciones = {}
+        self._interes = {}
+
+    def _identificador(self, numero):
+        return f'{self.sesion}-{numero}'
+
+    def identificador(self, evento):
+        return self._identificador(evento.numero) if evento.numero is not None else None
+
+    def ultimo(self, canal):
+        """ Identificador del último evento, para que la página recién generada se suscriba desde ahí. """
+        with self._candado:
+            self._interes[canal] = time.monotonic()
+            return self._identificador(self._numero)
+
+    def suscriptores(self, canal=None):
+        with self._candado:
+            if canal is not None:
+                return len(self._suscripciones.get(canal, ()))
+            return sum(len(suscripciones) for suscripciones in self._suscripciones.values())
+
+    def activo(self, canal):
+        """ Si vale la pena preparar eventos del canal: alguien escucha o está por conectarse. """
+        with self._candado:
+            if self._suscripciones.get(canal):
+                return True
+            return time.monotonic() - self._interes.get(canal, float('-inf')) < ESPERA_INTERES
+
+    def publicar(self, canal, tipo, datos):
+        with self._candado:
+            self._numero += 1
+            evento = self._ultimos[canal] = Evento(self._numero, canal, tipo, datos)
+            self._recientes.append(evento)
+            suscripciones = list(self._suscripciones.get(canal, ()))
+        for suscripcion in suscripciones:
+            suscripcion.entregar(evento)
+        return evento
+
+    def omitir(self, canal):
+        """ Deja constancia de un evento que no se preparó porque nadie escuchaba. """
+        with self._candado:
+            # Una marca basta hasta el próximo evento publicado del canal
+            ultimo = self._ultimos.get(canal)
+            if ultimo is None or ultimo.tipo != RECARGAR:
+                self._numero += 1
+                self._ultimos[canal] = Evento(self._numero, canal, RECARGAR, {})
+                self._recientes.append(self._ultimos[canal])
+
+    def _pendientes_desde(self, canal, desde):
+        """ Eventos del canal posteriores a 'desde' (Last-Event-ID); None si ya no se pueden reenviar. """
+        sesion, _, numero = (desde or '').partition('-')
+        if sesion != self.sesion or not numero.isdigit():
+            return None
+        numero = int(numero)
+        primero = self._recientes[0].numero if self._recientes else self._numero + 1
+        if numero < primero - 1:
+            return None
+        return [evento for evento in self._recientes if evento.numero > numero and evento.canal == canal]
+
+    def suscribir(self, canal, desde=None):
+        """ Nueva suscripción en el event loop actual; con 'desde' recibe primero lo que se perdió. """
+        suscripcion = Suscripcion(self, canal, asyncio.get_running_loop(), self.maximo)
+        with self._candado:
+            if sum(len(suscripciones) for suscripciones in self._suscripciones.values()) >= MAX_SUSCRIPTORES:
+                raise Saturado
+            # Con el candado tomado ningún evento puede reenviarse y entregarse a la vez
+            pendientes = self._pendientes_desde(canal, desde) if desde else []
+            self._suscripciones.setdefault(canal, set()).add(suscripcion)
+        if pendientes is None or any(evento.tipo == RECARGAR for evento in pendientes):
+            suscripcion._poner(Evento(None, canal, RECARGAR, {}))
+        else:
+            for evento in pendientes:
+                suscripcion._poner(evento)
+        return suscripcion
+
+    def _quitar(self, suscripcion):
+        with self._candado:
+            self._suscripciones.get(suscripcion.canal, set()).discard(suscripcion)
+            self._interes[suscripcion.canal] = time.monotonic()
+
+
+_broker = None
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        _broker = BrokerLocal()
+    return _broker
+
+
+def formato_sse(evento, identificador=None):
+    lineas = []
+    if identificador:
+        lineas.append(f'id: {identificador}')
+    lineas.append(f'event: {evento.tipo}')
+    lineas.append(f'data: {json.dumps(evento.datos, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+# --- PUBLICACIÓN DESDE LAS ESCRITURAS ---
+def _al_confirmar(canal, preparar):
+    """ Prepara y publica el evento cuando se confirme la transacción, si alguien lo va a recibir. """
+    def publicar():
+        if not broker().activo(canal):
+            broker().omitir(canal)
+            return
+        try:
+            evento = preparar()
+        except DatabaseError:
+            # Queda marcado como cualquier evento saltado
+            broker().omitir(canal)
+            raise
+        if evento is not None:
+            broker().publicar(canal, *evento)
+    # La escritura ya se confirmó: un error al preparar el evento solo se registra en el log
+    transaction.on_commit(publicar, robust=True)
+
+
+def _evento_stock(libro_ids):
+    libros = [
+        {'id': libro_id, 'titulo': titulo, 'copias': copias}
+        for libro_id, titulo, copias in Libro.objects.filter(pk__in=libro_ids).values_list(
+            'id', 'titulo', 'copias_disponibles'
+        )
+    ]
+    if not libros:
+        return None
+    # Rango del índice 'libro_copias_idx'
+    criticos = Libro.objects.filter(copias_disponibles__lte=STOCK_CRITICO).count()
+    return 'stock', {'libros': libros, 'criticos': criticos}
+
+
+def avisar_stock(libro_ids):
+    """ Stock nuevo de 'libro_ids' para la bodega. """
+    libro_ids = set(libro_ids)
+    if libro_ids:
+        _al_confirmar(BODEGA, partial(_evento_stock, libro_ids))
+
+
+def _evento_prestamos(prestamo_ids, estado):
+    hoy = timezone.now().date()
+    filas = list(Prestamo.objects.filter(pk__in=prestamo_ids).order_by('-id').values_list(
+        'id', 'libro__titulo', 'lector__identificacion', 'fecha_devolucion_esperada'
+    ))
+    if not filas:
+        return None
+    vencidos = sum(vence < hoy for _, _, _, vence in filas)
+    return 'prestamos', {
+        'estado': estado,
+        'total': len(filas),
+        # Cuánto cambia 'Préstamos vencidos' del panel
+        'vencidos': vencidos if estado == PRESTADO else -vencidos,
+        'detalle': [
+            {'id': prestamo_id, 'libro': titulo, 'lector': lector, 'vence': vence, 'vencido': vence < hoy}
+            for prestamo_id, titulo, lector, vence in filas[:MAX_DETALLE]
+        ],
+    }
+
+
+def avisar_prestamos(prestamo_ids, estado):
+    """ Préstamos creados (o reabiertos) o devueltos, para el panel. """
+    prestamo_ids = list(prestamo_ids)
+    if prestamo_ids:
+        _al_confirmar(PANEL, partial(_evento_prestamos, prestamo_ids, estado))
+
+
+def avisar_deuda(diferencia):
+    """ Cambio de la deuda pendiente total (lo calcula gestion.saldos al actualizar los saldos). """
+    if diferencia:
+        _al_confirmar(PANEL, lambda: ('deuda', {'diferencia': diferencia}))
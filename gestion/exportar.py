@@ -0,0 +1,303 @@
+"""
+Exportaciones en streaming: las filas salen de .values_list().iterator() y se
+envían al cliente a medida que se leen, sin cargar el listado completo en memoria.
+
+CSV, JSON y XLSX se generan por bloques de TAMANO_BLOQUE filas: el primer bloque
+sale en cuanto la base entrega las primeras filas, y la memoria usada no depende
+del total. El XLSX se escribe a mano (un zip con la hoja en XML y celdas de texto
+en línea), sin dependencias ni tabla de cadenas compartidas que crezca con las filas.
+
+REPORTES reúne los listados de las vistas (préstamos, facturación, multas e
+inventario) con sus mismos filtros 'q' y 'estado', para que el comando
+'exportar_reporte' y las vistas entreguen exactamente lo mismo.
+"""
+import csv
+import datetime
+import json
+import re
+import zipfile
+from collections import namedtuple
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .busqueda import buscador
+from .models import Libro, Multa, Prestamo, SaldoLector, estante_orden
+
+FORMATOS = ('csv', 'json', 'xlsx')
+TIPOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+TAMANO_BLOQUE = 2000
+# Filas de una hoja de Excel (el encabezado ocupa una)
+MAX_FILAS_XLSX = 1_048_576
+
+
+class _Eco:
+    """ 'Archivo' que devuelve lo que se le escribe, para usar csv.writer sin buffer. """
+    def write(self, valor):
+        return valor
+
+
+def _bloques(filas):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def filas_csv(filas, encabezados):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(encabezados)
+    for bloque in _bloques(filas):
+        yield ''.join(escritor.writerow(fila) for fila in bloque)
+
+
+def filas_json(filas, encabezados):
+    yield '['
+    separador = ''
+    for bloque in _bloques(filas):
+        partes = []
+        for fila in bloque:
+            partes.append(separador + json.dumps(dict(zip(encabezados, fila)), cls=DjangoJSONEncoder))
+            separador = ','
+        yield ''.join(partes)
+    yield ']'
+
+
+# --- XLSX ---
+class _Tubo:
+    """ Archivo de solo escritura (sin seek) que guarda lo escrito hasta que se retira. """
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_ARCHIVOS_XLSX = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        valor = valor.isoformat()
+    texto = escape(_CARACTERES_INVALIDOS.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xml(fila):
+    return '<row>' + ''.join(_celda(valor) for valor in fila) + '</row>'
+
+
+def filas_xlsx(filas, encabezados, hoja='Datos'):
+    """
+    Libro XLSX de una hoja, por bloques de bytes. Las filas que no caben en una
+    hoja de Excel (MAX_FILAS_XLSX) se descartan: para más, use CSV.
+    """
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _ARCHIVOS_XLSX.items():
+            libro.writestr(nombre, contenido.replace('{hoja}', escape(hoja)))
+        yield tubo.retirar()
+        # Sin seek el zip usa descriptores de datos; zip64 por si la hoja pasa de 4 GB
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as xml:
+            xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            xml.write(_fila_xml(encabezados).encode())
+            restantes = MAX_FILAS_XLSX - 1
+            for bloque in _bloques(filas):
+                bloque = bloque[:restantes]
+                restantes -= len(bloque)
+                xml.write(''.join(_fila_xml(fila) for fila in bloque).encode())
+                yield tubo.retirar()
+                if not restantes:
+                    break
+            xml.write(b'</sheetData></worksheet>')
+    yield tubo.retirar()
+
+
+GENERADORES = {'csv': filas_csv, 'json': filas_json, 'xlsx': filas_xlsx}
+
+
+def contenido_exportacion(queryset, campos, formato, encabezados=None):
+    """ Generador con el archivo exportado por bloques (str en CSV y JSON, bytes en XLSX). """
+    encabezados = encabezados or campos
+    filas = queryset.values_list(*campos).iterator(chunk_size=TAMANO_BLOQUE)
+    return GENERADORES.get(formato, filas_csv)(filas, encabezados)
+
+
+def exportar(queryset, campos, formato, nombre, encabezados=None):
+    """
+    Respuesta en streaming con las columnas 'campos' del queryset.
+    'encabezados' permite dar nombres legibles a las columnas (por defecto, los campos).
+    """
+    formato = formato if formato in GENERADORES else 'csv'
+    # Se fija la base que elige el router ahora (la réplica en las vistas de reportes):
+    # las filas se leen después de que la vista ya terminó
+    queryset = queryset.using(queryset.db)
+    respuesta = StreamingHttpResponse(
+        contenido_exportacion(queryset, campos, formato, encabezados), content_type=TIPOS[formato]
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return respuesta
+
+
+# --- REPORTES (MISMOS FILTROS QUE LAS VISTAS) ---
+def prestamos_filtrados(q=None, estado=None):
+    """ Préstamos de 'lista_prestamos'; estado: 'activos', 'vencidos' o 'devueltos'. """
+    prestamos = Prestamo.objects.all()
+    if q:
+        motor = buscador()
+        prestamos = prestamos.filter(motor.q_libros(q, prefijo='libro__') | motor.q_lectores(q, prefijo='lector__'))
+    if estado == 'activos':
+        prestamos = prestamos.filter(devuelto=False)
+    elif estado == 'vencidos':
+        prestamos = prestamos.filter(devuelto=False, fecha_devolucion_esperada__lt=timezone.now().date())
+    elif estado == 'devueltos':
+        prestamos = prestamos.filter(devuelto=True)
+    return prestamos
+
+
+def saldos_filtrados(q=None, estado=None):
+    """ Lectores con deuda de 'lista_facturas' (no tiene filtro de estado). """
+    saldos = SaldoLector.objects.filter(deuda__gt=0)
+    if q:
+        saldos = saldos.filter(buscador().q_lectores(q, prefijo='lector__'))
+    return saldos
+
+
+def multas_filtradas(q=None, estado=None):
+    """ Multas de 'lista_multas' (las pendientes); estado 'pagadas' o 'todas' para el historial. """
+    multas = Multa.objects.all()
+    if estado == 'pagadas':
+        multas = multas.filter(pagada=True)
+    elif estado != 'todas':
+        multas = multas.filter(pagada=False)
+    if q:
+        multas = multas.filter(buscador().q_lectores(q, prefijo='prestamo__lector__'))
+    return multas
+
+
+def inventario_filtrado(q=None, estado=None):
+    """ Libros de 'inventario_bodega'; estado: 'critico' (0-2 copias) o 'bajo' (3-5). """
+    # Los libros sin estante se ordenan como '' para que el cursor nunca compare con NULL
+    libros = Libro.objects.annotate(estante_orden=estante_orden())
+    if estado == 'critico':
+        libros = libros.filter(copias_disponibles__lte=2)
+    elif estado == 'bajo':
+        libros = libros.filter(copias_disponibles__gt=2, copias_disponibles__lte=5)
+    if q:
+        libros = libros.filter(buscador().q_libros(q))
+    return libros
+
+
+Reporte = namedtuple('Reporte', 'filtrar orden campos encabezados estados')
+
+# Cada orden recorre un índice (la clave primaria, 'saldo_deuda_idx', 'multa_pendiente_idx'):
+# la base entrega las primeras filas sin ordenar antes el listado completo
+
+REPORTES = {
+    'prestamos': Reporte(
+        prestamos_filtrados, ('-id',),
+        ['id', 'libro__titulo', 'lector__identificacion', 'fecha_prestamo', 'fecha_devolucion_esperada', 'devuelto'],
+        None, ('activos', 'vencidos', 'devueltos'),
+    ),
+    'facturas': Reporte(
+        saldos_filtrados, ('-deuda', 'lector_id'),
+        ['lector__identificacion', 'lector__user__username', 'lector__user__email', 'multas_pendientes', 'deuda'],
+        ['identificacion', 'usuario', 'email', 'multas_pendientes', 'deuda'], (),
+    ),
+    'multas': Reporte(
+        multas_filtradas, ('id',),
+        ['id', 'prestamo__lector__user__username', 'prestamo__libro__titulo', 'monto', 'fecha_generacion'],
+        None, ('pagadas', 'todas'),
+    ),
+    'inventario': Reporte(
+        inventario_filtrado, ('estante_orden', 'titulo', 'id'),
+        ['id', 'titulo', 'autor__nombre', 'autor__apellido', 'estante', 'copias_disponibles'],
+        None, ('critico', 'bajo'),
+    ),
+}
+
+
+def consulta_reporte(nombre, q=None, estado=None):
+    reporte = REPORTES[nombre]
+    return reporte.filtrar(q, estado).order_by(*reporte.orden)
+
+
+def exportar_reporte(nombre, formato, q=None, estado=None):
+    """ Respuesta en streaming del reporte 'nombre' con los filtros de su vista. """
+    reporte = REPORTES[nombre]
+    return exportar(consulta_reporte(nombre, q, estado), reporte.campos, formato, nombre, reporte.encabezados)
+
+
+def escribir_reporte(nombre, formato, archivo, q=None, estado=None):
+    """ Escribe el reporte en 'archivo' (binario) por bloques; devuelve los bytes escritos. """
+    reporte = REPORTES[nombre]
+    escritos = 0
+    for bloque in contenido_exportacion(consulta_reporte(nombre, q, estado), reporte.campos, formato, reporte.encabezados):
+        if isinstance(bloque, str):
+            bloque = bloque.encode()
+        archivo.write(bloque)
+        escritos += len(bloque)
+    return escritos
@@ -0,0 +1,109 @@
+"""
+Alta y actualización de libros en bloque (importación por ISBN).
+Autores y libros se emparejan con los existentes en una sola consulta cada uno
+y se escriben con bulk_create/bulk_update dentro de una transacción. Como en
+stock.py, el stock de los existentes se bloquea y se cambia con F().
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import Autor, Libro, MovimientoStock
+from .openlibrary import separar_nombre
+from .busqueda import buscador
+from .estadisticas import invalidar_resumen
+from .cambios import marcar_cambio, LIBROS, AUTORES
+from .odoo import encolar_libros
+from .portadas import encolar_portadas
+from .stock import apartar_copias
+from .eventos import avisar_stock
+
+COPIAS_INICIALES = 5
+# El stock no: se cambia aparte, sumando la diferencia con F()
+CAMPOS_ACTUALIZABLES = ['autor', 'publicacion', 'paginas', 'portada_url']
+TAMANO_LOTE = 500
+
+CREADO = 'creado'
+ACTUALIZADO = 'actualizado'
+
+
+def obtener_autores(nombres):
+    """ Devuelve {(nombre, apellido): Autor}, creando en bloque los que falten. """
+    claves = {separar_nombre(nombre) for nombre in nombres}
+    autores = {}
+    for autor in Autor.objects.filter(nombre__in={nombre for nombre, _ in claves}):
+        clave = (autor.nombre, autor.apellido)
+        if clave in claves:
+            autores.setdefault(clave, autor)
+    nuevos = [Autor(nombre=nombre, apellido=apellido) for nombre, apellido in claves if (nombre, apellido) not in autores]
+    for autor in Autor.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE):
+        autores[(autor.nombre, autor.apellido)] = autor
+    return autores
+
+
+def importar_libros(lista_datos, copias=COPIAS_INICIALES):
+    """
+    Guarda los libros descritos por 'lista_datos' (ver openlibrary.datos_libro).
+    Igual que la importación individual, un libro con el mismo título se actualiza.
+    Devuelve {isbn: CREADO | ACTUALIZADO}.
+    """
+    if not lista_datos:
+        return {}
+
+    with transaction.atomic():
+        autores = obtener_autores(datos['autor_principal'] for datos in lista_datos)
+        existentes = {}
+        # Bloqueados hasta el final: un préstamo o devolución simultáneo espera y no se pierde
+        for libro in Libro.objects.select_for_update().filter(titulo__in={datos['titulo'] for datos in lista_datos}):
+            existentes.setdefault(libro.titulo, libro)
+
+        por_titulo, resultado, stock_anterior = {}, {}, {}
+        for datos in lista_datos:
+            libro = existentes.get(datos['titulo']) or por_titulo.get(datos['titulo']) or Libro(titulo=datos['titulo'])
+            if libro.pk:
+                stock_anterior.setdefault(libro.pk, libro.copias_disponibles)
+            else:
+                libro.copias_disponibles = copias
+            libro.autor = autores[separar_nombre(datos['autor_principal'])]
+            libro.publicacion = datos['anio']
+            libro.paginas = datos['paginas']
+            libro.portada_url = datos['portada']
+            por_titulo[datos['titulo']] = libro
+            resultado[datos['isbn']] = ACTUALIZADO if libro.pk else CREADO
+
+        nuevos = [libro for libro in por_titulo.values() if libro.pk is None]
+        cambiados = [libro for libro in por_titulo.values() if libro.pk is not None]
+        Libro.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+        Libro.objects.bulk_update(cambiados, CAMPOS_ACTUALIZABLES, batch_size=TAMANO_LOTE)
+        # Los existentes quedan con 'copias' sumando la diferencia, como ajustar_stock
+        diferencias = {
+            libro_id: copias - anterior for libro_id, anterior in stock_anterior.items() if copias != anterior
+        }
+        Libro.objects.bulk_update(
+            [
+                Libro(pk=libro_id, copias_disponibles=F('copias_disponibles') + diferencia)
+                for libro_id, diferencia in diferencias.items()
+            ],
+            ['copias_disponibles'], batch_size=TAMANO_LOTE,
+        )
+        MovimientoStock.objects.bulk_create(
+            [
+                MovimientoStock(libro=libro, cantidad=copias, tipo=MovimientoStock.INICIAL)
+                for libro in nuevos if copias
+            ] + [
+                MovimientoStock(libro_id=libro_id, cantidad=diferencia, tipo=MovimientoStock.IMPORTACION)
+                for libro_id, diferencia in diferencias.items()
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+        # Las copias que llegan se apartan primero para las listas de espera, como en ajustar_stock
+        apartar_copias([libro_id for libro_id, diferencia in diferencias.items() if diferencia > 0])
+        avisar_stock([libro.pk for libro in nuevos] + list(diferencias))
+
+        encolar_libros((datos['titulo'], datos['isbn']) for datos in lista_datos)
+        encolar_portadas(por_titulo.values())
+        # Las operaciones en bloque no disparan señales
+        buscador().indexar_libros(por_titulo.values())
+
+    invalidar_resumen()
+    marcar_cambio(LIBROS, AUTORES)
+    return resultado
@@ -0,0 +1,307 @@
+"""
+Ingesta de catálogos completos (migración desde otro sistema de biblioteca).
+
+El archivo se procesa como una cadena de generadores: leer (CSV, JSONL o MARC21)
+-> normalizar -> lotes. Cada lote se escribe en su propia transacción con
+bulk_create (autores nuevos, libros, stock inicial, índice de búsqueda y cola de
+portadas) junto con el punto de control (IngestaCatalogo), así que una carga
+cortada se retoma desde el último lote confirmado sin duplicar nada.
+
+Los autores se emparejan contra un índice en memoria {(nombre, apellido): id}
+cargado una sola vez de la tabla Autor, en lugar de una consulta por lote.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .busqueda import buscador
+from .cambios import marcar_cambio, LIBROS, AUTORES
+from .estadisticas import invalidar_resumen
+from .models import Autor, IngestaCatalogo, Libro, MovimientoStock
+from .openlibrary import separar_nombre
+from .portadas import encolar_portadas
+
+TAMANO_LOTE = 2000
+COPIAS_POR_DEFECTO = 1
+AUTOR_DESCONOCIDO = "Autor Desconocido"
+FORMATOS = ('csv', 'jsonl', 'marc')
+EXTENSIONES = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.mrc': 'marc', '.marc': 'marc'}
+
+# Nombres de columna aceptados (CSV y JSONL) -> campo
+ALIAS = {
+    'titulo': 'titulo', 'title': 'titulo',
+    'autor': 'autor', 'author': 'autor',
+    'autor_nombre': 'autor_nombre', 'autor_apellido': 'autor_apellido',
+    'anio': 'anio', 'año': 'anio', 'publicacion': 'anio', 'year': 'anio',
+    'paginas': 'paginas', 'pages': 'paginas',
+    'copias': 'copias', 'copias_disponibles': 'copias',
+    'estante': 'estante',
+    'precio': 'precio',
+    'portada': 'portada', 'portada_url': 'portada',
+}
+
+
+class ErrorIngesta(Exception):
+    pass
+
+
+# --- LECTORES (UN DICCIONARIO POR REGISTRO) ---
+def leer_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        for fila in csv.DictReader(archivo):
+            yield {ALIAS.get((clave or '').strip().lower()): valor for clave, valor in fila.items()}
+
+
+def leer_jsonl(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            if not linea.strip():
+                continue
+            try:
+                datos = json.loads(linea)
+            except ValueError:
+                yield {}  # Se cuenta como omitido sin perder la posición
+                continue
+            yield {ALIAS.get(str(clave).lower()): valor for clave, valor in datos.items()} if isinstance(datos, dict) else {}
+
+
+def _subcampos(dato):
+    # Indicadores (2 caracteres) y luego subcampos separados por 0x1F: código + valor
+    return [(parte[:1], parte[1:]) for parte in dato.split('\x1f')[1:] if parte]
+
+
+def _primero(campos, etiquetas, codigo):
+    for etiqueta in etiquetas:
+        for dato in campos.get(etiqueta, ()):
+            for clave, valor in _subcampos(dato):
+                if clave == codigo and valor.strip():
+                    return valor.strip()
+    return None
+
+
+def _sin_puntuacion(texto):
+    return texto.strip(' /:;,.=') if texto else texto
+
+
+def registro_marc(crudo):
+    """ Campos de un registro MARC21 (ISO 2709): {etiqueta: [datos]}. """
+    base = int(crudo[12:17])
+    # Posición 9 del líder: 'a' = UTF-8; si no, MARC-8, que se aproxima con latin-1
+    codificacion = 'utf-8' if crudo[9:10] == b'a' else 'latin-1'
+    directorio = crudo[24:base - 1]
+    campos = {}
+    for i in range(0, len(directorio) - 11, 12):
+        etiqueta = directorio[i:i + 3].decode('ascii', errors='replace')
+        largo, inicio = int(directorio[i + 3:i + 7]), int(directorio[i + 7:i + 12])
+        dato = crudo[base + inicio:base + inicio + largo].rstrip(b'\x1e')
+        campos.setdefault(etiqueta, []).append(dato.decode(codificacion, errors='replace'))
+    return campos
+
+
+def leer_marc(ruta):
+    with open(ruta, 'rb') as archivo:
+        while True:
+            largo = archivo.read(5)
+            # Algunos volcados separan los registros con saltos de línea
+            while largo[:1] in (b'\n', b'\r', b' ', b'\x1a'):
+                largo = largo[1:] + archivo.read(1)
+            if len(largo) < 5:
+                return
+            if not largo.isdigit():
+                raise ErrorIngesta(f"Registro MARC inválido cerca del byte {archivo.tell()}")
+            crudo = largo + archivo.read(int(largo) - 5)
+            try:
+                campos = registro_marc(crudo)
+            except (ValueError, IndexError):
+                yield {}
+                continue
+            autor = _sin_puntuacion(_primero(campos, ('100', '110', '700'), 'a'))
+            apellido, _, nombre = (autor or '').partition(', ')
+            titulo = _primero(campos, ('245',), 'a')
+            resto = _primero(campos, ('245',), 'b')
+            yield {
+                'titulo': _sin_puntuacion(f"{_sin_puntuacion(titulo)}: {resto}" if titulo and resto else titulo),
+                # Encabezamiento MARC: 'Apellido, Nombre'
+                'autor_nombre': nombre or apellido or None,
+                'autor_apellido': apellido if nombre else None,
+                'anio': _primero(campos, ('264', '260'), 'c'),
+                'paginas': _primero(campos, ('300',), 'a'),
+            }
+
+
+LECTORES = {'csv': leer_csv, 'jsonl': leer_jsonl, 'marc': leer_marc}
+
+
+# --- NORMALIZACIÓN ---
+def _entero(valor):
+    digitos = re.search(r'\d+', str(valor)) if valor not in (None, '') else None
+    return int(digitos.group()) if digitos else None
+
+
+def _texto(valor):
+    # En JSONL los valores pueden venir como números
+    return '' if valor is None else str(valor).strip()
+
+
+def normalizar(registro, copias=COPIAS_POR_DEFECTO):
+    """ Datos listos para Libro a partir de un registro leído, o None si no sirve (sin título). """
+    titulo = _texto(registro.get('titulo'))
+    if not titulo:
+        return None
+    if _texto(registro.get('autor_nombre')):
+        nombre, apellido = _texto(registro['autor_nombre']), _texto(registro.get('autor_apellido')) or ' '
+    else:
+        nombre, apellido = separar_nombre(_texto(registro.get('autor')) or AUTOR_DESCONOCIDO)
+    anio = _entero(registro.get('anio'))
+    copias_registro = _entero(registro.get('copias'))
+    try:
+        precio = Decimal(str(registro.get('precio') or 0).replace(',', '.')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        precio = Decimal('0.00')
+    return {
+        'titulo': titulo[:200],
+        'autor': (nombre[:100], apellido[:100]),
+        'publicacion': anio if anio and anio < 10000 else None,
+        'paginas': _entero(registro.get('paginas')),
+        'copias': copias if copias_registro is None else copias_registro,
+        'estante': _texto(registro.get('estante'))[:50] or None,
+        'precio': precio,
+        'portada_url': _texto(registro.get('portada'))[:500] or None,
+    }
+
+
+def lotes(registros, tamano):
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) == tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- AUTORES ---
+class IndiceAutores:
+    """ Índice en memoria (nombre, apellido) -> id de la tabla Autor; crea en bloque los que faltan. """
+
+    def __init__(self):
+        self.ids = {}
+        for nombre, apellido, autor_id in Autor.objects.order_by('id').values_list(
+            'nombre', 'apellido', 'id'
+        ).iterator(chunk_size=5000):
+            self.ids.setdefault((nombre, apellido), autor_id)
+
+    def resolver(self, claves):
+        """ Crea los autores de 'claves' que no existen; devuelve cuántos creó. """
+        faltan = {clave for clave in claves if clave not in self.ids}
+        nuevos = Autor.objects.bulk_create([Autor(nombre=nombre, apellido=apellido) for nombre, apellido in faltan])
+        for autor in nuevos:
+            self.ids[(autor.nombre, autor.apellido)] = autor.pk
+        return len(nuevos)
+
+    def autor(self, clave):
+        # Instancia sin consultar la base: basta para la FK y para el índice de búsqueda
+        return Autor(pk=self.ids[clave], nombre=clave[0], apellido=clave[1])
+
+
+# --- CARGA ---
+def formato_de(ruta):
+    formato = EXTENSIONES.get(os.path.splitext(ruta)[1].lower())
+    if formato is None:
+        raise ErrorIngesta(f"No se reconoce el formato de {ruta}: use --formato ({', '.join(FORMATOS)})")
+    return formato
+
+
+def huella_archivo(ruta):
+    """
+    sha256 del archivo completo: dos volcados con la misma cabecera y el mismo
+    tamaño no deben compartir punto de control. Leerlo es una pasada más rápida
+    que la carga misma.
+    """
+    huella = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(2 ** 20), b''):
+            huella.update(bloque)
+    return huella.hexdigest()
+
+
+def _guardar_lote(lote, indice, ingesta):
+    validos = [datos for datos in lote if datos]
+    with transaction.atomic():
+        autores_creados = indice.resolver({datos['autor'] for datos in validos})
+        libros = Libro.objects.bulk_create([
+            Libro(
+                titulo=datos['titulo'], autor=indice.autor(datos['autor']), publicacion=datos['publicacion'],
+                paginas=datos['paginas'], copias_disponibles=datos['copias'], estante=datos['estante'],
+                precio=datos['precio'], portada_url=datos['portada_url'],
+            )
+            for datos in validos
+        ])
+        # Las operaciones en bloque no disparan señales: stock inicial, búsqueda y portadas a mano
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(libro=libro, cantidad=libro.copias_disponibles, tipo=MovimientoStock.INICIAL)
+            for libro in libros if libro.copias_disponibles
+        ])
+        buscador().indexar_libros(libros)
+        encolar_portadas(libro for libro in libros if libro.portada_url)
+        ingesta.registros += len(lote)
+        ingesta.libros += len(libros)
+        ingesta.autores += autores_creados
+        ingesta.omitidos += len(lote) - len(validos)
+        ingesta.actualizada = timezone.now()
+        ingesta.save(update_fields=['registros', 'libros', 'autores', 'omitidos', 'actualizada'])
+
+
+def ingestar(ruta, formato=None, lote=TAMANO_LOTE, copias=COPIAS_POR_DEFECTO, reiniciar=False, limite=None,
+             progreso=None):
+    """
+    Carga el catálogo de 'ruta' por lotes y devuelve la IngestaCatalogo. Si el mismo
+    archivo ya se cargó en parte, sigue desde el punto de control (salvo 'reiniciar').
+    'progreso(ingesta, filas_por_segundo)' se llama después de cada lote.
+    """
+    formato = formato or formato_de(ruta)
+    ingesta, _ = IngestaCatalogo.objects.get_or_create(
+        huella=huella_archivo(ruta), defaults={'archivo': str(ruta), 'formato': formato}
+    )
+    if reiniciar:
+        ingesta.registros = ingesta.libros = ingesta.autores = ingesta.omitidos = 0
+        ingesta.terminada = False
+        ingesta.iniciada = timezone.now()
+        ingesta.save()
+    if ingesta.terminada:
+        return ingesta
+
+    registros = iter(LECTORES[formato](ruta))
+    # Lo ya confirmado se vuelve a leer (sin guardar) para llegar al punto de control
+    for _ in range(ingesta.registros):
+        if next(registros, None) is None:
+            break
+    normalizados = (normalizar(registro, copias) for registro in registros)
+    if limite is not None:
+        normalizados = (datos for _, datos in zip(range(limite), normalizados))
+
+    indice = IndiceAutores()
+    inicio, procesados = time.perf_counter(), 0
+    try:
+        for bloque in lotes(normalizados, lote):
+            _guardar_lote(bloque, indice, ingesta)
+            procesados += len(bloque)
+            if progreso:
+                progreso(ingesta, procesados / max(time.perf_counter() - inicio, 1e-9))
+        # Con 'limite' no se sabe si quedaba algo: la próxima ejecución lo confirma
+        if limite is None or procesados < limite:
+            ingesta.terminada = True
+            ingesta.save(update_fields=['terminada'])
+    finally:
+        if procesados:
+            invalidar_resumen()
+            marcar_cambio(LIBROS, AUTORES)
+    return ingesta
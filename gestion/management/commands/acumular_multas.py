@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.tareas import acumular_multas
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera y actualiza en bloque las multas de los préstamos vencidos. "
+        "Pensado para ejecutarse una vez al día (ej. cron: 5 0 * * * python manage.py acumular_multas)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help="Día a procesar en formato AAAA-MM-DD (por defecto hoy)")
+        parser.add_argument('--forzar', action='store_true', help="Recalcula aunque el día ya se haya procesado")
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options['fecha']:
+            try:
+                hoy = date.fromisoformat(options['fecha'])
+            except ValueError:
+                raise CommandError("La fecha debe tener el formato AAAA-MM-DD")
+
+        resultado = acumular_multas(hoy=hoy, forzar=options['forzar'])
+        if resultado is None:
+            self.stdout.write("Las multas ya estaban al día, no se hizo nada.")
+            return
+        creadas, actualizadas = resultado
+        self.stdout.write(self.style.SUCCESS(
+            f"Multas procesadas: {creadas} nuevas, {actualizadas} actualizadas."
+        ))
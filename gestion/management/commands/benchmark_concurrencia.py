@@ -0,0 +1,118 @@
+import json
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from gestion import rendimiento
+from gestion.basedatos import pragmas_actuales
+from gestion.cambios import marcar_cambio
+from gestion.estadisticas import invalidar_resumen
+from gestion.models import Autor, Libro, Lector, MovimientoStock
+from gestion.stock import registrar_devoluciones, registrar_prestamos
+from gestion.tareas import acumular_multas
+
+LIBROS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la contención de escrituras: '--hilos' workers prestan y devuelven libros (y cada tanto "
+        "acumulan multas) durante '--segundos' contra la base configurada. Ejecútelo con DB_MOTOR=sqlite, "
+        "DB_SQLITE_AJUSTES=0 y DB_MOTOR=postgres y compare los JSON con --comparar. "
+        "Los datos de prueba se borran al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument('--acumular-cada', type=int, default=25,
+                            help="Cada cuántas operaciones de un worker se corre la acumulación de multas (0 = nunca)")
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, la salida estándar)")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior para mostrar las diferencias")
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anterior = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer {options['comparar']}: {e}")
+
+        resultado = {
+            'fecha': timezone.now().isoformat(),
+            'commit': rendimiento.version_codigo(),
+            'base_de_datos': connection.vendor,
+            'transaction_mode': connection.settings_dict['OPTIONS'].get('transaction_mode'),
+            'pragmas': pragmas_actuales(connection),
+            'hilos': options['hilos'],
+            'acumular_cada': options['acumular_cada'],
+        }
+        marca = uuid.uuid4().hex[:8]
+        autor = Autor.objects.create(nombre="Contención", apellido=marca)
+        try:
+            libros = Libro.objects.bulk_create([
+                Libro(titulo=f"Contención {marca} {i}", autor=autor, copias_disponibles=10_000) for i in range(LIBROS)
+            ])
+            MovimientoStock.objects.bulk_create([
+                MovimientoStock(libro=libro, cantidad=libro.copias_disponibles, tipo=MovimientoStock.INICIAL)
+                for libro in libros
+            ])
+            usuarios = User.objects.bulk_create([
+                User(username=f"contencion-{marca}-{i}") for i in range(options['hilos'])
+            ])
+            lectores = Lector.objects.bulk_create([
+                Lector(user=usuario, identificacion=f"C{marca}{i:04d}") for i, usuario in enumerate(usuarios)
+            ])
+            vencido = timezone.now().date() - timedelta(days=3)
+            contadores = [0] * options['hilos']
+
+            def operacion(numero):
+                # Préstamo vencido y su devolución (con multa), como en el mostrador a fin de semestre
+                azar = random.Random(numero * 1_000_003 + contadores[numero])
+                contadores[numero] += 1
+                prestado = registrar_prestamos([azar.choice(libros).pk], lectores[numero], vencido)[0]
+                registrar_devoluciones([prestado['prestamo']])
+                if options['acumular_cada'] and contadores[numero] % options['acumular_cada'] == 0:
+                    acumular_multas(forzar=True)
+
+            self.stderr.write(f"{options['hilos']} workers durante {options['segundos']} s...")
+            resultado['carga'] = rendimiento.carga_escrituras(operacion, options['hilos'], options['segundos'])
+        finally:
+            User.objects.filter(username__startswith=f"contencion-{marca}-").delete()
+            autor.delete()
+            invalidar_resumen()
+            marcar_cambio()
+
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+        else:
+            self.stdout.write(texto)
+        self.resumen(resultado, anterior)
+
+    def resumen(self, resultado, anterior):
+        # El resumen va a stderr para que la salida estándar sea solo el JSON
+        for etiqueta, datos in (('anterior', anterior), ('actual', resultado)):
+            if not datos:
+                continue
+            carga = datos['carga']
+            exitosas = carga['estados'].get('ok', 0)
+            errores = carga['peticiones'] - exitosas
+            estilo = self.style.WARNING if errores else self.style.SUCCESS
+            # Un error 'database is locked' vuelve enseguida: se informan solo las operaciones exitosas por segundo
+            self.stderr.write(estilo(
+                f"{etiqueta:8} {datos['base_de_datos']:10} {datos.get('transaction_mode') or '-':9} "
+                f"{exitosas / carga['segundos']:8.1f} op/s  p95 {carga['latencia_ms']['p95']:8.1f} ms  "
+                f"errores {errores}/{carga['peticiones']}"
+            ))
+            for estado, total in carga['estados'].items():
+                if estado != 'ok':
+                    self.stderr.write(f"         {total:6} × {estado}")
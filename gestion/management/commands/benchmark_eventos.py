@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from gestion import eventos
+from gestion.cambios import marcar_cambio
+from gestion.estadisticas import invalidar_resumen
+from gestion.models import Autor, Libro, Lector
+from gestion.monitoreo import percentiles
+from gestion.stock import registrar_devoluciones, registrar_prestamos
+
+
+class BrokerMedido(eventos.BrokerLocal):
+    """ Anota cuándo se publicó cada evento para medir cuánto tarda en llegar. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.publicados = {}
+        self.por_canal = Counter()
+
+    def publicar(self, canal, tipo, datos):
+        inicio = time.perf_counter()
+        evento = super().publicar(canal, tipo, datos)
+        self.publicados[evento.numero] = inicio
+        self.por_canal[canal] += 1
+        return evento
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide los cambios en vivo: '--clientes' pestañas del panel y de la bodega escuchan mientras un "
+        "worker presta y devuelve libros durante '--segundos'. Informa la latencia de entrega, los "
+        "eventos por cliente y las recargas que habrían hecho esas pestañas cada '--refresco' segundos. "
+        "Un cliente que nunca lee comprueba que la cola acotada no frena a los demás. "
+        "Los datos de prueba se borran al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=200)
+        parser.add_argument('--segundos', type=float, default=5)
+        parser.add_argument('--refresco', type=float, default=10,
+                            help="Cada cuántos segundos recargaba el personal la página antes de los eventos")
+
+    def handle(self, *args, **options):
+        medido = BrokerMedido()
+        # Un lugar queda para el cliente lento
+        options['clientes'] = min(options['clientes'], eventos.MAX_SUSCRIPTORES - 1)
+        marca = uuid.uuid4().hex[:8]
+        autor = Autor.objects.create(nombre="Eventos", apellido=marca)
+        # La señal de stock inicial registra el movimiento
+        libro = Libro.objects.create(titulo=f"Eventos {marca}", autor=autor, copias_disponibles=10_000)
+        lector = Lector.objects.create(user=User.objects.create(username=f"eventos-{marca}"), identificacion=f"E{marca}")
+        vencido = timezone.now().date() - timedelta(days=3)
+        terminado = threading.Event()
+        operaciones = [0]
+
+        def escribir():
+            try:
+                fin = time.perf_counter() + options['segundos']
+                while time.perf_counter() < fin:
+                    prestado = registrar_prestamos([libro.pk], lector, vencido)[0]
+                    registrar_devoluciones([prestado['prestamo']])
+                    operaciones[0] += 1
+            finally:
+                connection.close()
+                terminado.set()
+
+        async def escuchar():
+            suscripciones = [
+                medido.suscribir(eventos.PANEL if numero % 2 else eventos.BODEGA)
+                for numero in range(options['clientes'])
+            ]
+            lenta = medido.suscribir(eventos.PANEL)  # Nunca lee su cola
+            recibidos = []
+
+            async def leer(suscripcion):
+                while True:
+                    evento = await suscripcion.siguiente(0.2)
+                    if evento is None:
+                        if terminado.is_set():
+                            return
+                        continue
+                    recibidos.append((evento.numero, time.perf_counter()))
+
+            escritor = asyncio.get_running_loop().run_in_executor(None, escribir)
+            await asyncio.gather(escritor, *(leer(suscripcion) for suscripcion in suscripciones))
+            for suscripcion in suscripciones + [lenta]:
+                suscripcion.cerrar()
+            return recibidos, lenta.desbordada
+
+        self.stderr.write(f"{options['clientes']} clientes escuchando durante {options['segundos']} s...")
+        try:
+            with mock.patch.object(eventos, '_broker', medido):
+                recibidos, lenta_desbordada = asyncio.run(escuchar())
+        finally:
+            User.objects.filter(username=f"eventos-{marca}").delete()
+            autor.delete()
+            invalidar_resumen()
+            marcar_cambio()
+
+        latencias = [
+            (llegada - medido.publicados[numero]) * 1000 for numero, llegada in recibidos if numero in medido.publicados
+        ]
+        clientes = options['clientes']
+        self.stdout.write(f"Operaciones (préstamo + devolución): {operaciones[0]}")
+        self.stdout.write(f"Eventos publicados: {len(medido.publicados)}, entregas: {len(recibidos)}")
+        if latencias:
+            cortes = percentiles(latencias)
+            self.stdout.write(
+                f"Latencia de entrega: p50 {cortes['p50']:.2f} ms  p95 {cortes['p95']:.2f} ms  máx {max(latencias):.2f} ms"
+            )
+        self.stdout.write(f"Eventos por cliente: {len(recibidos) / clientes:.1f} (sin consultas por cliente)")
+        recargas = clientes * options['segundos'] / options['refresco']
+        self.stdout.write(
+            f"Recargas de página equivalentes cada {options['refresco']:g} s: {recargas:.0f} "
+            f"(cada una recalcula el panel o el inventario)"
+        )
+        # El cliente que no lee debe desbordarse solo si le llegaron más eventos de los que caben en su cola
+        esperado = medido.por_canal[eventos.PANEL] > medido.maximo
+        estilo = self.style.SUCCESS if lenta_desbordada == esperado and medido.desbordes == esperado else self.style.ERROR
+        self.stdout.write(estilo(
+            f"Cliente lento: {'recibió recargar' if lenta_desbordada else 'sin desbordar'} con "
+            f"{medido.por_canal[eventos.PANEL]} eventos y cola de {medido.maximo} (desbordes: {medido.desbordes})"
+        ))
@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gestion import rendimiento
+from gestion.exportar import FORMATOS, REPORTES
+
+
+class Deshacer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra '--prestamos' préstamos y exporta un reporte midiendo el primer bloque, el tiempo total "
+        "y el crecimiento de la memoria residente, que no debe pasar de --max-mb. "
+        "Todo ocurre en una transacción que se deshace al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prestamos', type=int, default=1_000_000)
+        parser.add_argument('--reporte', choices=sorted(REPORTES), default='prestamos')
+        parser.add_argument('--formato', action='append', choices=FORMATOS,
+                            help="Formatos a medir (se puede repetir; por defecto csv y xlsx)")
+        parser.add_argument('--max-mb', type=float, default=64,
+                            help="Crecimiento máximo admitido de la memoria residente durante la exportación")
+
+    def handle(self, *args, **options):
+        formatos = options['formato'] or ['csv', 'xlsx']
+        resultados = []
+        try:
+            with transaction.atomic():
+                conteos = rendimiento.sembrar(max(options['prestamos'] // 50, 1), prestamos=options['prestamos'])
+                self.stderr.write("Datos sembrados: " + ", ".join(f"{k}={v}" for k, v in conteos.items()))
+                for formato in formatos:
+                    resultados.append(rendimiento.medir_exportacion(options['reporte'], formato))
+                raise Deshacer
+        except Deshacer:
+            pass
+
+        self.stdout.write(json.dumps(resultados, indent=2, ensure_ascii=False))
+        excedidos = [r for r in resultados if r['rss_crecimiento_mb'] > options['max_mb']]
+        for resultado in resultados:
+            estilo = self.style.WARNING if resultado in excedidos else self.style.SUCCESS
+            self.stderr.write(estilo(
+                f"{resultado['formato']:5} {resultado['filas']} filas en {resultado['segundos']} s, "
+                f"primer bloque {resultado['primer_bloque_ms']} ms, RSS +{resultado['rss_crecimiento_mb']} MB"
+            ))
+        if excedidos:
+            raise CommandError(f"La memoria residente creció más de {options['max_mb']} MB")
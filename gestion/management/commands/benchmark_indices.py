@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from gestion import rendimiento
+
+
+class Deshacer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un volumen grande de datos y compara plan (EXPLAIN) y tiempo de las consultas "
+        "diarias sin y con los índices del modelo. Todo ocurre en una transacción que se deshace al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=20000, help="Libros a sembrar (préstamos = 3x)")
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--consulta', action='append', choices=sorted(rendimiento.CONSULTAS),
+                            help="Limita la medición a estas consultas (se puede repetir)")
+
+    def handle(self, *args, **options):
+        nombres = options['consulta'] or list(rendimiento.CONSULTAS)
+        try:
+            with transaction.atomic():
+                conteos = rendimiento.sembrar(options['libros'])
+                self.stdout.write("Datos sembrados: " + ", ".join(f"{k}={v}" for k, v in conteos.items()))
+                self.analizar()
+
+                rendimiento.quitar_indices()
+                antes = self.medir(nombres, options['repeticiones'])
+                rendimiento.crear_indices()
+                self.analizar()
+                despues = self.medir(nombres, options['repeticiones'])
+                raise Deshacer
+        except Deshacer:
+            pass
+
+        for nombre in nombres:
+            (plan_antes, ms_antes), (plan_despues, ms_despues) = antes[nombre], despues[nombre]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {nombre} =="))
+            self.stdout.write(f"Sin índices ({ms_antes:.2f} ms):\n{plan_antes}")
+            self.stdout.write(f"Con índices ({ms_despues:.2f} ms):\n{plan_despues}")
+            mejora = ms_antes / ms_despues if ms_despues else float('inf')
+            estilo = self.style.SUCCESS if mejora >= 1 else self.style.WARNING
+            self.stdout.write(estilo(f"x{mejora:.1f}"))
+
+    def analizar(self):
+        # Estadísticas al día para que el planificador considere los índices recién creados
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def medir(self, nombres, repeticiones):
+        resultados = {}
+        for nombre in nombres:
+            funcion = rendimiento.CONSULTAS[nombre]
+            resultados[nombre] = (rendimiento.explicar(funcion()), rendimiento.medir(funcion, repeticiones))
+        return resultados
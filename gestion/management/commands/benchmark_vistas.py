@@ -0,0 +1,91 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from gestion import rendimiento
+
+
+class Deshacer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Recorre las vistas clave con el cliente de pruebas y guarda en JSON percentiles de latencia, "
+        "consultas SQL y pico de memoria. Use 'generar_datos' antes para tener volumen. "
+        "Los cambios (devoluciones, usuario de prueba) se deshacen al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--vista', action='append', choices=list(rendimiento.VISTAS),
+                            help="Limita el recorrido a estas vistas (se puede repetir)")
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, la salida estándar)")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior para mostrar las diferencias")
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anterior = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer {options['comparar']}: {e}")
+
+        nombres = options['vista'] or list(rendimiento.VISTAS)
+        resultado = {
+            'fecha': timezone.now().isoformat(),
+            'commit': rendimiento.version_codigo(),
+            'base_de_datos': connection.vendor,
+            'filas': rendimiento.conteo_tablas(),
+            'vistas': {},
+        }
+        try:
+            with transaction.atomic():
+                usuario = User.objects.create_superuser('benchmark-vistas', 'benchmark@example.com', None)
+                cliente = Client()
+                cliente.force_login(usuario)
+                for nombre in nombres:
+                    self.stderr.write(f"Midiendo {nombre}...")
+                    try:
+                        resultado['vistas'][nombre] = rendimiento.medir_vista(
+                            cliente, rendimiento.VISTAS[nombre](), options['repeticiones']
+                        )
+                    except StopIteration:
+                        self.stderr.write(self.style.WARNING(f"  {nombre}: no hay datos suficientes, se omite."))
+                raise Deshacer
+        except Deshacer:
+            pass
+
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+        else:
+            self.stdout.write(texto)
+
+        self.resumen(resultado, anterior)
+
+    def resumen(self, resultado, anterior):
+        # El resumen va a stderr para que la salida estándar sea solo el JSON
+        salida = self.stderr
+        for nombre, datos in resultado['vistas'].items():
+            latencia = datos['latencia_ms']
+            salida.write(
+                f"{nombre:22} p50 {latencia['p50']:8.1f} ms  p95 {latencia['p95']:8.1f} ms  "
+                f"consultas {datos['consultas']['max']:3}  memoria {datos['memoria_pico_kb']:9.1f} KB"
+            )
+        if anterior:
+            salida.write(self.style.MIGRATE_HEADING(f"\nComparado con {anterior.get('commit') or 'la ejecución anterior'}:"))
+            for nombre, p50_antes, p50_ahora, consultas_antes, consultas_ahora in rendimiento.comparar(anterior, resultado):
+                cambio = (p50_ahora - p50_antes) / p50_antes * 100 if p50_antes else 0
+                estilo = self.style.WARNING if cambio > 10 or consultas_ahora > consultas_antes else self.style.SUCCESS
+                salida.write(estilo(
+                    f"{nombre:22} p50 {p50_antes:.1f} -> {p50_ahora:.1f} ms ({cambio:+.0f} %)  "
+                    f"consultas {consultas_antes} -> {consultas_ahora}"
+                ))
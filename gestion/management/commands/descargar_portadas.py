@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gestion.models import Libro, Portada
+from gestion.portadas import estado_portadas, procesar_portadas, rellenar_portadas, TAMANO_LOTE, CONCURRENCIA
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga las portadas pendientes y genera sus miniaturas (una vez o en bucle). "
+        "Con --rellenar primero encola las portadas de los libros ya existentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rellenar', action='store_true', help="Encola las portadas de todos los libros existentes")
+        parser.add_argument('--solo-rellenar', action='store_true', help="Encola sin descargar nada")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE)
+        parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA, help="Descargas simultáneas")
+        parser.add_argument('--bucle', action='store_true', help="Sigue procesando hasta que se detenga el proceso")
+        parser.add_argument('--pausa', type=int, default=10, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--estado', action='store_true', help="Solo muestra cuántas portadas hay en cada estado")
+
+    def handle(self, *args, **options):
+        if options['estado']:
+            conteos = estado_portadas()
+            for estado, nombre in Portada.ESTADOS:
+                self.stdout.write(f"{nombre}: {conteos.get(estado, 0)}")
+            return
+
+        if options['rellenar'] or options['solo_rellenar']:
+            encoladas = rellenar_portadas(Libro.objects.all())
+            self.stdout.write(f"Portadas encoladas: {encoladas}")
+            if options['solo_rellenar']:
+                return
+
+        total_listas = total_errores = 0
+        while True:
+            listas, errores = procesar_portadas(options['lote'], options['concurrencia'])
+            total_listas += listas
+            total_errores += errores
+            if listas or errores:
+                self.stdout.write(f"Listas: {listas}, con error: {errores}")
+            if not listas and not errores:
+                if not options['bucle']:
+                    break
+                time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f"Total: {total_listas} listas, {total_errores} con error"))
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.exportar import FORMATOS, REPORTES, escribir_reporte
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta un reporte (préstamos, facturación, multas o inventario) en CSV, JSON o XLSX por bloques, "
+        "con los mismos filtros --q y --estado de su vista. La memoria no crece con la cantidad de filas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('reporte', choices=sorted(REPORTES))
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--q', help="Búsqueda, como en el cuadro de la vista")
+        parser.add_argument('--estado', help="Filtro de estado de la vista (p. ej. vencidos, critico)")
+        parser.add_argument('--salida', help="Archivo de destino ('-' para la salida estándar; por defecto <reporte>.<formato>)")
+
+    def handle(self, *args, **options):
+        reporte = REPORTES[options['reporte']]
+        if options['estado'] and options['estado'] not in reporte.estados:
+            raise CommandError(
+                f"Estado no válido para {options['reporte']}: use {', '.join(reporte.estados) or 'ninguno'}"
+            )
+        salida = options['salida'] or f"{options['reporte']}.{options['formato']}"
+        if salida == '-':
+            escribir_reporte(options['reporte'], options['formato'], sys.stdout.buffer, options['q'], options['estado'])
+            return
+        try:
+            with open(salida, 'wb') as archivo:
+                escritos = escribir_reporte(
+                    options['reporte'], options['formato'], archivo, options['q'], options['estado']
+                )
+        except OSError as e:
+            raise CommandError(f"No se pudo escribir {salida}: {e}")
+        self.stderr.write(self.style.SUCCESS(f"{salida}: {escritos / 2 ** 20:.1f} MB"))
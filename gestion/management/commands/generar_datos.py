@@ -0,0 +1,47 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from gestion import rendimiento
+from gestion.cambios import marcar_cambio
+from gestion.estadisticas import invalidar_resumen
+
+# Escala = libros; hay un lector cada 10 libros y 2 préstamos por libro
+ESCALAS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos reproducibles (autores, libros, lectores, préstamos y multas) "
+        "con inserciones en bloque, para pruebas de carga y benchmarks. Se suman a los existentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=ESCALAS, default='10k')
+        parser.add_argument('--libros', type=int, help="Sobrescribe la cantidad de libros de la escala")
+        parser.add_argument('--lectores', type=int)
+        parser.add_argument('--prestamos', type=int)
+        parser.add_argument('--semilla', type=int, default=0, help="Misma semilla, mismos datos")
+        parser.add_argument('--sin-indexar', action='store_true', help="No reconstruye el índice de búsqueda")
+
+    def handle(self, *args, **options):
+        libros = options['libros'] or ESCALAS[options['escala']]
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            conteos = rendimiento.sembrar(
+                libros,
+                lectores=options['lectores'] if options['lectores'] is not None else max(libros // 10, 1),
+                prestamos=options['prestamos'] if options['prestamos'] is not None else libros * 2,
+                semilla=options['semilla'],
+            )
+        invalidar_resumen()
+        marcar_cambio()
+        self.stdout.write(self.style.SUCCESS(
+            "Creados: " + ", ".join(f"{k}={v}" for k, v in conteos.items())
+            + f" en {time.perf_counter() - inicio:.1f} s."
+        ))
+        # Las inserciones en bloque no disparan las señales que mantienen la búsqueda al día
+        if not options['sin_indexar']:
+            call_command('reindexar_busqueda', stdout=self.stdout)
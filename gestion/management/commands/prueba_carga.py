@@ -0,0 +1,70 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gestion import rendimiento
+from gestion.openlibrary import consultar_lote
+
+
+class Deshacer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de la búsqueda por ISBN contra un Open Library falso que tarda '--retardo' segundos: "
+        "compara la vista asíncrona (peticiones concurrentes en un solo proceso) con '--hilos' workers "
+        "bloqueantes haciendo la misma llamada. Los datos que se guardan se deshacen al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=100)
+        parser.add_argument('--concurrencia', type=int, default=50)
+        parser.add_argument('--retardo', type=float, default=0.5, help="Segundos que tarda el origen en responder")
+        parser.add_argument('--hilos', type=int, default=4, help="Workers síncronos de la comparación")
+
+    def handle(self, *args, **options):
+        origen = rendimiento.OrigenLento(options['retardo'])
+        isbns = rendimiento.isbns_de_prueba(options['peticiones'])
+        resultado = {
+            'fecha': timezone.now().isoformat(),
+            'commit': rendimiento.version_codigo(),
+            'retardo_s': options['retardo'],
+            'concurrencia': options['concurrencia'],
+            'hilos': options['hilos'],
+        }
+        try:
+            with override_settings(OPENLIBRARY_URL=origen.url):
+                self.stderr.write("Vista asíncrona...")
+                try:
+                    with transaction.atomic():
+                        cliente = AsyncClient()
+                        cliente.force_login(User.objects.create_superuser('prueba-carga', 'carga@example.com', None))
+                        urls = [f"{reverse('gestion:buscar_api')}?isbn={isbn}" for isbn in isbns]
+                        # async_to_sync deja este hilo libre para el ORM (sync_to_async) de las vistas
+                        resultado['asincrona'] = async_to_sync(rendimiento.carga_asincrona)(
+                            cliente, urls, options['concurrencia']
+                        )
+                        raise Deshacer
+                except Deshacer:
+                    pass
+                self.stderr.write(f"{options['hilos']} workers bloqueantes...")
+                resultado['bloqueante'] = rendimiento.carga_bloqueante(
+                    lambda isbn: consultar_lote([isbn]), isbns, options['hilos']
+                )
+        finally:
+            origen.cerrar()
+
+        self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
+        for modo in ('asincrona', 'bloqueante'):
+            datos = resultado[modo]
+            self.stderr.write(
+                f"{modo:11} {datos['por_segundo']:8.1f} pet/s  p50 {datos['latencia_ms']['p50']:8.1f} ms  "
+                f"p95 {datos['latencia_ms']['p95']:8.1f} ms  estados {datos['estados']}"
+            )
@@ -0,0 +1,109 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count
+
+from gestion.cambios import marcar_cambio
+from gestion.estadisticas import invalidar_resumen
+from gestion.models import Autor, Libro, Lector, MovimientoStock, Reserva
+from gestion.reservas import cancelar_reserva, libros_con_copias_ociosas, reservar
+from gestion.stock import diferencias_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de estrés de las reservas: '--lectores' lectores reservan a la vez (con '--hilos' workers) "
+        "unos pocos libros con '--copias' copias cada uno y luego la mitad de los que recibieron copia "
+        "cancela. Verifica que nunca se aparten más copias de las que hay y que nadie espere con copias "
+        "en el estante. Los datos de prueba se borran al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=2000)
+        parser.add_argument('--libros', type=int, default=3)
+        parser.add_argument('--copias', type=int, default=20)
+        parser.add_argument('--hilos', type=int, default=16)
+
+    def en_paralelo(self, funcion, elementos, hilos):
+        def trabajar(elemento):
+            try:
+                # Con SQLite el bloqueo de escritura es de toda la base: se reintenta como haría la vista
+                for _ in range(100):
+                    try:
+                        return funcion(elemento)
+                    except OperationalError:
+                        time.sleep(0.01)
+                raise CommandError("La base siguió bloqueada tras 100 intentos")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            return list(ejecutor.map(trabajar, elementos))
+
+    def comprobar(self, libros, copias):
+        errores = []
+        por_libro = {
+            libro_id: total for libro_id, total in Reserva.objects.filter(
+                libro__in=libros, estado=Reserva.APARTADA
+            ).values_list('libro_id').annotate(total=Count('id')).order_by()
+        }
+        for libro in libros:
+            libro.refresh_from_db()
+            if libro.copias_disponibles < 0 or por_libro.get(libro.pk, 0) + libro.copias_disponibles != copias:
+                errores.append(
+                    f"{libro.titulo}: {por_libro.get(libro.pk, 0)} apartadas y {libro.copias_disponibles} en el estante"
+                )
+        ids = [libro.pk for libro in libros]
+        errores += [f"Libro {libro_id}: copias ociosas con lectores esperando" for libro_id in libros_con_copias_ociosas(ids)]
+        errores += [
+            f"Libro {libro_id}: stock {actual}, movimientos {esperado}"
+            for libro_id, actual, esperado in diferencias_stock() if libro_id in ids
+        ]
+        return errores
+
+    def handle(self, *args, **options):
+        marca = uuid.uuid4().hex[:8]
+        autor = Autor.objects.create(nombre="Reservas", apellido=marca)
+        try:
+            libros = Libro.objects.bulk_create([
+                Libro(titulo=f"Reservas {marca} {i}", autor=autor, copias_disponibles=options['copias'])
+                for i in range(options['libros'])
+            ])
+            MovimientoStock.objects.bulk_create([
+                MovimientoStock(libro=libro, cantidad=libro.copias_disponibles, tipo=MovimientoStock.INICIAL)
+                for libro in libros
+            ])
+            usuarios = User.objects.bulk_create([
+                User(username=f"reservas-{marca}-{i}") for i in range(options['lectores'])
+            ])
+            lectores = Lector.objects.bulk_create([
+                Lector(user=usuario, identificacion=f"R{marca}{i:06d}") for i, usuario in enumerate(usuarios)
+            ])
+
+            inicio = time.perf_counter()
+            reservas = self.en_paralelo(
+                lambda i: reservar(libros[i % len(libros)].pk, lectores[i])[0], range(len(lectores)), options['hilos']
+            )
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(f"{len(reservas)} reservas en {segundos:.1f} s ({len(reservas) / segundos:.0f}/s)")
+            errores = self.comprobar(libros, options['copias'])
+
+            apartadas = [reserva for reserva in reservas if reserva.estado == Reserva.APARTADA]
+            canceladas = self.en_paralelo(cancelar_reserva, apartadas[::2], options['hilos'])
+            self.stdout.write(f"{sum(canceladas)} copias apartadas canceladas y pasadas al siguiente")
+            errores += self.comprobar(libros, options['copias'])
+        finally:
+            User.objects.filter(username__startswith=f"reservas-{marca}-").delete()
+            autor.delete()
+            invalidar_resumen()
+            marcar_cambio()
+
+        if errores:
+            for error in errores:
+                self.stderr.write(self.style.ERROR(error))
+            raise CommandError(f"{len(errores)} problemas: se apartaron copias de más")
+        self.stdout.write(self.style.SUCCESS("Sin sobreventa: cada copia apartada corresponde a una del stock."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from gestion.busqueda import buscador, crear_indices
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero el índice de búsqueda de libros y lectores."
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # También crea las tablas FTS5 si todavía no existen
+            crear_indices()
+        else:
+            buscador().reindexar()
+        self.stdout.write(self.style.SUCCESS(f"Índice reconstruido ({type(buscador()).__name__})."))
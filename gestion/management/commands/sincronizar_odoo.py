@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gestion.models import OperacionOdoo
+from gestion.odoo import ClienteOdoo, procesar_pendientes, estado_cola
+
+
+class Command(BaseCommand):
+    help = "Envía a Odoo las operaciones pendientes de la cola (una vez o en bucle)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucle', action='store_true', help="Sigue procesando hasta que se detenga el proceso")
+        parser.add_argument('--pausa', type=int, default=10, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--estado', action='store_true', help="Solo muestra el tamaño de la cola y las fallas")
+
+    def handle(self, *args, **options):
+        if options['estado']:
+            self.mostrar_estado()
+            return
+
+        cliente = ClienteOdoo()
+        while True:
+            enviadas, errores = procesar_pendientes(cliente)
+            if enviadas or errores:
+                self.stdout.write(f"Enviadas: {enviadas}, con error: {errores}")
+            if not options['bucle']:
+                break
+            if not enviadas:
+                time.sleep(options['pausa'])
+
+    def mostrar_estado(self):
+        conteos, fallas = estado_cola()
+        for estado, nombre in OperacionOdoo.ESTADOS:
+            self.stdout.write(f"{nombre}: {conteos.get(estado, 0)}")
+        for operacion in fallas:
+            self.stdout.write(self.style.WARNING(
+                f"  {operacion.isbn} ({operacion.intentos} intentos): {operacion.ultimo_error}"
+            ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gestion.reservas import vencer_reservas
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera las copias apartadas cuyo plazo (RESERVA_HORAS) venció y las aparta para el siguiente "
+        "de cada lista de espera. Con --bucle queda revisando cada --pausa segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucle', action='store_true', help="Sigue revisando hasta que se detenga el proceso")
+        parser.add_argument('--pausa', type=int, default=60, help="Segundos entre revisiones")
+
+    def handle(self, *args, **options):
+        while True:
+            vencidas = vencer_reservas()
+            if vencidas or not options['bucle']:
+                self.stdout.write(f"Reservas vencidas: {vencidas}")
+            if not options['bucle']:
+                break
+            time.sleep(options['pausa'])
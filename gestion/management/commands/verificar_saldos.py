@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from gestion.cambios import marcar_cambio, MULTAS
+from gestion.estadisticas import invalidar_resumen
+from gestion.saldos import actualizar_saldos, diferencias_saldos
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el saldo de cada lector con la suma de sus multas pendientes y muestra las diferencias. "
+        "Con --corregir recalcula los saldos que no cuadran."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corregir', action='store_true', help="Recalcula los saldos que no cuadran")
+
+    def handle(self, *args, **options):
+        diferencias = diferencias_saldos()
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("Los saldos cuadran con las multas."))
+            return
+        for lector_id, (deuda, cantidad), (deuda_esperada, cantidad_esperada) in diferencias:
+            self.stdout.write(
+                f"Lector {lector_id}: saldo ${deuda} ({cantidad} multas), "
+                f"multas ${deuda_esperada} ({cantidad_esperada} multas)"
+            )
+        if options['corregir']:
+            corregidos = actualizar_saldos(lector_id for lector_id, _, _ in diferencias)
+            invalidar_resumen()
+            marcar_cambio(MULTAS)
+            self.stdout.write(self.style.SUCCESS(f"{corregidos} saldos corregidos."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(diferencias)} lectores no cuadran (use --corregir)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from gestion.models import MovimientoStock
+from gestion.stock import diferencias_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el stock de cada libro con la suma de sus movimientos y muestra las diferencias. "
+        "Con --corregir registra un ajuste para que el historial cuadre con el stock actual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corregir', action='store_true', help="Registra los ajustes que faltan")
+
+    def handle(self, *args, **options):
+        diferencias = diferencias_stock()
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("El stock cuadra con los movimientos."))
+            return
+        for libro_id, actual, esperado in diferencias:
+            self.stdout.write(f"Libro {libro_id}: stock {actual}, movimientos {esperado} ({actual - esperado:+d})")
+        if options['corregir']:
+            MovimientoStock.objects.bulk_create([
+                MovimientoStock(libro_id=libro_id, cantidad=actual - esperado, tipo=MovimientoStock.AJUSTE)
+                for libro_id, actual, esperado in diferencias
+            ], batch_size=500)
+            self.stdout.write(self.style.SUCCESS(f"{len(diferencias)} ajustes registrados."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(diferencias)} libros no cuadran (use --corregir)."))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_libro_estante_prestamo_notas_entrega'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ControlTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('ultima_fecha', models.DateField(blank=True, help_text='Último día procesado por la tarea', null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Control de tarea',
+                'verbose_name_plural': 'Control de tareas',
+            },
+        ),
+    ]
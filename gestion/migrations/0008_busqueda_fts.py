@@ -0,0 +1,54 @@
+from django.db import migrations, OperationalError
+
+TOKENIZADOR = 'unicode61 remove_diacritics 2'
+
+
+def crear_indices(apps, schema_editor):
+    """ Tablas FTS5 de libros y lectores (solo SQLite), llenas con lo que ya hay. """
+    conexion = schema_editor.connection
+    if conexion.vendor != 'sqlite':
+        return
+    with conexion.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS gestion_libro_fts "
+                f"USING fts5(titulo, autor, estante, tokenize='{TOKENIZADOR}')"
+            )
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS gestion_lector_fts "
+                f"USING fts5(identificacion, usuario, tokenize='{TOKENIZADOR}')"
+            )
+        except OperationalError:
+            # SQLite compilado sin FTS5: se seguirá usando icontains
+            return
+        cursor.execute(
+            "INSERT INTO gestion_libro_fts (rowid, titulo, autor, estante) "
+            "SELECT l.id, l.titulo, a.nombre || ' ' || a.apellido, COALESCE(l.estante, '') "
+            "FROM gestion_libro l JOIN gestion_autor a ON a.id = l.autor_id"
+        )
+        cursor.execute(
+            "INSERT INTO gestion_lector_fts (rowid, identificacion, usuario) "
+            "SELECT l.user_id, l.identificacion, u.username "
+            "FROM gestion_lector l JOIN auth_user u ON u.id = l.user_id"
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor != 'sqlite':
+        return
+    with conexion.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS gestion_libro_fts")
+        cursor.execute("DROP TABLE IF EXISTS gestion_lector_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_controltarea'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
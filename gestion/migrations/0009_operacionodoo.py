@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_busqueda_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperacionOdoo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('isbn', models.CharField(max_length=20, unique=True)),
+                ('titulo', models.CharField(max_length=200)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviada', 'Enviada'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('odoo_id', models.IntegerField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Operación Odoo',
+                'verbose_name_plural': 'Operaciones Odoo',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='gestion_ope_estado_d63b40_idx')],
+            },
+        ),
+    ]
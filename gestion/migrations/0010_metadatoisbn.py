@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_operacionodoo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatoISBN',
+            fields=[
+                ('isbn', models.CharField(max_length=13, primary_key=True, serialize=False)),
+                ('datos', models.JSONField(blank=True, null=True)),
+                ('consultado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_uso', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Metadato ISBN',
+                'verbose_name_plural': 'Metadatos ISBN',
+            },
+        ),
+    ]
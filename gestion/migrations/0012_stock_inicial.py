@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def registrar_stock_inicial(apps, schema_editor):
+    Libro = apps.get_model('gestion', 'Libro')
+    MovimientoStock = apps.get_model('gestion', 'MovimientoStock')
+    MovimientoStock.objects.bulk_create(
+        [
+            MovimientoStock(libro_id=libro_id, cantidad=copias, tipo='inicial')
+            for libro_id, copias in Libro.objects.values_list('id', 'copias_disponibles').iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_movimientostock'),
+    ]
+
+    operations = [
+        migrations.RunPython(registrar_stock_inicial, migrations.RunPython.noop),
+    ]
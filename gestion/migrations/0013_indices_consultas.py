@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_stock_inicial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['titulo', 'id'], name='libro_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['copias_disponibles'], name='libro_copias_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('estante', django.db.models.expressions.RawSQL("''", ())), models.F('titulo'), models.F('id'), name='libro_estante_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(condition=models.Q(('pagada', False)), fields=['-monto'], name='multa_pendiente_monto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(condition=models.Q(('pagada', False)), fields=['id'], name='multa_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['devuelto', '-fecha_prestamo', '-id'], name='prestamo_orden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('devuelto', True)), fields=['-fecha_prestamo', '-id'], name='prestamo_devuelto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('devuelto', False)), fields=['fecha_devolucion_esperada', 'id'], name='prestamo_activo_idx'),
+        ),
+    ]
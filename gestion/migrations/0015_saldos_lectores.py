@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calcular_saldos(apps, schema_editor):
+    Multa = apps.get_model('gestion', 'Multa')
+    SaldoLector = apps.get_model('gestion', 'SaldoLector')
+    pendientes = Multa.objects.filter(pagada=False).values_list('prestamo__lector_id').annotate(
+        deuda=Sum('monto'), cantidad=Count('id')
+    ).order_by()
+    SaldoLector.objects.bulk_create(
+        [
+            SaldoLector(lector_id=lector_id, deuda=deuda, multas_pendientes=cantidad)
+            for lector_id, deuda, cantidad in pendientes.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_portadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoLector',
+            fields=[
+                ('lector', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo', serialize=False, to='gestion.lector')),
+                ('deuda', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('multas_pendientes', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Saldo de lector',
+                'verbose_name_plural': 'Saldos de lectores',
+                'indexes': [models.Index(condition=models.Q(('deuda__gt', 0)), fields=['-deuda', 'lector'], name='saldo_deuda_idx')],
+            },
+        ),
+        migrations.RunPython(calcular_saldos, migrations.RunPython.noop),
+    ]
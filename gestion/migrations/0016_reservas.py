@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_saldos_lectores'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='tipo',
+            field=models.CharField(choices=[('inicial', 'Stock inicial'), ('prestamo', 'Préstamo'), ('devolucion', 'Devolución'), ('ajuste', 'Ajuste de bodega'), ('importacion', 'Importación'), ('reserva', 'Reserva (copia apartada o liberada)')], max_length=12),
+        ),
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('en_espera', 'En espera'), ('apartada', 'Apartada'), ('entregada', 'Entregada'), ('cancelada', 'Cancelada'), ('vencida', 'Vencida')], default='en_espera', max_length=10)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('vence', models.DateTimeField(blank=True, null=True)),
+                ('lector', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='gestion.lector')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='gestion.libro')),
+                ('prestamo', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.prestamo')),
+            ],
+            options={
+                'verbose_name': 'Reserva',
+                'verbose_name_plural': 'Reservas',
+                'indexes': [models.Index(condition=models.Q(('estado', 'en_espera')), fields=['libro', 'id'], name='reserva_espera_idx'), models.Index(condition=models.Q(('estado', 'apartada')), fields=['vence'], name='reserva_apartada_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado__in', ['en_espera', 'apartada'])), fields=('libro', 'lector'), name='reserva_activa_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_reservas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestaCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=64, unique=True)),
+                ('archivo', models.CharField(max_length=500)),
+                ('formato', models.CharField(max_length=10)),
+                ('registros', models.PositiveIntegerField(default=0)),
+                ('libros', models.PositiveIntegerField(default=0)),
+                ('autores', models.PositiveIntegerField(default=0)),
+                ('omitidos', models.PositiveIntegerField(default=0)),
+                ('terminada', models.BooleanField(default=False)),
+                ('iniciada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actualizada', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Ingesta de catálogo',
+                'verbose_name_plural': 'Ingestas de catálogo',
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations, transaction, DatabaseError
+
+DOCUMENTO_LIBRO = (
+    "setweight(to_tsvector('gestion_es', l.titulo), 'A') || "
+    "setweight(to_tsvector('gestion_es', a.nombre || ' ' || a.apellido), 'B') || "
+    "setweight(to_tsvector('gestion_es', COALESCE(l.estante, '')), 'C')"
+)
+DOCUMENTO_LECTOR = "to_tsvector('gestion_es', l.identificacion || ' ' || u.username)"
+
+
+def crear_indices(apps, schema_editor):
+    """
+    En PostgreSQL: configuración 'gestion_es' ('spanish' sin tildes) y las tablas
+    de búsqueda con un tsvector por fila y su índice GIN, llenas con lo que ya hay.
+    """
+    conexion = schema_editor.connection
+    if conexion.vendor != 'postgresql':
+        return
+    with conexion.cursor() as cursor:
+        cursor.execute("CREATE TEXT SEARCH CONFIGURATION gestion_es (COPY = pg_catalog.spanish)")
+        try:
+            with transaction.atomic(using=conexion.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+                cursor.execute(
+                    "ALTER TEXT SEARCH CONFIGURATION gestion_es "
+                    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem"
+                )
+        except DatabaseError:
+            # Sin permiso para crear la extensión: se busca igual, pero distinguiendo tildes
+            pass
+        for tabla in ('gestion_libro_fts', 'gestion_lector_fts'):
+            cursor.execute(f"CREATE TABLE {tabla} (rowid integer PRIMARY KEY, documento tsvector NOT NULL)")
+            cursor.execute(f"CREATE INDEX {tabla}_idx ON {tabla} USING gin (documento)")
+        cursor.execute(
+            f"INSERT INTO gestion_libro_fts (rowid, documento) SELECT l.id, {DOCUMENTO_LIBRO} "
+            "FROM gestion_libro l JOIN gestion_autor a ON a.id = l.autor_id"
+        )
+        cursor.execute(
+            f"INSERT INTO gestion_lector_fts (rowid, documento) SELECT l.user_id, {DOCUMENTO_LECTOR} "
+            "FROM gestion_lector l JOIN auth_user u ON u.id = l.user_id"
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor != 'postgresql':
+        return
+    with conexion.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS gestion_libro_fts")
+        cursor.execute("DROP TABLE IF EXISTS gestion_lector_fts")
+        cursor.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS gestion_es")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0017_ingesta_catalogo'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
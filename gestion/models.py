@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -15,6 +18,13 @@ class Autor(models.Model):
     def __str__(self):
         return self.nombre_completo
 
+def estante_orden():
+    """
+    Estante para ordenar el inventario (sin estante = ''). El '' va como literal y no
+    como parámetro: solo así la consulta coincide con el índice 'libro_estante_idx'.
+    """
+    return Coalesce('estante', RawSQL("''", ()))
+
 class Libro(models.Model):
     titulo = models.CharField(max_length=200)
     autor = models.ForeignKey(Autor, on_delete=models.CASCADE)
@@ -34,6 +44,14 @@ class Libro(models.Model):
     
     class Meta:
         verbose_name_plural = "Libros"
+        indexes = [
+            # Catálogo y listado ordenados por título (paginación por cursor)
+            models.Index(fields=['titulo', 'id'], name='libro_titulo_idx'),
+            # Umbrales de stock: alertas de bodega (<= 2) y catálogo del lector (> 0)
+            models.Index(fields=['copias_disponibles'], name='libro_copias_idx'),
+            # Mismo orden que el inventario de bodega (los libros sin estante van primero)
+            models.Index(estante_orden(), 'titulo', 'id', name='libro_estante_idx'),
+        ]
 
 class Lector(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True) 
@@ -63,6 +81,20 @@ class Prestamo(models.Model):
     class Meta:
         verbose_name_plural = "Préstamos"
         ordering = ['devuelto', '-fecha_prestamo']
+        indexes = [
+            # Orden por defecto (Meta.ordering) sin tener que ordenar en cada consulta
+            models.Index(fields=['devuelto', '-fecha_prestamo', '-id'], name='prestamo_orden_idx'),
+            # Historial: Django filtra los booleanos como 'WHERE devuelto' y el índice anterior
+            # no sirve para esa condición; uno parcial sí
+            models.Index(
+                fields=['-fecha_prestamo', '-id'], condition=Q(devuelto=True), name='prestamo_devuelto_idx',
+            ),
+            # Solo los préstamos activos: vencidos, multas diarias y pestaña de activos
+            models.Index(
+                fields=['fecha_devolucion_esperada', 'id'], condition=Q(devuelto=False),
+                name='prestamo_activo_idx',
+            ),
+        ]
 
 class Multa(models.Model):
     prestamo = models.ForeignKey(Prestamo, on_delete=models.CASCADE)
@@ -74,4 +106,233 @@ class Multa(models.Model):
         return f"Multa de {self.prestamo.lector.user.username} - ${self.monto}"
 
     class Meta:
-        verbose_name_plural = "Multas"
\ No newline at end of file
+        verbose_name_plural = "Multas"
+        # Parciales: las multas pagadas (la gran mayoría con el tiempo) no ocupan estos índices
+        indexes = [
+            models.Index(fields=['-monto'], condition=Q(pagada=False), name='multa_pendiente_monto_idx'),
+            models.Index(fields=['id'], condition=Q(pagada=False), name='multa_pendiente_idx'),
+        ]
+
+# --- SALDO DE CADA LECTOR (LIBRO MAYOR DE MULTAS PENDIENTES) ---
+class SaldoLector(models.Model):
+    """
+    Suma de las multas pendientes de cada lector, mantenida por gestion.saldos en
+    la misma transacción que crea, actualiza o cobra las multas.
+    """
+    lector = models.OneToOneField(Lector, on_delete=models.CASCADE, primary_key=True, related_name='saldo')
+    deuda = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    multas_pendientes = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.lector_id}: ${self.deuda} ({self.multas_pendientes} multas)"
+
+    class Meta:
+        verbose_name = "Saldo de lector"
+        verbose_name_plural = "Saldos de lectores"
+        indexes = [
+            # Facturación y morosos del panel: solo los lectores que deben algo, de mayor a menor deuda
+            models.Index(fields=['-deuda', 'lector'], condition=Q(deuda__gt=0), name='saldo_deuda_idx'),
+        ]
+
+# --- CONTROL DE TAREAS PROGRAMADAS (MARCA DE ÚLTIMA EJECUCIÓN) ---
+class ControlTarea(models.Model):
+    nombre = models.CharField(max_length=50, unique=True)
+    ultima_fecha = models.DateField(null=True, blank=True, help_text="Último día procesado por la tarea")
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.ultima_fecha or 'nunca'})"
+
+    class Meta:
+        verbose_name = "Control de tarea"
+        verbose_name_plural = "Control de tareas"
+
+
+# --- COLA DE ENVÍOS A ODOO (OUTBOX) ---
+class OperacionOdoo(models.Model):
+    PENDIENTE = 'pendiente'
+    ENVIADA = 'enviada'
+    FALLIDA = 'fallida'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (ENVIADA, 'Enviada'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    # El ISBN es la clave de idempotencia: un libro se envía una sola vez
+    isbn = models.CharField(max_length=20, unique=True)
+    titulo = models.CharField(max_length=200)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    odoo_id = models.IntegerField(null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.isbn} - {self.titulo} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Operación Odoo"
+        verbose_name_plural = "Operaciones Odoo"
+        indexes = [models.Index(fields=['estado', 'proximo_intento'])]
+
+
+# --- CACHÉ DE METADATOS DE OPEN LIBRARY ---
+class MetadatoISBN(models.Model):
+    isbn = models.CharField(max_length=13, primary_key=True)
+    # None = Open Library no conoce el ISBN (caché negativa)
+    datos = models.JSONField(null=True, blank=True)
+    consultado = models.DateTimeField(default=timezone.now)
+    ultimo_uso = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.isbn
+
+    class Meta:
+        verbose_name = "Metadato ISBN"
+        verbose_name_plural = "Metadatos ISBN"
+
+
+# --- MOVIMIENTOS DE STOCK (REGISTRO DE SOLO INSERCIÓN) ---
+class MovimientoStock(models.Model):
+    INICIAL = 'inicial'
+    PRESTAMO = 'prestamo'
+    DEVOLUCION = 'devolucion'
+    AJUSTE = 'ajuste'
+    IMPORTACION = 'importacion'
+    RESERVA = 'reserva'
+    TIPOS = [
+        (INICIAL, 'Stock inicial'),
+        (PRESTAMO, 'Préstamo'),
+        (DEVOLUCION, 'Devolución'),
+        (AJUSTE, 'Ajuste de bodega'),
+        (IMPORTACION, 'Importación'),
+        (RESERVA, 'Reserva (copia apartada o liberada)'),
+    ]
+
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='movimientos')
+    cantidad = models.IntegerField(help_text="Positivo entra a bodega, negativo sale")
+    tipo = models.CharField(max_length=12, choices=TIPOS)
+    prestamo = models.ForeignKey(Prestamo, on_delete=models.SET_NULL, null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} - {self.libro_id}"
+
+    class Meta:
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+
+
+# --- RESERVAS Y LISTA DE ESPERA ---
+class Reserva(models.Model):
+    """
+    Reserva de un libro. Si hay stock se aparta una copia (sale de copias_disponibles
+    hasta que el lector la retira o vence el plazo); si no, el lector queda en la
+    lista de espera del libro, atendida por orden de llegada (id) al volver copias.
+    """
+    EN_ESPERA = 'en_espera'
+    APARTADA = 'apartada'
+    ENTREGADA = 'entregada'
+    CANCELADA = 'cancelada'
+    VENCIDA = 'vencida'
+    ESTADOS = [
+        (EN_ESPERA, 'En espera'),
+        (APARTADA, 'Apartada'),
+        (ENTREGADA, 'Entregada'),
+        (CANCELADA, 'Cancelada'),
+        (VENCIDA, 'Vencida'),
+    ]
+    ACTIVAS = (EN_ESPERA, APARTADA)
+
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='reservas')
+    lector = models.ForeignKey(Lector, on_delete=models.CASCADE, related_name='reservas')
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=EN_ESPERA)
+    creada = models.DateTimeField(default=timezone.now)
+    # Hasta cuándo se guarda la copia apartada
+    vence = models.DateTimeField(null=True, blank=True)
+    prestamo = models.OneToOneField(Prestamo, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.libro_id} para {self.lector_id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Reserva"
+        verbose_name_plural = "Reservas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['libro', 'lector'], condition=Q(estado__in=['en_espera', 'apartada']),
+                name='reserva_activa_unica',
+            ),
+        ]
+        indexes = [
+            # Lista de espera de cada libro en orden de llegada: el siguiente y la posición
+            # de un lector son rangos de este índice, sin recorrer las reservas ya atendidas
+            models.Index(fields=['libro', 'id'], condition=Q(estado='en_espera'), name='reserva_espera_idx'),
+            # Copias apartadas cuyo plazo venció
+            models.Index(fields=['vence'], condition=Q(estado='apartada'), name='reserva_apartada_idx'),
+        ]
+
+
+# --- PORTADAS LOCALES (MINIATURAS) ---
+class Portada(models.Model):
+    PENDIENTE = 'pendiente'
+    LISTA = 'lista'
+    FALLIDA = 'fallida'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (LISTA, 'Lista'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    libro = models.OneToOneField(Libro, on_delete=models.CASCADE, primary_key=True, related_name='portada')
+    url_origen = models.URLField(max_length=500)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    # Huella (sha256) de la imagen original: va en la URL de las miniaturas, que nunca cambian
+    huella = models.CharField(max_length=16, blank=True)
+    ancho = models.PositiveIntegerField(null=True, blank=True)
+    alto = models.PositiveIntegerField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.libro_id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Portada"
+        verbose_name_plural = "Portadas"
+        indexes = [models.Index(fields=['estado', 'proximo_intento'], name='portada_cola_idx')]
+
+
+# --- INGESTA DE CATÁLOGOS (PUNTO DE CONTROL) ---
+class IngestaCatalogo(models.Model):
+    """
+    Avance de la carga de un volcado de catálogo (ver gestion.ingesta). Se guarda
+    en la misma transacción que cada lote: si la carga se corta, se retoma desde
+    el último lote confirmado sin duplicar libros.
+    """
+    # sha256 del archivo completo
+    huella = models.CharField(max_length=64, unique=True)
+    archivo = models.CharField(max_length=500)
+    formato = models.CharField(max_length=10)
+    # Registros leídos del archivo (confirmados): el punto de control
+    registros = models.PositiveIntegerField(default=0)
+    libros = models.PositiveIntegerField(default=0)
+    autores = models.PositiveIntegerField(default=0)
+    omitidos = models.PositiveIntegerField(default=0)
+    terminada = models.BooleanField(default=False)
+    iniciada = models.DateTimeField(default=timezone.now)
+    actualizada = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.archivo} ({self.registros} registros)"
+
+    class Meta:
+        verbose_name = "Ingesta de catálogo"
+        verbose_name_plural = "Ingestas de catálogo"
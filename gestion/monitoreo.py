@@ -0,0 +1,249 @@
+"""
+Métricas por vista sin servicios externos.
+
+El middleware mide cada petición (tiempo total, tiempo y cantidad de consultas
+SQL, consultas repetidas y tiempo de plantillas) y guarda las últimas muestras
+de cada vista en un búfer circular en memoria. Los datos son de cada proceso:
+con varios workers, cada uno ve solo sus propias peticiones.
+
+Con ?profile=1 (solo staff) la respuesta se reemplaza por el resumen de
+cProfile de esa petición.
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.template.base import Template
+
+MUESTRAS_POR_VISTA = 200
+LINEAS_PERFIL = 40
+# Una vista "crece con los datos" si sus consultas suben a la par del tamaño de la respuesta
+CORRELACION_SOSPECHOSA = 0.8
+MINIMO_MUESTRAS = 5
+# Misma SQL (distintos parámetros) repetida tantas veces en una petición: patrón N+1
+REPETICIONES_SOSPECHOSAS = 10
+
+_medicion = contextvars.ContextVar('medicion_monitoreo', default=None)
+_muestras = {}
+_candado = threading.Lock()
+
+
+class Medicion:
+    """ Lo que se acumula durante una petición. """
+    def __init__(self):
+        self.db = 0.0
+        self.plantillas = 0.0
+        self.en_plantilla = False
+        self.sql = Counter()
+        self.exactas = Counter()
+
+    @property
+    def consultas(self):
+        return sum(self.sql.values())
+
+    @property
+    def duplicadas(self):
+        """ Consultas idénticas (misma SQL y mismos parámetros) ejecutadas más de una vez. """
+        return sum(veces - 1 for veces in self.exactas.values())
+
+    @property
+    def similares(self):
+        """ Ejecuciones extra de la misma SQL con cualquier parámetro (incluye las duplicadas). """
+        return sum(veces - 1 for veces in self.sql.values())
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if medicion is not None:
+            medicion.db += time.perf_counter() - inicio
+            medicion.sql[sql] += 1
+            medicion.exactas[(sql, repr(params))] += 1
+
+
+def _instrumentar_plantillas():
+    """ Envuelve Template.render una sola vez; las plantillas incluidas no se cuentan dos veces. """
+    original = Template.render
+    if getattr(original, 'monitoreado', False):
+        return
+
+    @functools.wraps(original)
+    def render(self, context):
+        medicion = _medicion.get()
+        if medicion is None or medicion.en_plantilla:
+            return original(self, context)
+        medicion.en_plantilla = True
+        inicio = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            medicion.plantillas += time.perf_counter() - inicio
+            medicion.en_plantilla = False
+
+    render.monitoreado = True
+    Template.render = render
+
+
+def registrar(vista, muestra):
+    maximo = getattr(settings, 'MONITOREO_MUESTRAS', MUESTRAS_POR_VISTA)
+    with _candado:
+        if vista not in _muestras:
+            _muestras[vista] = deque(maxlen=maximo)
+        _muestras[vista].append(muestra)
+
+
+def reiniciar():
+    with _candado:
+        _muestras.clear()
+
+
+def percentiles(valores):
+    if len(valores) == 1:
+        return dict.fromkeys(('p50', 'p90', 'p95', 'p99'), valores[0])
+    cortes = statistics.quantiles(valores, n=100, method='inclusive')
+    return {'p50': cortes[49], 'p90': cortes[89], 'p95': cortes[94], 'p99': cortes[98]}
+
+
+def crece_con_los_datos(muestras):
+    pares = [(m['consultas'], m['bytes']) for m in muestras if m['bytes'] is not None]
+    if len(pares) < MINIMO_MUESTRAS or len({consultas for consultas, _ in pares}) < 3:
+        return False
+    try:
+        return statistics.correlation(*zip(*pares)) >= CORRELACION_SOSPECHOSA
+    except statistics.StatisticsError:
+        return False
+
+
+def resumen():
+    """ Estadísticas por vista, de la más lenta (p95) a la más rápida. """
+    with _candado:
+        copia = {vista: list(muestras) for vista, muestras in _muestras.items()}
+    vistas = []
+    for vista, muestras in copia.items():
+        tiempos = percentiles([m['tiempo_ms'] for m in muestras])
+        alertas = []
+        if crece_con_los_datos(muestras):
+            alertas.append("las consultas crecen con el tamaño de la respuesta")
+        if max(m['similares'] for m in muestras) >= REPETICIONES_SOSPECHOSAS:
+            alertas.append("la misma consulta se repite muchas veces (posible N+1)")
+        vistas.append({
+            'vista': vista,
+            'peticiones': len(muestras),
+            'tiempo_ms': {clave: round(valor, 2) for clave, valor in tiempos.items()},
+            'db_ms': round(statistics.fmean(m['db_ms'] for m in muestras), 2),
+            'plantillas_ms': round(statistics.fmean(m['plantillas_ms'] for m in muestras), 2),
+            'consultas': {
+                'media': round(statistics.fmean(m['consultas'] for m in muestras), 1),
+                'max': max(m['consultas'] for m in muestras),
+            },
+            'duplicadas_max': max(m['duplicadas'] for m in muestras),
+            'alertas': alertas,
+        })
+    return sorted(vistas, key=lambda datos: datos['tiempo_ms']['p95'], reverse=True)
+
+
+def _respuesta_perfil(perfil):
+    salida = io.StringIO()
+    estadisticas = pstats.Stats(perfil, stream=salida)
+    estadisticas.strip_dirs().sort_stats('cumulative').print_stats(LINEAS_PERFIL)
+    return HttpResponse(salida.getvalue(), content_type='text/plain; charset=utf-8')
+
+
+class MonitoreoMiddleware:
+    """
+    Debe ir después de AuthenticationMiddleware (el perfil solo lo pueden pedir usuarios staff).
+    Admite los dos modos: con ASGI no obliga a Django a pasar las vistas asíncronas a un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+        _instrumentar_plantillas()
+
+    def _perfil(self, request):
+        usuario = getattr(request, 'user', None)
+        if request.GET.get('profile') == '1' and usuario is not None and usuario.is_staff:
+            return cProfile.Profile()
+        return None
+
+    @staticmethod
+    def _envolver_conexiones(pila):
+        """ Las conexiones son de cada hilo: solo se miden las del hilo que llama. """
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(_medir_consulta))
+        return pila
+
+    def _terminar(self, request, respuesta, medicion, tiempo, perfil):
+        coincidencia = getattr(request, 'resolver_match', None)
+        registrar(coincidencia.view_name if coincidencia else '(sin ruta)', {
+            'tiempo_ms': tiempo * 1000,
+            'db_ms': medicion.db * 1000,
+            'plantillas_ms': medicion.plantillas * 1000,
+            'consultas': medicion.consultas,
+            'duplicadas': medicion.duplicadas,
+            'similares': medicion.similares,
+            'bytes': None if respuesta.streaming else len(respuesta.content),
+        })
+        if perfil is not None:
+            return _respuesta_perfil(perfil)
+        return respuesta
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        perfil = self._perfil(request)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                self._envolver_conexiones(pila)
+                if perfil is not None:
+                    respuesta = perfil.runcall(self.get_response, request)
+                else:
+                    respuesta = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        return self._terminar(request, respuesta, medicion, time.perf_counter() - inicio, perfil)
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        # request.user es perezoso y consultarlo toca la base de datos
+        perfil = await sync_to_async(self._perfil)(request)
+        # Las vistas síncronas y el ORM de las asíncronas corren en el hilo de sync_to_async
+        # de esta petición (thread_sensitive), no en el del event loop: ahí van los envoltorios
+        pila = await sync_to_async(self._envolver_conexiones)(ExitStack())
+        inicio = time.perf_counter()
+        try:
+            if perfil is not None:
+                # Con ASGI el perfil puede incluir trabajo de otras peticiones del mismo event loop
+                perfil.enable()
+                try:
+                    respuesta = await self.get_response(request)
+                finally:
+                    perfil.disable()
+            else:
+                respuesta = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+            _medicion.reset(token)
+        return self._terminar(request, respuesta, medicion, time.perf_counter() - inicio, perfil)
@@ -0,0 +1,170 @@
+"""
+Sincronización con Odoo mediante una cola (outbox).
+
+La vista solo registra la operación en OperacionOdoo dentro de la misma
+transacción que guarda el libro; el comando 'sincronizar_odoo' la envía
+después, reutilizando una conexión autenticada y reintentando con espera
+exponencial cuando Odoo no responde.
+"""
+import http.client
+import xmlrpc.client
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import OperacionOdoo
+
+MODELO_ODOO = 'biblioteca.libro'
+TAMANO_LOTE = 50
+MAX_INTENTOS = 8
+ESPERA_BASE = 30        # segundos antes del primer reintento
+ESPERA_MAXIMA = 60 * 60
+
+
+def encolar_libro(titulo, isbn):
+    """ Registra (o reactiva) el envío del libro. Debe llamarse dentro de la transacción del guardado. """
+    operacion, creada = OperacionOdoo.objects.get_or_create(isbn=isbn, defaults={'titulo': titulo})
+    if not creada and operacion.estado != OperacionOdoo.ENVIADA:
+        operacion.titulo = titulo
+        operacion.estado = OperacionOdoo.PENDIENTE
+        operacion.intentos = 0
+        operacion.proximo_intento = timezone.now()
+        operacion.save()
+    return operacion
+
+
+def encolar_libros(pares):
+    """ Versión en bloque de encolar_libro para una lista de (titulo, isbn). """
+    titulos = dict((isbn, titulo) for titulo, isbn in pares)
+    if not titulos:
+        return
+    OperacionOdoo.objects.bulk_create(
+        [OperacionOdoo(isbn=isbn, titulo=titulo) for isbn, titulo in titulos.items()],
+        ignore_conflicts=True, batch_size=500,
+    )
+    # Las que ya estaban en cola se reactivan con el título nuevo, como en encolar_libro
+    ahora = timezone.now()
+    reactivadas = list(OperacionOdoo.objects.filter(isbn__in=titulos).exclude(estado=OperacionOdoo.ENVIADA))
+    for operacion in reactivadas:
+        operacion.titulo = titulos[operacion.isbn]
+        operacion.estado = OperacionOdoo.PENDIENTE
+        operacion.intentos = 0
+        operacion.proximo_intento = ahora
+    OperacionOdoo.objects.bulk_update(
+        reactivadas, ['titulo', 'estado', 'intentos', 'proximo_intento'], batch_size=500
+    )
+
+
+class TransporteConLimite(xmlrpc.client.Transport):
+    """ Transporte XML-RPC con tiempo máximo de espera (el de Python no tiene). """
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conexion = super().make_connection(host)
+        conexion.timeout = self.timeout
+        return conexion
+
+
+class TransporteSeguroConLimite(xmlrpc.client.SafeTransport):
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conexion = super().make_connection(host)
+        conexion.timeout = self.timeout
+        return conexion
+
+
+class ClienteOdoo:
+    """ Conexión persistente: se autentica una vez y reutiliza el uid. """
+    def __init__(self, url=None, db=None, usuario=None, clave=None, timeout=None):
+        config = settings.ODOO
+        self.url = url or config['URL']
+        self.db = db or config['DB']
+        self.usuario = usuario or config['USER']
+        self.clave = clave or config['PASSWORD']
+        self.timeout = timeout or config['TIMEOUT']
+        self._uid = None
+        self.common = self._proxy('common')
+        self.models = self._proxy('object')
+
+    def _proxy(self, servicio):
+        clase = TransporteSeguroConLimite if self.url.startswith('https') else TransporteConLimite
+        return xmlrpc.client.ServerProxy(
+            f'{self.url}/xmlrpc/2/{servicio}', transport=clase(self.timeout), allow_none=True
+        )
+
+    @property
+    def uid(self):
+        if self._uid is None:
+            uid = self.common.authenticate(self.db, self.usuario, self.clave, {})
+            if not uid:
+                raise PermissionError("Odoo rechazó las credenciales")
+            self._uid = uid
+        return self._uid
+
+    def ejecutar(self, metodo, *args, **kwargs):
+        return self.models.execute_kw(self.db, self.uid, self.clave, MODELO_ODOO, metodo, list(args), kwargs)
+
+    def crear_libro(self, titulo, isbn):
+        # Si ya existe (un envío anterior que no llegó a confirmarse) se reutiliza
+        existentes = self.ejecutar('search', [['isbn', '=', isbn]], limit=1)
+        if existentes:
+            return existentes[0]
+        # Solo enviamos los campos que Odoo acepta para evitar 'ValueError: Invalid field'
+        return self.ejecutar('create', {'nombre_libro': titulo, 'isbn': isbn})
+
+
+def espera_reintento(intentos):
+    return timedelta(seconds=min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA))
+
+
+def procesar_pendientes(cliente=None, lote=TAMANO_LOTE):
+    """
+    Envía un lote de operaciones pendientes cuyo reintento ya venció.
+    Pensado para un único proceso trabajador. Devuelve (enviadas, con_error).
+    """
+    ahora = timezone.now()
+    pendientes = list(OperacionOdoo.objects.filter(
+        estado=OperacionOdoo.PENDIENTE, proximo_intento__lte=ahora
+    ).order_by('proximo_intento', 'id')[:lote])
+    if not pendientes:
+        return 0, 0
+
+    cliente = cliente or ClienteOdoo()
+    enviadas = errores = 0
+    for operacion in pendientes:
+        try:
+            operacion.odoo_id = cliente.crear_libro(operacion.titulo, operacion.isbn)
+        except (OSError, http.client.HTTPException, xmlrpc.client.Error) as e:
+            errores += 1
+            operacion.intentos += 1
+            operacion.ultimo_error = str(e)
+            if operacion.intentos >= MAX_INTENTOS:
+                operacion.estado = OperacionOdoo.FALLIDA
+            else:
+                operacion.proximo_intento = timezone.now() + espera_reintento(operacion.intentos)
+            if isinstance(e, OSError):
+                # Odoo no responde (o rechaza el acceso): no tiene sentido seguir con el lote
+                operacion.save()
+                break
+        else:
+            enviadas += 1
+            operacion.estado = OperacionOdoo.ENVIADA
+            operacion.ultimo_error = ''
+        operacion.save()
+    return enviadas, errores
+
+
+def estado_cola():
+    """ Cantidad de operaciones por estado y las últimas fallas. """
+    conteos = dict(OperacionOdoo.objects.values_list('estado').annotate(total=Count('id')).order_by())
+    fallas = OperacionOdoo.objects.exclude(ultimo_error='').exclude(
+        estado=OperacionOdoo.ENVIADA
+    ).order_by('-actualizado')[:10]
+    return conteos, fallas
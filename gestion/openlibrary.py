@@ -0,0 +1,266 @@
+"""
+Cliente de Open Library para importar libros por ISBN.
+
+Usa una sola sesión HTTP (conexiones reutilizadas), pide varios ISBN por
+llamada con el parámetro 'bibkeys' y reparte los lotes entre unos pocos hilos.
+Las respuestas se guardan en MetadatoISBN, así la vista previa y la
+confirmación de una importación (y las búsquedas repetidas) no vuelven a la red.
+
+Las vistas asíncronas usan la variante *_async: httpx en lugar de requests y
+los lotes concurrentes en el mismo event loop, sin ocupar hilos mientras esperan.
+"""
+import asyncio
+import re
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import certifi
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import MetadatoISBN
+
+ISBNS_POR_LLAMADA = 50
+HILOS = 4
+TIMEOUT = 10
+
+# --- CACHÉ DE METADATOS ---
+DURACION_ENCONTRADO = timedelta(days=30)
+DURACION_NO_ENCONTRADO = timedelta(days=1)
+MAX_METADATOS = 50000
+# Solo se reescribe 'ultimo_uso' si es más viejo que esto (evita una escritura por acierto)
+PRECISION_USO = timedelta(hours=1)
+CLAVE_ACIERTOS = 'gestion:isbn:aciertos'
+CLAVE_FALLOS = 'gestion:isbn:fallos'
+
+_sesion = None
+
+
+def sesion():
+    global _sesion
+    if _sesion is None:
+        _sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=HILOS, pool_maxsize=HILOS)
+        _sesion.mount('https://', adaptador)
+        _sesion.mount('http://', adaptador)
+    return _sesion
+
+
+def limpiar_isbn(texto):
+    return re.sub(r'[^0-9Xx]', '', texto or '').upper()
+
+
+def leer_isbns(texto):
+    """ Extrae ISBN únicos (en orden) de un texto pegado o de un CSV. """
+    vistos = []
+    for trozo in re.split(r'[\s,;]+', texto or ''):
+        isbn = limpiar_isbn(trozo)
+        if len(isbn) in (10, 13) and isbn not in vistos:
+            vistos.append(isbn)
+    return vistos
+
+
+def _parametros_lote(isbns):
+    return {
+        'bibkeys': ','.join(f'ISBN:{isbn}' for isbn in isbns),
+        'format': 'json', 'jscmd': 'data',
+    }
+
+
+def _encontrados(isbns, data):
+    return {isbn: data[f'ISBN:{isbn}'] for isbn in isbns if f'ISBN:{isbn}' in data}
+
+
+def consultar_lote(isbns):
+    """ Una llamada a la API para varios ISBN. Devuelve {isbn: info} solo con los encontrados. """
+    url = f"{settings.OPENLIBRARY_URL}/api/books"
+    respuesta = sesion().get(url, params=_parametros_lote(isbns), timeout=TIMEOUT)
+    respuesta.raise_for_status()
+    return _encontrados(isbns, respuesta.json())
+
+
+def consultar_api(isbns, por_llamada=ISBNS_POR_LLAMADA, hilos=HILOS):
+    """
+    Consulta muchos ISBN en la API, en lotes concurrentes.
+    Devuelve (encontrados, errores): {isbn: info} y {isbn: mensaje} para los lotes que fallaron.
+    """
+    lotes = [isbns[i:i + por_llamada] for i in range(0, len(isbns), por_llamada)]
+    encontrados, errores = {}, {}
+    if not lotes:
+        return encontrados, errores
+    with ThreadPoolExecutor(max_workers=min(hilos, len(lotes))) as ejecutor:
+        futuros = {ejecutor.submit(consultar_lote, lote): lote for lote in lotes}
+        for futuro, lote in futuros.items():
+            try:
+                encontrados.update(futuro.result())
+            except (requests.RequestException, ValueError) as e:
+                errores.update({isbn: str(e) for isbn in lote})
+    return encontrados, errores
+
+
+def _contar(clave, cantidad):
+    if cantidad:
+        try:
+            cache.incr(clave, cantidad)
+        except ValueError:
+            cache.set(clave, cantidad, None)
+
+
+def estadisticas_cache():
+    return {
+        'aciertos': cache.get(CLAVE_ACIERTOS, 0),
+        'fallos': cache.get(CLAVE_FALLOS, 0),
+        'guardados': MetadatoISBN.objects.count(),
+    }
+
+
+def leer_cache(isbns):
+    """ Devuelve ({isbn: info}, {isbns desconocidos}) con las entradas vigentes de la caché. """
+    ahora = timezone.now()
+    encontrados, desconocidos, usados = {}, set(), []
+    for metadato in MetadatoISBN.objects.filter(isbn__in=isbns):
+        duracion = DURACION_ENCONTRADO if metadato.datos is not None else DURACION_NO_ENCONTRADO
+        if metadato.consultado + duracion < ahora:
+            continue
+        if metadato.datos is None:
+            desconocidos.add(metadato.isbn)
+        else:
+            encontrados[metadato.isbn] = metadato.datos
+        if metadato.ultimo_uso + PRECISION_USO < ahora:
+            usados.append(metadato.isbn)
+    if usados:
+        MetadatoISBN.objects.filter(isbn__in=usados).update(ultimo_uso=ahora)
+    return encontrados, desconocidos
+
+
+def guardar_cache(isbns, encontrados):
+    """ Guarda el resultado de la API (también los ISBN que no existen) y aplica el límite LRU. """
+    ahora = timezone.now()
+    MetadatoISBN.objects.bulk_create(
+        [MetadatoISBN(isbn=isbn, datos=encontrados.get(isbn), consultado=ahora, ultimo_uso=ahora) for isbn in isbns],
+        update_conflicts=True, unique_fields=['isbn'], update_fields=['datos', 'consultado', 'ultimo_uso'],
+        batch_size=500,
+    )
+    sobrantes = MetadatoISBN.objects.count() - MAX_METADATOS
+    if sobrantes > 0:
+        # Se descartan los menos usados recientemente
+        viejos = MetadatoISBN.objects.order_by('ultimo_uso').values_list('isbn', flat=True)[:sobrantes]
+        MetadatoISBN.objects.filter(isbn__in=list(viejos)).delete()
+
+
+def consultar_isbns(isbns, por_llamada=ISBNS_POR_LLAMADA, hilos=HILOS):
+    """
+    Como consultar_api, pero primero busca en la caché y solo pide a la red lo que falta.
+    Los errores de red no se guardan, para que se reintenten la próxima vez.
+    """
+    encontrados, desconocidos = leer_cache(isbns)
+    faltantes = [isbn for isbn in isbns if isbn not in encontrados and isbn not in desconocidos]
+    _contar(CLAVE_ACIERTOS, len(isbns) - len(faltantes))
+    _contar(CLAVE_FALLOS, len(faltantes))
+    if not faltantes:
+        return encontrados, {}
+
+    nuevos, errores = consultar_api(faltantes, por_llamada, hilos)
+    guardar_cache([isbn for isbn in faltantes if isbn not in errores], nuevos)
+    encontrados.update(nuevos)
+    return encontrados, errores
+
+
+# --- VARIANTE ASÍNCRONA (VISTAS ASGI) ---
+_contexto_ssl = None
+
+
+def cliente_async():
+    """
+    Un cliente por petición: un AsyncClient no se puede compartir entre event loops.
+    El contexto SSL sí se reutiliza; crearlo (leer los certificados) cuesta más que la petición.
+    """
+    global _contexto_ssl
+    if _contexto_ssl is None:
+        _contexto_ssl = ssl.create_default_context(cafile=certifi.where())
+    return httpx.AsyncClient(
+        timeout=TIMEOUT, limits=httpx.Limits(max_connections=HILOS), follow_redirects=True, verify=_contexto_ssl,
+    )
+
+
+async def consultar_lote_async(cliente, isbns):
+    url = f"{settings.OPENLIBRARY_URL}/api/books"
+    # wait_for pone un plazo total; el timeout de httpx solo limita cada lectura
+    respuesta = await asyncio.wait_for(cliente.get(url, params=_parametros_lote(isbns)), TIMEOUT)
+    respuesta.raise_for_status()
+    return _encontrados(isbns, respuesta.json())
+
+
+async def consultar_api_async(isbns, por_llamada=ISBNS_POR_LLAMADA, concurrencia=HILOS):
+    """ Como consultar_api, con los lotes en paralelo (como mucho 'concurrencia' a la vez). """
+    lotes = [isbns[i:i + por_llamada] for i in range(0, len(isbns), por_llamada)]
+    encontrados, errores = {}, {}
+    if not lotes:
+        return encontrados, errores
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def consultar(cliente, lote):
+        async with semaforo:
+            return await consultar_lote_async(cliente, lote)
+
+    async with cliente_async() as cliente:
+        resultados = await asyncio.gather(*(consultar(cliente, lote) for lote in lotes), return_exceptions=True)
+    for lote, resultado in zip(lotes, resultados):
+        if isinstance(resultado, (httpx.HTTPError, TimeoutError, ValueError)):
+            errores.update({isbn: str(resultado) or "tiempo de espera agotado" for isbn in lote})
+        elif isinstance(resultado, BaseException):
+            raise resultado
+        else:
+            encontrados.update(resultado)
+    return encontrados, errores
+
+
+async def _contar_async(clave, cantidad):
+    if cantidad:
+        try:
+            await cache.aincr(clave, cantidad)
+        except ValueError:
+            await cache.aset(clave, cantidad, None)
+
+
+async def consultar_isbns_async(isbns, por_llamada=ISBNS_POR_LLAMADA, concurrencia=HILOS):
+    """ Como consultar_isbns; la caché en MetadatoISBN se lee y escribe con sync_to_async. """
+    encontrados, desconocidos = await sync_to_async(leer_cache)(isbns)
+    faltantes = [isbn for isbn in isbns if isbn not in encontrados and isbn not in desconocidos]
+    await _contar_async(CLAVE_ACIERTOS, len(isbns) - len(faltantes))
+    await _contar_async(CLAVE_FALLOS, len(faltantes))
+    if not faltantes:
+        return encontrados, {}
+
+    nuevos, errores = await consultar_api_async(faltantes, por_llamada, concurrencia)
+    await sync_to_async(guardar_cache)([isbn for isbn in faltantes if isbn not in errores], nuevos)
+    encontrados.update(nuevos)
+    return encontrados, errores
+
+
+def datos_libro(isbn, info):
+    """ Convierte la respuesta de Open Library al formato que usan las vistas. """
+    nombres_autores = [a['name'] for a in info.get('authors', [])]
+    anio_entero = timezone.now().year
+    digitos = ''.join(filter(str.isdigit, info.get('publish_date', '')))[:4]
+    if digitos:
+        anio_entero = int(digitos)
+    return {
+        'isbn': isbn, 'titulo': info.get('title'),
+        'autores': ", ".join(nombres_autores),
+        'autor_principal': nombres_autores[0] if nombres_autores else "Autor Desconocido",
+        'paginas': info.get('number_of_pages', 0),
+        'portada': info.get('cover', {}).get('large', ''),
+        'anio': anio_entero,
+    }
+
+
+def separar_nombre(nombre_completo):
+    partes = nombre_completo.split(' ', 1)
+    return partes[0], (partes[1] if len(partes) > 1 else " ")
@@ -0,0 +1,180 @@
+"""
+Paginación por cursor (keyset): en lugar de OFFSET se filtra por los valores de
+la última fila mostrada, así la página 1000 cuesta lo mismo que la primera.
+El orden debe ser estable, por eso siempre termina en un campo único (id/pk).
+
+El admin, que necesita números de página, usa PaginadorEstimado: el total sale
+de las estadísticas de la base en lugar de un COUNT(*) de la tabla entera.
+"""
+import base64
+import json
+from functools import cached_property
+
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Max, Q, QuerySet
+from rest_framework.pagination import CursorPagination
+
+TAMANO_PAGINA = 50
+# Hasta aquí se cuenta exacto; por encima el total del admin es una estimación
+LIMITE_CONTEO = 10_000
+
+
+def codificar_cursor(valores):
+    texto = json.dumps(valores, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def decodificar_cursor(cursor, cantidad):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        return None
+    return valores
+
+
+def condicion_siguientes(orden, valores):
+    """ Filtro 'después de la fila (valores)' respetando la dirección de cada campo. """
+    condicion = Q()
+    iguales = Q()
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicion |= iguales & Q(**{f'{nombre}__{operador}': valor})
+        iguales &= Q(**{nombre: valor})
+    return condicion
+
+
+class Pagina:
+    """
+    Se evalúa en el primer acceso: si la plantilla sirve el listado desde un
+    fragmento en caché, la consulta no llega a ejecutarse.
+    """
+    def __init__(self, cargar, url_primera=None):
+        self._cargar = cargar
+        self.url_primera = url_primera
+
+    @cached_property
+    def _datos(self):
+        return self._cargar()
+
+    @property
+    def objetos(self):
+        return self._datos[0]
+
+    @property
+    def url_siguiente(self):
+        return self._datos[1]
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+    @property
+    def paginada(self):
+        return bool(self.url_siguiente or self.url_primera)
+
+
+def _url_con(request, parametro, valor):
+    datos = request.GET.copy()
+    datos.pop(parametro, None)
+    if valor:
+        datos[parametro] = valor
+    return f'?{datos.urlencode()}' if datos else '?'
+
+
+def paginar(request, queryset, orden, parametro='cursor', tamano=TAMANO_PAGINA):
+    """
+    Devuelve una Pagina con hasta 'tamano' objetos de 'queryset' ordenados por 'orden'.
+    El cursor viaja en request.GET[parametro]; si es inválido se empieza desde el inicio.
+    """
+    orden = list(orden)
+    queryset = queryset.order_by(*orden)
+    cursor = request.GET.get(parametro)
+    valores = decodificar_cursor(cursor, len(orden)) if cursor else None
+    if valores is not None:
+        queryset = queryset.filter(condicion_siguientes(orden, valores))
+
+    def cargar():
+        objetos = list(queryset[:tamano + 1])
+        url_siguiente = None
+        if len(objetos) > tamano:
+            objetos = objetos[:tamano]
+            ultimo = objetos[-1]
+            siguiente = codificar_cursor([getattr(ultimo, campo.lstrip('-')) for campo in orden])
+            url_siguiente = _url_con(request, parametro, siguiente)
+        return objetos, url_siguiente
+
+    url_primera = _url_con(request, parametro, None) if valores is not None else None
+    return Pagina(cargar, url_primera)
+
+
+class PaginacionCursor(CursorPagination):
+    """ La misma idea para la API REST; cada vista declara su orden estable en 'ordering'. """
+    page_size = TAMANO_PAGINA
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return view.ordering
+
+
+# --- CONTEO ESTIMADO PARA EL ADMIN ---
+def filas_estimadas(modelo, alias='default'):
+    """
+    Filas de la tabla de 'modelo' según la base, sin recorrerla (None si no hay dato):
+    pg_class.reltuples en PostgreSQL (lo actualizan ANALYZE y autovacuum) y el id más
+    alto en SQLite, que sale del extremo del índice y cuenta también las filas borradas.
+    """
+    conexion = connections[alias]
+    if conexion.vendor == 'postgresql':
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [modelo._meta.db_table])
+            fila = cursor.fetchone()
+        # reltuples vale -1 mientras la tabla no se haya analizado
+        return int(fila[0]) if fila and fila[0] > 0 else None
+    if conexion.vendor == 'sqlite':
+        maximo = modelo._default_manager.using(alias).aggregate(maximo=Max('pk'))['maximo']
+        return maximo if isinstance(maximo, int) else None
+    return None
+
+
+def filas_del_plan(queryset):
+    """ Filas que el planificador de PostgreSQL espera para 'queryset' (None en otras bases). """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador de los changelist del admin sobre tablas de millones de filas.
+    Sin filtros, las tablas grandes toman el total de filas_estimadas; con filtros
+    se cuenta como mucho hasta LIMITE_CONTEO y, si se llega, el total es el que
+    estima el plan (o LIMITE_CONTEO en SQLite: las páginas siguientes se alcanzan
+    afinando los filtros). Las tablas y resultados pequeños se cuentan exacto.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        if not queryset.query.where:
+            estimado = filas_estimadas(queryset.model, queryset.db)
+            if estimado is not None and estimado > LIMITE_CONTEO:
+                return estimado
+            return super().count
+        # COUNT sobre una subconsulta con LIMIT: se detiene en la fila LIMITE_CONTEO
+        contadas = queryset.order_by()[:LIMITE_CONTEO].count()
+        if contadas < LIMITE_CONTEO:
+            return contadas
+        return max(filas_del_plan(queryset) or 0, contadas)
@@ -0,0 +1,149 @@
+"""
+Portadas locales: cada portada se descarga una sola vez y se guarda como
+miniaturas WebP y JPEG en varios anchos.
+
+Guardar un libro (o importarlo) deja su portada en la cola (Portada pendiente);
+el comando 'descargar_portadas' la procesa en segundo plano, como la cola de
+Odoo. Las miniaturas van en MEDIA_ROOT/portadas/<huella>/ y su URL lleva la
+huella del contenido, así se pueden servir con caché de un año: si la portada
+cambia, cambia la URL. Mientras no está lista las plantillas no piden nada fuera.
+"""
+import asyncio
+import hashlib
+import io
+
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .asincrono import PortadaNoDisponible, descargar_portada
+from .cambios import marcar_cambio, LIBROS
+from .models import Portada
+from .odoo import espera_reintento
+
+# Nombre -> ancho en píxeles (el alto es proporcional)
+TAMANOS = {'p': 120, 'm': 320, 'g': 640}
+# Extensión -> (formato de Pillow, content-type)
+FORMATOS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+CALIDAD = 80
+TAMANO_LOTE = 50
+CONCURRENCIA = 8
+MAX_INTENTOS = 5
+
+
+def ruta_miniatura(huella, tamano, formato):
+    return f'portadas/{huella}/{tamano}.{formato}'
+
+
+def generar_miniaturas(contenido):
+    """
+    Guarda las miniaturas de la imagen 'contenido' y devuelve (huella, ancho, alto).
+    Dos libros con la misma imagen comparten los archivos.
+    """
+    huella = hashlib.sha256(contenido).hexdigest()[:16]
+    with Image.open(io.BytesIO(contenido)) as original:
+        imagen = ImageOps.exif_transpose(original).convert('RGB')
+    for tamano, ancho in TAMANOS.items():
+        # thumbnail no agranda: una portada pequeña queda con su tamaño original
+        miniatura = imagen.copy()
+        miniatura.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+        for formato, (formato_pil, _) in FORMATOS.items():
+            ruta = ruta_miniatura(huella, tamano, formato)
+            if default_storage.exists(ruta):
+                continue
+            salida = io.BytesIO()
+            miniatura.save(salida, formato_pil, quality=CALIDAD, optimize=True)
+            default_storage.save(ruta, ContentFile(salida.getvalue()))
+    return huella, imagen.width, imagen.height
+
+
+def encolar_portadas(libros):
+    """
+    Deja pendientes las portadas de 'libros' cuya URL de origen es nueva o cambió
+    y borra las de los libros que ya no tienen portada. Sirve para guardados en bloque.
+    """
+    libros = list(libros)
+    urls = {libro.pk: libro.portada_url for libro in libros if libro.portada_url}
+    sin_portada = [libro.pk for libro in libros if not libro.portada_url]
+    actuales = dict(
+        Portada.objects.filter(libro_id__in=[libro.pk for libro in libros]).values_list('libro_id', 'url_origen')
+    )
+    nuevas = [
+        Portada(libro_id=libro_id, url_origen=url, estado=Portada.PENDIENTE, proximo_intento=timezone.now())
+        for libro_id, url in urls.items() if actuales.get(libro_id) != url
+    ]
+    # La huella anterior se conserva: se sigue mostrando la portada vieja hasta tener la nueva
+    Portada.objects.bulk_create(
+        nuevas, update_conflicts=True, unique_fields=['libro'],
+        update_fields=['url_origen', 'estado', 'intentos', 'proximo_intento', 'ultimo_error'], batch_size=500,
+    )
+    if any(libro_id in actuales for libro_id in sin_portada):
+        Portada.objects.filter(libro_id__in=sin_portada).delete()
+    return len(nuevas)
+
+
+async def _descargar_todas(urls, concurrencia):
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def descargar(url):
+        async with semaforo:
+            return await descargar_portada(url)
+
+    return await asyncio.gather(*(descargar(url) for url in urls), return_exceptions=True)
+
+
+def procesar_portadas(lote=TAMANO_LOTE, concurrencia=CONCURRENCIA):
+    """
+    Descarga (en paralelo) un lote de portadas pendientes y genera sus miniaturas.
+    Pensado para un único proceso trabajador. Devuelve (listas, con_error).
+    """
+    pendientes = list(Portada.objects.filter(
+        estado=Portada.PENDIENTE, proximo_intento__lte=timezone.now()
+    ).order_by('proximo_intento', 'libro_id')[:lote])
+    if not pendientes:
+        return 0, 0
+
+    descargas = async_to_sync(_descargar_todas)([portada.url_origen for portada in pendientes], concurrencia)
+    listas = errores = 0
+    for portada, descarga in zip(pendientes, descargas):
+        try:
+            if isinstance(descarga, BaseException):
+                raise descarga
+            portada.huella, portada.ancho, portada.alto = generar_miniaturas(descarga[0])
+        except (PortadaNoDisponible, UnidentifiedImageError, OSError) as e:
+            errores += 1
+            portada.intentos += 1
+            portada.ultimo_error = str(e)
+            if portada.intentos >= MAX_INTENTOS:
+                portada.estado = Portada.FALLIDA
+            else:
+                portada.proximo_intento = timezone.now() + espera_reintento(portada.intentos)
+        else:
+            listas += 1
+            portada.estado = Portada.LISTA
+            portada.ultimo_error = ''
+        portada.save()
+    if listas:
+        # Los fragmentos del catálogo en caché tienen la portada anterior (o ninguna)
+        marcar_cambio(LIBROS)
+    return listas, errores
+
+
+def rellenar_portadas(libros):
+    """ Encola las portadas de los libros existentes que aún no tienen una (o cuya URL cambió). """
+    pendientes = libros.exclude(Q(portada_url__isnull=True) | Q(portada_url='')).only('id', 'portada_url')
+    total, lote = 0, []
+    for libro in pendientes.iterator(chunk_size=TAMANO_LOTE * 10):
+        lote.append(libro)
+        if len(lote) == TAMANO_LOTE * 10:
+            total += encolar_portadas(lote)
+            lote = []
+    return total + encolar_portadas(lote)
+
+
+def estado_portadas():
+    """ Cantidad de portadas por estado. """
+    return dict(Portada.objects.values_list('estado').annotate(total=Count('libro')).order_by())
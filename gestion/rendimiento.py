@@ -0,0 +1,453 @@
+"""
+Herramientas para medir el rendimiento de las consultas y vistas más usadas.
+
+'sembrar' crea un volumen grande de datos con inserciones en bloque (sin
+señales: la búsqueda se reconstruye aparte). 'CONSULTAS' reúne las consultas
+de las vistas de trabajo diario, para comparar planes (EXPLAIN) y tiempos con
+y sin los índices del modelo, y 'VISTAS' las páginas que recorre el benchmark
+de vistas con el cliente de pruebas de Django. 'OrigenLento' y las funciones
+de carga comparan las vistas asíncronas con workers bloqueantes cuando el
+servicio externo tarda en responder, y 'carga_escrituras' mide la contención
+de varios workers escribiendo a la vez en la base de datos. 'medir_exportacion'
+recorre un reporte exportado midiendo el primer bloque y la memoria residente.
+"""
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Autor, Libro, Lector, Prestamo, Multa, MovimientoStock, SaldoLector, estante_orden
+from .exportar import REPORTES, consulta_reporte, contenido_exportacion
+from .monitoreo import percentiles
+from .saldos import actualizar_saldos
+from .tareas import MULTA_POR_DIA, calcular_monto
+
+TAMANO_LOTE = 2000
+
+
+def _insertar(modelo, objetos):
+    """ bulk_create por lotes a partir de un generador; devuelve la lista de ids creados. """
+    ids, lote = [], []
+    for objeto in objetos:
+        lote.append(objeto)
+        if len(lote) == TAMANO_LOTE:
+            ids.extend(o.pk for o in modelo.objects.bulk_create(lote))
+            lote = []
+    if lote:
+        ids.extend(o.pk for o in modelo.objects.bulk_create(lote))
+    return ids
+
+
+def sembrar(libros, lectores=None, prestamos=None, semilla=0):
+    """
+    Genera un conjunto de datos realista y reproducible (misma semilla, mismos datos):
+    autores, libros con su stock inicial, lectores, préstamos de los últimos dos años
+    (casi todos los vencidos ya devueltos) y multas, pagadas o pendientes según el préstamo.
+    Por defecto hay un lector cada 20 libros y 3 préstamos por libro. Devuelve los conteos.
+    """
+    lectores = lectores if lectores is not None else max(libros // 20, 1)
+    prestamos = prestamos if prestamos is not None else libros * 3
+    azar = random.Random(semilla)
+    hoy = timezone.now().date()
+    marca = uuid.uuid4().hex[:8]  # Nombres de usuario únicos aunque ya existan datos
+    estantes = [None, *(f"Pasillo {p}, Estante {e}" for p in 'ABCDEFGH' for e in range(1, 6))]
+
+    autor_ids = _insertar(Autor, (
+        Autor(nombre=f"Nombre{i}", apellido=f"Apellido{i}") for i in range(max(libros // 10, 1))
+    ))
+    copias = {}
+
+    def generar_libros():
+        for i in range(libros):
+            libro = Libro(
+                titulo=f"Libro {azar.randrange(10 ** 9):09d}", autor_id=azar.choice(autor_ids),
+                copias_disponibles=azar.randrange(8), estante=azar.choice(estantes),
+                publicacion=azar.randrange(1900, hoy.year + 1), precio=Decimal(azar.randrange(500, 6000)) / 100,
+            )
+            copias[i] = libro.copias_disponibles
+            yield libro
+
+    libro_ids = _insertar(Libro, generar_libros())
+    # Stock de apertura en el registro, para que 'verificar_stock' cuadre con los datos sembrados
+    _insertar(MovimientoStock, (
+        MovimientoStock(libro_id=libro_id, cantidad=copias[i], tipo=MovimientoStock.INICIAL)
+        for i, libro_id in enumerate(libro_ids) if copias[i]
+    ))
+    user_ids = _insertar(User, (User(username=f"bench-{marca}-{i}") for i in range(lectores)))
+    lector_ids = _insertar(Lector, (
+        Lector(user_id=user_id, identificacion=f"B{marca}{i:09d}") for i, user_id in enumerate(user_ids)
+    ))
+
+    total_multas = 0
+    for inicio in range(0, prestamos, TAMANO_LOTE):
+        lote = []
+        for _ in range(min(TAMANO_LOTE, prestamos - inicio)):
+            fecha = hoy - timedelta(days=azar.randrange(730))
+            vence = fecha + timedelta(days=14)
+            devuelto = azar.random() < (0.95 if vence < hoy else 0.1)
+            lote.append(Prestamo(
+                libro_id=azar.choice(libro_ids), lector_id=azar.choice(lector_ids), fecha_prestamo=fecha,
+                fecha_devolucion_esperada=vence, devuelto=devuelto,
+            ))
+        multas = []
+        for prestamo in Prestamo.objects.bulk_create(lote):
+            if not prestamo.devuelto and prestamo.fecha_devolucion_esperada < hoy:
+                monto = calcular_monto(prestamo.fecha_devolucion_esperada, hoy)
+                multas.append(Multa(prestamo=prestamo, monto=monto, pagada=False))
+            elif prestamo.devuelto and azar.random() < 0.3:
+                # Devuelto con retraso: la multa quedó cobrada al devolverlo
+                multas.append(Multa(prestamo=prestamo, monto=MULTA_POR_DIA * azar.randrange(1, 30), pagada=True))
+        Multa.objects.bulk_create(multas)
+        total_multas += len(multas)
+    actualizar_saldos(lector_ids)
+
+    return {
+        'autores': len(autor_ids), 'libros': len(libro_ids), 'lectores': len(lector_ids),
+        'prestamos': prestamos, 'multas': total_multas,
+    }
+
+
+def _hoy():
+    return timezone.now().date()
+
+
+# Las mismas consultas (filtros, orden y límites) que hacen las vistas
+CONSULTAS = {
+    # El panel solo cuenta los vencidos: sin orden y leyendo solo el id
+    'prestamos_vencidos': lambda: Prestamo.objects.filter(
+        devuelto=False, fecha_devolucion_esperada__lt=_hoy()
+    ).order_by().values_list('id', flat=True),
+    'prestamos_activos': lambda: Prestamo.objects.filter(devuelto=False).order_by('fecha_devolucion_esperada', 'id')[:51],
+    'prestamos_historicos': lambda: Prestamo.objects.filter(devuelto=True).order_by('-fecha_prestamo', '-id')[:51],
+    'prestamos_orden_por_defecto': lambda: Prestamo.objects.all()[:51],
+    'multas_pendientes': lambda: Multa.objects.filter(pagada=False).order_by('id')[:51],
+    'facturacion': lambda: SaldoLector.objects.filter(deuda__gt=0).order_by('-deuda', 'lector_id')[:51],
+    'morosos': lambda: SaldoLector.objects.filter(deuda__gt=0).order_by('-deuda', 'lector_id')[:5],
+    'libros_por_titulo': lambda: Libro.objects.order_by('titulo', 'id')[:51],
+    'alertas_stock': lambda: Libro.objects.filter(copias_disponibles__lte=2),
+    'inventario_bodega': lambda: Libro.objects.annotate(
+        estante_orden=estante_orden()
+    ).order_by('estante_orden', 'titulo', 'id')[:51],
+}
+
+
+def explicar(queryset):
+    return queryset.explain()
+
+
+def medir(funcion, repeticiones=5):
+    """ Mediana en milisegundos de evaluar el queryset que devuelve 'funcion'. """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        list(funcion())
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def indices_del_modelo():
+    """ [(modelo, índice)] declarados en Meta.indexes de los modelos de consulta diaria. """
+    return [(modelo, indice) for modelo in (Libro, Prestamo, Multa, SaldoLector) for indice in modelo._meta.indexes]
+
+
+def _ejecutar_ddl(generar):
+    # El editor solo se usa para generar el SQL (collect_sql): así funciona también dentro
+    # de una transacción en SQLite, donde el editor normal no se puede abrir.
+    editor = connection.schema_editor(collect_sql=True)
+    editor.deferred_sql = []  # Normalmente lo inicializa __enter__
+    for modelo, indice in indices_del_modelo():
+        generar(editor, modelo, indice)
+    with connection.cursor() as cursor:
+        for sentencia in editor.collected_sql:
+            cursor.execute(sentencia)
+
+
+def quitar_indices():
+    _ejecutar_ddl(lambda editor, modelo, indice: editor.remove_index(modelo, indice))
+
+
+def crear_indices():
+    _ejecutar_ddl(lambda editor, modelo, indice: editor.add_index(modelo, indice))
+
+
+# --- BENCHMARK DE VISTAS ---
+def _prestamos_activos():
+    # Un préstamo distinto por petición: cada devolución consume uno
+    ids = iter(Prestamo.objects.filter(devuelto=False).order_by('id').values_list('id', flat=True))
+    return lambda: reverse('gestion:devolver_prestamo', args=[next(ids)])
+
+
+# nombre -> función que prepara y devuelve otra función que da la URL de cada petición
+VISTAS = {
+    'panel_bibliotecario': lambda: lambda: reverse('gestion:panel_bibliotecario'),
+    'lista_prestamos': lambda: lambda: reverse('gestion:prestamos'),
+    'lista_facturas': lambda: lambda: reverse('gestion:facturas'),
+    'catalogo_lector': lambda: lambda: reverse('gestion:catalogo_lector'),
+    'inventario_bodega': lambda: lambda: reverse('gestion:inventario_bodega'),
+    'devolver_prestamo': _prestamos_activos,
+}
+
+
+def medir_vista(cliente, siguiente_url, repeticiones):
+    """
+    Hace 'repeticiones' peticiones (más una de calentamiento) y devuelve latencias en ms,
+    consultas SQL por petición y el pico de memoria de Python (tracemalloc) de una petición aparte.
+    """
+    cliente.get(siguiente_url())
+    tiempos, consultas, estados = [], [], set()
+    for _ in range(repeticiones):
+        url = siguiente_url()
+        with CaptureQueriesContext(connection) as contexto:
+            inicio = time.perf_counter()
+            respuesta = cliente.get(url)
+            if respuesta.streaming:
+                b''.join(respuesta.streaming_content)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(len(contexto))
+        estados.add(respuesta.status_code)
+
+    # La memoria se mide en otra petición: tracemalloc hace más lento todo lo demás
+    url = siguiente_url()
+    tracemalloc.start()
+    try:
+        cliente.get(url)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'peticiones': repeticiones,
+        'estados': sorted(estados),
+        'latencia_ms': {
+            clave: round(valor, 3)
+            for clave, valor in {**percentiles(tiempos), 'media': statistics.fmean(tiempos), 'max': max(tiempos)}.items()
+        },
+        'consultas': {'min': min(consultas), 'max': max(consultas)},
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+def version_codigo():
+    try:
+        salida = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+def conteo_tablas():
+    return {modelo.__name__: modelo.objects.count() for modelo in (Libro, Lector, Prestamo, Multa)}
+
+
+def comparar(anterior, actual):
+    """ [(vista, p50 antes, p50 ahora, consultas antes, consultas ahora)] de las vistas en ambos resultados. """
+    filas = []
+    for nombre, datos in actual['vistas'].items():
+        previo = anterior.get('vistas', {}).get(nombre)
+        if previo:
+            filas.append((
+                nombre, previo['latencia_ms']['p50'], datos['latencia_ms']['p50'],
+                previo['consultas']['max'], datos['consultas']['max'],
+            ))
+    return filas
+
+
+# --- PRUEBA DE CARGA CON UN ORIGEN LENTO ---
+# GIF de 1x1 que el origen falso sirve como portada
+PORTADA_FALSA = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+
+
+class _ServidorConCola(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Muchas conexiones a la vez durante la carga
+
+    def handle_error(self, request, client_address):
+        # El cliente cortó la conexión porque se le agotó el plazo: es lo esperado
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class OrigenLento:
+    """
+    Servidor HTTP local que imita Open Library: /api/books devuelve un libro para
+    cada ISBN pedido y /portadas/<nombre> una imagen, siempre tras 'retardo' segundos.
+    """
+    def __init__(self, retardo):
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(retardo)
+                ruta = urlparse(self.path)
+                if ruta.path.startswith('/portadas/'):
+                    cuerpo, tipo = PORTADA_FALSA, 'image/gif'
+                else:
+                    claves = parse_qs(ruta.query).get('bibkeys', [''])[0].split(',')
+                    libros = {clave: {'title': f"Libro {clave[5:]}", 'authors': [{'name': "Autor Prueba"}]}
+                              for clave in claves if clave}
+                    cuerpo, tipo = json.dumps(libros).encode(), 'application/json'
+                self.send_response(200)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = _ServidorConCola(('127.0.0.1', 0), Manejador)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def isbns_de_prueba(cantidad):
+    """ ISBN-13 (prefijo 979) distintos en cada ejecución, para que ninguno esté en la caché. """
+    base = random.randrange(10 ** 9)
+    return [f"979{(base + i) % 10 ** 10:010d}" for i in range(cantidad)]
+
+
+def _resultado_carga(tiempos, estados, total):
+    return {
+        'peticiones': len(tiempos),
+        'estados': dict(sorted(estados.items())),
+        'segundos': round(total, 3),
+        'por_segundo': round(len(tiempos) / total, 1) if total else None,
+        'latencia_ms': {clave: round(valor * 1000, 1) for clave, valor in percentiles(tiempos).items()},
+    }
+
+
+async def carga_asincrona(cliente, urls, concurrencia):
+    """ Lanza las peticiones con el AsyncClient de Django, como mucho 'concurrencia' a la vez. """
+    semaforo = asyncio.Semaphore(concurrencia)
+    tiempos, estados = [], Counter()
+
+    async def pedir(url):
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await cliente.get(url)
+            tiempos.append(time.perf_counter() - inicio)
+            estados[respuesta.status_code] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(pedir(url) for url in urls))
+    return _resultado_carga(tiempos, estados, time.perf_counter() - inicio)
+
+
+def carga_bloqueante(funcion, argumentos, hilos):
+    """ Lo mismo con 'hilos' workers síncronos: cada uno queda bloqueado mientras espera al origen. """
+    tiempos, estados = [], Counter()
+
+    def llamar(argumento):
+        inicio = time.perf_counter()
+        try:
+            funcion(argumento)
+            estados['ok'] += 1
+        except Exception:
+            estados['error'] += 1
+        tiempos.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(llamar, argumentos))
+    return _resultado_carga(tiempos, estados, time.perf_counter() - inicio)
+
+
+def carga_escrituras(operacion, hilos, segundos):
+    """
+    'hilos' workers, cada uno con su propia conexión, repiten operacion(numero_de_hilo)
+    durante 'segundos'. Los errores de la base ('database is locked'...) se cuentan
+    por mensaje y no se reintentan: son justamente lo que se quiere medir.
+    """
+    tiempos, estados, candado = [], Counter(), threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def trabajar(numero):
+        try:
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    operacion(numero)
+                    estado = 'ok'
+                except DatabaseError as e:
+                    estado = (str(e).splitlines() or [type(e).__name__])[0][:80]
+                with candado:
+                    tiempos.append(time.perf_counter() - inicio)
+                    estados[estado] += 1
+        finally:
+            connection.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(trabajar, range(hilos)))
+    return _resultado_carga(tiempos, estados, time.perf_counter() - inicio)
+
+
+# --- BENCHMARK DE EXPORTACIÓN ---
+def memoria_residente():
+    """ Memoria residente (RSS) del proceso en bytes, o el pico si el sistema no expone /proc. """
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource  # Solo Unix; en macOS ru_maxrss viene en bytes y en Linux en KB
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def medir_exportacion(nombre, formato, q=None, estado=None):
+    """
+    Exporta el reporte 'nombre' descartando los bytes y mide el tiempo hasta el
+    primer bloque con filas, el total y cuánto creció la memoria residente.
+    """
+    reporte = REPORTES[nombre]
+    gc.collect()
+    rss_inicial = rss_pico = memoria_residente()
+    inicio = time.perf_counter()
+    primer_bloque = None
+    total_bytes = bloques = 0
+    contenido = contenido_exportacion(consulta_reporte(nombre, q, estado), reporte.campos, formato, reporte.encabezados)
+    for bloque in contenido:
+        bloques += 1
+        total_bytes += len(bloque)
+        # El primero es solo el encabezado (o la cabecera del zip): se espera al que trae filas
+        if primer_bloque is None and bloques == 2:
+            primer_bloque = time.perf_counter() - inicio
+        rss_pico = max(rss_pico, memoria_residente())
+    segundos = time.perf_counter() - inicio
+    return {
+        'reporte': nombre,
+        'formato': formato,
+        'filas': consulta_reporte(nombre, q, estado).count(),
+        'megabytes': round(total_bytes / 2 ** 20, 1),
+        'segundos': round(segundos, 2),
+        'primer_bloque_ms': round((primer_bloque or segundos) * 1000, 1),
+        'rss_inicial_mb': round(rss_inicial / 2 ** 20, 1),
+        'rss_pico_mb': round(rss_pico / 2 ** 20, 1),
+        'rss_crecimiento_mb': round((rss_pico - rss_inicial) / 2 ** 20, 1),
+    }
@@ -0,0 +1,119 @@
+"""
+Reservas y lista de espera de cada libro.
+
+Reservar con copias en el estante aparta una (sale del stock, ver stock.py) por
+RESERVA_HORAS; sin copias, el lector entra a la lista de espera del libro, que se
+atiende por orden de llegada. Cada devolución, cancelación o vencimiento aparta
+la copia que queda libre para el siguiente dentro de su misma transacción, así
+dos lectores nunca reciben la misma copia. 'vencer_reservas' libera las copias
+apartadas que nadie retiró.
+
+El siguiente en la fila y la posición de un lector son rangos del índice parcial
+'reserva_espera_idx' (libro, id) de las reservas en espera.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.utils import timezone
+
+from .cambios import marcar_cambio, LIBROS
+from .estadisticas import invalidar_resumen
+from .models import Libro, Reserva
+from .stock import apartar_copias, liberar_copias
+
+TAMANO_LOTE = 500
+
+
+def _en_espera(libro_id):
+    return Reserva.objects.filter(libro_id=libro_id, estado=Reserva.EN_ESPERA)
+
+
+def reservar(libro_id, lector, ahora=None):
+    """
+    Reserva el libro para el lector: se le aparta una copia si hay en el estante
+    y nadie la espera, si no queda en la lista de espera. Si ya tenía una reserva
+    activa del libro devuelve esa. Devuelve (reserva, creada).
+    """
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        # El bloqueo del libro pone en fila a las reservas simultáneas del mismo título
+        libro = Libro.objects.select_for_update().get(pk=libro_id)
+        activa = Reserva.objects.filter(libro=libro, lector=lector, estado__in=Reserva.ACTIVAS).first()
+        if activa:
+            return activa, False
+        reserva = Reserva.objects.create(libro=libro, lector=lector, creada=ahora)
+        # Entra a la fila como cualquiera: si hay copias, se apartan por orden de llegada
+        apartada = any(r.pk == reserva.pk for r in apartar_copias([libro.pk], ahora))
+    if apartada:
+        reserva.refresh_from_db(fields=['estado', 'vence'])
+        invalidar_resumen()
+        marcar_cambio(LIBROS)
+    return reserva, True
+
+
+def cancelar_reserva(reserva):
+    """ Cancela una reserva activa; si tenía una copia apartada pasa al siguiente. Devuelve False si ya no estaba activa. """
+    with transaction.atomic():
+        reserva = Reserva.objects.select_for_update().filter(pk=reserva.pk, estado__in=Reserva.ACTIVAS).first()
+        if reserva is None:
+            return False
+        apartada = reserva.estado == Reserva.APARTADA
+        if apartada:
+            liberar_copias([reserva], Reserva.CANCELADA)
+        else:
+            reserva.estado = Reserva.CANCELADA
+            reserva.save(update_fields=['estado'])
+    if apartada:
+        invalidar_resumen()
+        marcar_cambio(LIBROS)
+    return True
+
+
+def vencer_reservas(ahora=None, lote=TAMANO_LOTE):
+    """ Libera las copias apartadas cuyo plazo venció y las aparta para los siguientes. Devuelve cuántas vencieron. """
+    ahora = ahora or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Rango del índice parcial 'reserva_apartada_idx'
+            vencidas = list(Reserva.objects.select_for_update().filter(
+                estado=Reserva.APARTADA, vence__lt=ahora
+            ).order_by('vence')[:lote])
+            if vencidas:
+                liberar_copias(vencidas, Reserva.VENCIDA, ahora)
+        total += len(vencidas)
+        if len(vencidas) < lote:
+            break
+    if total:
+        invalidar_resumen()
+        marcar_cambio(LIBROS)
+    return total
+
+
+def siguiente_en_espera(libro_id):
+    """ Primera reserva de la lista de espera del libro (o None). """
+    return _en_espera(libro_id).order_by('id').first()
+
+
+def posicion(reserva):
+    """ Puesto de la reserva en la lista de espera de su libro (1 = la siguiente); None si no está esperando. """
+    if reserva.estado != Reserva.EN_ESPERA:
+        return None
+    return _en_espera(reserva.libro_id).filter(id__lte=reserva.pk).count()
+
+
+def reservas_de(lector):
+    """ Reservas activas del lector con su 'puesto' en la fila (None las apartadas), en una consulta. """
+    delante = Reserva.objects.filter(
+        libro_id=OuterRef('libro_id'), estado=Reserva.EN_ESPERA, id__lte=OuterRef('id')
+    ).order_by().values('libro_id').annotate(total=Count('id')).values('total')
+    return Reserva.objects.filter(lector=lector, estado__in=Reserva.ACTIVAS).annotate(
+        puesto=Case(When(estado=Reserva.EN_ESPERA, then=Subquery(delante)))
+    ).select_related('libro').order_by(F('vence').asc(nulls_last=True), 'id')
+
+
+def libros_con_copias_ociosas(libro_ids=None):
+    """ Libros con copias en el estante y lectores esperando: no debería haber ninguno. """
+    libros = Libro.objects.filter(copias_disponibles__gt=0, reservas__estado=Reserva.EN_ESPERA)
+    if libro_ids is not None:
+        libros = libros.filter(pk__in=libro_ids)
+    return sorted(set(libros.values_list('pk', flat=True)))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+
+GRUPO_BIBLIOTECARIOS = 'Bibliotecarios'
+GRUPO_BODEGERO = 'Bodegero'
+
+CLAVE_VERSION = 'gestion:grupos:version'
+# Con locmem cada proceso guarda su copia y las invalidaciones de un worker no
+# llegan a los demás: ahí un cambio de permisos tarda como mucho un minuto
+DURACION_GRUPOS = 60 * 60 if settings.CACHE_BACKEND != 'locmem' else 60
+
+
+def _clave_usuario(user_id):
+    version = cache.get_or_set(CLAVE_VERSION, 1, None)
+    return f'gestion:grupos:{version}:{user_id}'
+
+
+def grupos_de(user):
+    """
+    Nombres de los grupos del usuario como frozenset.
+    Se consulta la base de datos una sola vez: el resultado queda guardado en
+    el propio objeto (dura lo que dura la petición) y en la caché por usuario.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, '_grupos_cache', None)
+    if grupos is None:
+        clave = _clave_usuario(user.pk)
+        grupos = cache.get(clave)
+        if grupos is None:
+            grupos = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(clave, grupos, DURACION_GRUPOS)
+        user._grupos_cache = grupos
+    return grupos
+
+
+def tiene_grupo(user, nombre):
+    return nombre in grupos_de(user)
+
+
+def invalidar_grupos(*user_ids):
+    cache.delete_many([_clave_usuario(user_id) for user_id in user_ids])
+
+
+def invalidar_todos_los_grupos():
+    # Cambiar la versión deja huérfanas todas las claves anteriores
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 2, None)
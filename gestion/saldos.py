@@ -0,0 +1,91 @@
+"""
+Saldo de cada lector: lo que debe en multas pendientes y cuántas son.
+
+La facturación y los morosos del panel leen SaldoLector (un rango del índice
+parcial 'saldo_deuda_idx') en lugar de agrupar todas las multas pendientes en
+cada visita. Todo lo que crea, cambia o cobra multas llama a actualizar_saldos
+dentro de su transacción: las señales de Multa cubren los guardados sueltos
+(admin) y las operaciones en bloque lo hacen a mano, como con el stock.
+'verificar_saldos' compara el libro mayor con las multas y lo corrige.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .eventos import avisar_deuda
+from .models import Lector, Multa, SaldoLector
+
+TAMANO_LOTE = 500
+SIN_DEUDA = (Decimal('0.00'), 0)
+
+
+def saldos_segun_multas(lector_ids=None):
+    """ {lector_id: (deuda, multas_pendientes)} sumando las multas sin pagar. """
+    multas = Multa.objects.filter(pagada=False)
+    if lector_ids is not None:
+        multas = multas.filter(prestamo__lector_id__in=lector_ids)
+    return {
+        lector_id: (deuda, cantidad)
+        for lector_id, deuda, cantidad in multas.values_list('prestamo__lector_id').annotate(
+            deuda=Sum('monto'), cantidad=Count('id')
+        ).order_by()
+    }
+
+
+def _actualizar_lote(lector_ids):
+    # Solo se crean filas para quien debe algo; así un lector que se está borrando
+    # (sus multas se borran antes que él) no recibe una fila nueva
+    SaldoLector.objects.bulk_create(
+        [SaldoLector(lector_id=lector_id) for lector_id in saldos_segun_multas(lector_ids)],
+        ignore_conflicts=True,
+    )
+    saldos = list(SaldoLector.objects.select_for_update().filter(lector_id__in=lector_ids).order_by('lector_id'))
+    # Con las filas bloqueadas, la suma ya incluye lo que otras transacciones confirmaron
+    esperados = saldos_segun_multas(lector_ids)
+    ahora = timezone.now()
+    cambiados, diferencia = [], Decimal('0.00')
+    for saldo in saldos:
+        deuda, cantidad = esperados.get(saldo.lector_id, SIN_DEUDA)
+        if saldo.deuda != deuda or saldo.multas_pendientes != cantidad:
+            diferencia += deuda - saldo.deuda
+            saldo.deuda, saldo.multas_pendientes, saldo.actualizado = deuda, cantidad, ahora
+            cambiados.append(saldo)
+    SaldoLector.objects.bulk_update(cambiados, ['deuda', 'multas_pendientes', 'actualizado'])
+    avisar_deuda(diferencia)
+    return len(cambiados)
+
+
+def actualizar_saldos(lector_ids):
+    """
+    Recalcula el saldo de 'lector_ids' a partir de sus multas pendientes.
+    Debe llamarse dentro de la transacción que cambió las multas. Devuelve cuántos cambiaron.
+    """
+    lector_ids = sorted(set(lector_ids))
+    cambiados = 0
+    with transaction.atomic():
+        for inicio in range(0, len(lector_ids), TAMANO_LOTE):
+            cambiados += _actualizar_lote(lector_ids[inicio:inicio + TAMANO_LOTE])
+    return cambiados
+
+
+def recalcular_saldos():
+    """ Recalcula los saldos de todos los lectores (tras inserciones en bloque de multas). """
+    return actualizar_saldos(Lector.objects.values_list('pk', flat=True))
+
+
+def diferencias_saldos():
+    """ Lectores cuyo saldo no coincide con sus multas pendientes: [(lector_id, actual, esperado)]. """
+    esperados = saldos_segun_multas()
+    actuales = {
+        lector_id: (deuda, cantidad)
+        for lector_id, deuda, cantidad in SaldoLector.objects.values_list(
+            'lector_id', 'deuda', 'multas_pendientes'
+        ).iterator()
+    }
+    return [
+        (lector_id, actuales.get(lector_id, SIN_DEUDA), esperados.get(lector_id, SIN_DEUDA))
+        for lector_id in sorted(actuales.keys() | esperados.keys())
+        if actuales.get(lector_id, SIN_DEUDA) != esperados.get(lector_id, SIN_DEUDA)
+    ]
@@ -0,0 +1,78 @@
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Autor, Libro, Prestamo, Multa
+
+
+class CamposParcialesMixin:
+    """ ?fields=id,titulo devuelve solo esas columnas (sparse fieldsets). """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        pedidos = request.query_params.get('fields') if request else None
+        if pedidos:
+            permitidos = {campo.strip() for campo in pedidos.split(',')}
+            for campo in set(self.fields) - permitidos:
+                self.fields.pop(campo)
+
+
+class AutorSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    num_libros = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Autor
+        fields = ('id', 'nombre', 'apellido', 'nacionalidad', 'fecha_nacimiento', 'num_libros')
+
+
+class LibroSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    autor_nombre = serializers.CharField(source='autor.nombre_completo', read_only=True)
+    disponible = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Libro
+        fields = (
+            'id', 'titulo', 'autor', 'autor_nombre', 'publicacion', 'paginas', 'portada_url',
+            'estante', 'precio', 'copias_disponibles', 'disponible',
+        )
+
+    def get_disponible(self, libro):
+        return libro.copias_disponibles > 0
+
+
+class DisponibilidadSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    """ Versión mínima para los kioscos que solo consultan si hay copias. """
+    disponible = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Libro
+        fields = ('id', 'titulo', 'copias_disponibles', 'disponible')
+
+    def get_disponible(self, libro):
+        return libro.copias_disponibles > 0
+
+
+class PrestamoSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    libro_titulo = serializers.CharField(source='libro.titulo', read_only=True)
+    lector_usuario = serializers.CharField(source='lector.user.username', read_only=True)
+    lector_identificacion = serializers.CharField(source='lector.identificacion', read_only=True)
+    vencido = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Prestamo
+        fields = (
+            'id', 'libro', 'libro_titulo', 'lector', 'lector_usuario', 'lector_identificacion',
+            'fecha_prestamo', 'fecha_devolucion_esperada', 'devuelto', 'vencido',
+        )
+
+    def get_vencido(self, prestamo):
+        return not prestamo.devuelto and prestamo.fecha_devolucion_esperada < timezone.now().date()
+
+
+class MultaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    lector = serializers.IntegerField(source='prestamo.lector_id', read_only=True)
+    lector_usuario = serializers.CharField(source='prestamo.lector.user.username', read_only=True)
+    libro_titulo = serializers.CharField(source='prestamo.libro.titulo', read_only=True)
+
+    class Meta:
+        model = Multa
+        fields = ('id', 'prestamo', 'lector', 'lector_usuario', 'libro_titulo', 'monto', 'pagada', 'fecha_generacion')
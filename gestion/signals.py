@@ -0,0 +1,141 @@
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Libro, Autor, Lector, Prestamo, Multa, MovimientoStock
+from .estadisticas import invalidar_resumen
+from .cambios import marcar_cambio, LIBROS, AUTORES, PRESTAMOS, MULTAS
+from .roles import invalidar_grupos, invalidar_todos_los_grupos
+from .busqueda import buscador
+from .portadas import encolar_portadas
+from .saldos import actualizar_saldos
+from .eventos import avisar_prestamos, avisar_stock, PRESTADO
+
+
+# --- INVALIDACIÓN DEL RESUMEN DEL PANEL ---
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Autor)
+@receiver([post_save, post_delete], sender=Lector)
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Multa)
+def resumen_cambio(sender, **kwargs):
+    invalidar_resumen()
+
+
+# --- SALDO DEL LECTOR (GUARDADOS SUELTOS DE MULTAS, P. EJ. DESDE EL ADMIN) ---
+@receiver([post_save, post_delete], sender=Multa)
+def multa_cambio_saldo(sender, instance, **kwargs):
+    actualizar_saldos(Prestamo.objects.filter(pk=instance.prestamo_id).values_list('lector_id', flat=True))
+
+
+# --- MARCAS DE CAMBIO (ETag DE LA API) ---
+# Cada modelo marca también los recursos que muestran sus datos (p. ej. el nombre del autor en los libros)
+RECURSOS_AFECTADOS = {
+    Libro: (LIBROS, AUTORES),
+    Autor: (AUTORES, LIBROS),
+    Lector: (PRESTAMOS, MULTAS),
+    Prestamo: (PRESTAMOS,),
+    Multa: (MULTAS,),
+    MovimientoStock: (LIBROS,),
+}
+
+
+@receiver([post_save, post_delete], sender=Libro)
+@receiver([post_save, post_delete], sender=Autor)
+@receiver([post_save, post_delete], sender=Lector)
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Multa)
+@receiver(post_save, sender=MovimientoStock)
+def marcar_recursos(sender, **kwargs):
+    marcar_cambio(*RECURSOS_AFECTADOS[sender])
+
+
+# --- INVALIDACIÓN DE LOS GRUPOS (ROLES) EN CACHÉ ---
+@receiver(m2m_changed, sender=User.groups.through)
+def grupos_usuario_cambio(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        invalidar_grupos(instance.pk)
+    elif action == 'pre_clear':
+        # Desde el grupo: antes de vaciarlo guardamos a quién afecta
+        invalidar_grupos(*instance.user_set.values_list('pk', flat=True))
+    elif pk_set:
+        invalidar_grupos(*pk_set)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def grupo_cambio(sender, **kwargs):
+    invalidar_todos_los_grupos()
+
+
+@receiver([post_save, post_delete], sender=User)
+def usuario_cambio(sender, instance, update_fields=None, **kwargs):
+    # Guardar el usuario (is_staff, is_active...) descarta sus permisos en caché; el login solo toca last_login
+    if update_fields != frozenset({'last_login'}):
+        invalidar_grupos(instance.pk)
+
+
+# --- SINCRONIZACIÓN DEL ÍNDICE DE BÚSQUEDA ---
+@receiver(post_save, sender=Libro)
+def indexar_libro(sender, instance, **kwargs):
+    buscador().indexar_libros([instance])
+
+
+@receiver(post_delete, sender=Libro)
+def desindexar_libro(sender, instance, **kwargs):
+    buscador().borrar_libro(instance.pk)
+
+
+@receiver(post_save, sender=Autor)
+def indexar_libros_autor(sender, instance, created, **kwargs):
+    if not created:
+        buscador().indexar_libros(instance.libro_set.select_related('autor'))
+
+
+@receiver(post_save, sender=Lector)
+def indexar_lector(sender, instance, **kwargs):
+    buscador().indexar_lectores([instance])
+
+
+@receiver(post_delete, sender=Lector)
+def desindexar_lector(sender, instance, **kwargs):
+    buscador().borrar_lector(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def indexar_usuario(sender, instance, created, **kwargs):
+    if not created and Lector.objects.filter(pk=instance.pk).exists():
+        buscador().indexar_lectores(Lector.objects.filter(pk=instance.pk).select_related('user'))
+
+
+# --- STOCK INICIAL DE LOS LIBROS NUEVOS ---
+@receiver(post_save, sender=Libro)
+def registrar_stock_inicial(sender, instance, created, **kwargs):
+    if created and instance.copias_disponibles:
+        MovimientoStock.objects.create(
+            libro=instance, cantidad=instance.copias_disponibles, tipo=MovimientoStock.INICIAL
+        )
+
+
+# --- PORTADAS LOCALES ---
+@receiver(post_save, sender=Libro)
+def encolar_portada(sender, instance, created, update_fields=None, **kwargs):
+    if created and not instance.portada_url:
+        return
+    # Los ajustes de stock guardan solo 'copias_disponibles': la portada no cambió
+    if update_fields is None or 'portada_url' in update_fields:
+        encolar_portadas([instance])
+
+
+# --- CAMBIOS EN VIVO DEL PANEL Y LA BODEGA (GUARDADOS SUELTOS; LOS LOTES AVISAN EN gestion.stock) ---
+@receiver(post_save, sender=MovimientoStock)
+def movimiento_avisa_stock(sender, instance, created, **kwargs):
+    if created:
+        avisar_stock([instance.libro_id])
+
+
+@receiver(post_save, sender=Prestamo)
+def prestamo_avisa_panel(sender, instance, created, **kwargs):
+    if created:
+        avisar_prestamos([instance.pk], PRESTADO)
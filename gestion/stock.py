@@ -0,0 +1,378 @@
+"""
+Contabilidad de stock: todo cambio de 'copias_disponibles' pasa por aquí.
+
+Los cambios se aplican con F() dentro de una transacción (sin leer-modificar-
+escribir en Python) y quedan registrados en MovimientoStock, de modo que el
+stock de cualquier libro se puede auditar o reconstruir sumando sus movimientos.
+
+Los préstamos y devoluciones en lote (mostrador a fin de semestre) hacen lo
+mismo con un número fijo de consultas: una lectura bloqueante, un bulk_update
+de los libros con F() y las inserciones en bloque, todo en una transacción.
+
+Una copia apartada para una reserva también sale del stock (movimiento
+'reserva'): al prestársela a ese lector ya no se descuenta otra vez, y al
+devolver copias se apartan primero para la lista de espera (apartar_copias).
+"""
+import re
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Libro, Prestamo, MovimientoStock, Reserva
+from .tareas import cobrar_multas
+from .estadisticas import invalidar_resumen
+from .cambios import marcar_cambio, LIBROS, PRESTAMOS, MULTAS
+from .eventos import avisar_prestamos, avisar_stock
+
+# Estados de cada elemento de una operación en lote
+PRESTADO = 'prestado'
+DEVUELTO = 'devuelto'
+YA_DEVUELTO = 'ya_devuelto'
+SIN_STOCK = 'sin_stock'
+NO_EXISTE = 'no_existe'
+INVALIDO = 'invalido'
+MAX_LOTE = 1000
+# Horas que se guarda una copia apartada (settings.RESERVA_HORAS)
+HORAS_APARTADO = 48
+
+
+class StockInsuficiente(Exception):
+    pass
+
+
+class _CambioConcurrente(Exception):
+    """ Otra transacción devolvió alguno de los préstamos entre la lectura y la escritura. """
+
+
+def mover_stock(libro_id, cantidad, tipo, prestamo=None, usuario=None):
+    """ Suma 'cantidad' (puede ser negativa) al stock sin dejarlo nunca por debajo de cero. """
+    with transaction.atomic():
+        libros = Libro.objects.filter(pk=libro_id)
+        if cantidad < 0:
+            libros = libros.filter(copias_disponibles__gte=-cantidad)
+        if not libros.update(copias_disponibles=F('copias_disponibles') + cantidad):
+            raise StockInsuficiente(f"No hay copias suficientes del libro {libro_id}")
+        return MovimientoStock.objects.create(
+            libro_id=libro_id, cantidad=cantidad, tipo=tipo, prestamo=prestamo, usuario=usuario
+        )
+
+
+def ajustar_stock(libro_id, nuevo_stock, usuario=None, estante=None):
+    """ Conteo físico de la bodega: fija el stock y registra la diferencia como ajuste. """
+    if nuevo_stock < 0:
+        raise ValueError("El stock no puede ser negativo")
+    with transaction.atomic():
+        libro = Libro.objects.select_for_update().get(pk=libro_id)
+        diferencia = nuevo_stock - libro.copias_disponibles
+        campos = []
+        if estante is not None and estante != libro.estante:
+            libro.estante = estante
+            campos.append('estante')
+        if diferencia:
+            # La diferencia se aplica con F() por si otra transacción cambió el stock entre medio
+            libro.copias_disponibles = F('copias_disponibles') + diferencia
+            campos.append('copias_disponibles')
+            MovimientoStock.objects.create(libro_id=libro_id, cantidad=diferencia, tipo=MovimientoStock.AJUSTE, usuario=usuario)
+        if campos:
+            libro.save(update_fields=campos)
+        if diferencia > 0:
+            apartar_copias([libro_id])
+    return diferencia
+
+
+def registrar_prestamo(libro_id, lector, fecha_devolucion_esperada, usuario=None, **extra):
+    """
+    Crea el préstamo y descuenta una copia en la misma transacción. Si el lector
+    tenía una copia apartada de ese libro se le entrega esa, sin tocar el stock.
+    """
+    with transaction.atomic():
+        apartada = Reserva.objects.select_for_update().filter(
+            libro_id=libro_id, lector=lector, estado=Reserva.APARTADA
+        ).first()
+        prestamo = Prestamo.objects.create(
+            libro_id=libro_id, lector=lector, fecha_devolucion_esperada=fecha_devolucion_esperada, **extra
+        )
+        if apartada:
+            apartada.estado, apartada.prestamo = Reserva.ENTREGADA, prestamo
+            apartada.save(update_fields=['estado', 'prestamo'])
+        else:
+            mover_stock(libro_id, -1, MovimientoStock.PRESTAMO, prestamo=prestamo, usuario=usuario)
+    return prestamo
+
+
+def hay_copia_para(libro, lector):
+    """ La pregunta de registrar_prestamo, sin bloquear: ¿hay copias en el estante o una apartada para el lector? """
+    return libro.copias_disponibles > 0 or Reserva.objects.filter(
+        libro=libro, lector=lector, estado=Reserva.APARTADA
+    ).exists()
+
+
+def _fin_apartado(ahora):
+    return ahora + timedelta(hours=getattr(settings, 'RESERVA_HORAS', HORAS_APARTADO))
+
+
+def apartar_copias(libro_ids, ahora=None):
+    """
+    Aparta las copias disponibles de 'libro_ids' para los primeros de cada lista de
+    espera (en orden de llegada). Se llama dentro de la transacción que repone
+    copias, así una devolución nunca deja la copia en el estante si alguien la espera.
+    Devuelve las reservas apartadas.
+    """
+    ahora = ahora or timezone.now()
+    libros = dict(Libro.objects.select_for_update().filter(
+        pk__in=libro_ids, copias_disponibles__gt=0
+    ).values_list('id', 'copias_disponibles'))
+    if not libros:
+        return []
+    # Puesto de cada reserva en la lista de su libro, en una sola consulta
+    candidatas = Reserva.objects.filter(libro_id__in=libros, estado=Reserva.EN_ESPERA).annotate(
+        puesto=Window(RowNumber(), partition_by=[F('libro_id')], order_by=F('id').asc())
+    ).filter(puesto__lte=max(libros.values()))
+    apartadas = [reserva for reserva in candidatas if reserva.puesto <= libros[reserva.libro_id]]
+    if not apartadas:
+        return []
+    for reserva in apartadas:
+        reserva.estado, reserva.vence = Reserva.APARTADA, _fin_apartado(ahora)
+    Reserva.objects.bulk_update(apartadas, ['estado', 'vence'])
+    Libro.objects.bulk_update(
+        [
+            Libro(pk=libro_id, copias_disponibles=F('copias_disponibles') - n)
+            for libro_id, n in Counter(reserva.libro_id for reserva in apartadas).items()
+        ],
+        ['copias_disponibles'],
+    )
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(libro_id=reserva.libro_id, cantidad=-1, tipo=MovimientoStock.RESERVA) for reserva in apartadas
+    ])
+    avisar_stock(reserva.libro_id for reserva in apartadas)
+    return apartadas
+
+
+def liberar_copias(reservas, estado, ahora=None):
+    """
+    Cierra reservas apartadas (canceladas o vencidas) con 'estado', devuelve sus
+    copias al stock y las aparta para el siguiente en espera. Dentro de una transacción.
+    """
+    reservas = list(reservas)
+    for reserva in reservas:
+        reserva.estado = estado
+    Reserva.objects.bulk_update(reservas, ['estado'])
+    libros = Counter(reserva.libro_id for reserva in reservas)
+    Libro.objects.bulk_update(
+        [Libro(pk=libro_id, copias_disponibles=F('copias_disponibles') + n) for libro_id, n in libros.items()],
+        ['copias_disponibles'],
+    )
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(libro_id=reserva.libro_id, cantidad=1, tipo=MovimientoStock.RESERVA) for reserva in reservas
+    ])
+    avisar_stock(libros)
+    return apartar_copias(libros, ahora)
+
+
+def registrar_devolucion(prestamo, usuario=None):
+    """
+    Marca el préstamo como devuelto, cobra su multa y repone la copia.
+    Devuelve False si otro proceso ya lo había devuelto.
+    """
+    devuelto = registrar_devoluciones([prestamo.pk], usuario=usuario)[0]['estado'] == DEVUELTO
+    if devuelto:
+        prestamo.devuelto = True
+    return devuelto
+
+
+def leer_codigos(texto):
+    """ Códigos de un texto pegado o leído con el escáner (uno por línea o separados por comas). """
+    return [codigo for codigo in re.split(r'[\s,;]+', texto or '') if codigo]
+
+
+def _codigo_entero(codigo):
+    try:
+        return int(str(codigo).strip())
+    except ValueError:
+        return None
+
+
+def registrar_prestamos(libro_ids, lector, fecha_devolucion_esperada, usuario=None):
+    """
+    Presta a 'lector' un ejemplar de cada libro de 'libro_ids' (se puede repetir un libro).
+    El stock de todos se valida con una sola lectura y los que no alcanzan se
+    informan sin detener el resto; las copias que el lector tenía apartadas se
+    entregan primero. Devuelve [{'codigo', 'estado', 'libro', 'prestamo'}].
+    """
+    codigos = list(libro_ids)[:MAX_LOTE]
+    ids = [_codigo_entero(codigo) for codigo in codigos]
+    resultados = [{'codigo': str(codigo), 'estado': INVALIDO, 'libro': None, 'prestamo': None} for codigo in codigos]
+    with transaction.atomic():
+        libros = {
+            libro_id: [titulo, copias]
+            for libro_id, titulo, copias in Libro.objects.select_for_update().filter(
+                pk__in={libro_id for libro_id in ids if libro_id is not None}
+            ).values_list('id', 'titulo', 'copias_disponibles')
+        }
+        apartadas = defaultdict(list)
+        for reserva in Reserva.objects.select_for_update().filter(
+            lector=lector, libro_id__in=libros, estado=Reserva.APARTADA
+        ):
+            apartadas[reserva.libro_id].append(reserva)
+        prestamos, entregadas = [], []
+        for resultado, libro_id in zip(resultados, ids):
+            if libro_id is None:
+                continue
+            if libro_id not in libros:
+                resultado['estado'] = NO_EXISTE
+                continue
+            resultado['libro'] = libros[libro_id][0]
+            prestamo = Prestamo(libro_id=libro_id, lector=lector, fecha_devolucion_esperada=fecha_devolucion_esperada)
+            if apartadas[libro_id]:
+                # La copia ya salió del stock al apartarla
+                entregadas.append((apartadas[libro_id].pop(), prestamo))
+            elif libros[libro_id][1] < 1:
+                resultado['estado'] = SIN_STOCK
+                continue
+            else:
+                libros[libro_id][1] -= 1
+            resultado['estado'] = PRESTADO
+            prestamos.append(prestamo)
+        if prestamos:
+            Prestamo.objects.bulk_create(prestamos)
+            for reserva, prestamo in entregadas:
+                reserva.estado, reserva.prestamo = Reserva.ENTREGADA, prestamo
+            Reserva.objects.bulk_update([reserva for reserva, _ in entregadas], ['estado', 'prestamo'])
+            de_reserva = {id(prestamo) for _, prestamo in entregadas}
+            de_estante = [prestamo for prestamo in prestamos if id(prestamo) not in de_reserva]
+            salidas = Counter(prestamo.libro_id for prestamo in de_estante)
+            Libro.objects.bulk_update(
+                [Libro(pk=libro_id, copias_disponibles=F('copias_disponibles') - n) for libro_id, n in salidas.items()],
+                ['copias_disponibles'],
+            )
+            MovimientoStock.objects.bulk_create([
+                MovimientoStock(
+                    libro_id=prestamo.libro_id, cantidad=-1, tipo=MovimientoStock.PRESTAMO, prestamo=prestamo,
+                    usuario=usuario,
+                )
+                for prestamo in de_estante
+            ])
+            # Las inserciones en bloque no disparan las señales que avisan al panel y a la bodega
+            avisar_stock(salidas)
+            avisar_prestamos((prestamo.pk for prestamo in prestamos), PRESTADO)
+    prestados = iter(prestamos)
+    for resultado in resultados:
+        if resultado['estado'] == PRESTADO:
+            resultado['prestamo'] = next(prestados).pk
+    if prestamos:
+        # Las operaciones en bloque no disparan señales
+        invalidar_resumen()
+        marcar_cambio(PRESTAMOS, LIBROS)
+    return resultados
+
+
+def _devolver(ids, usuario, hoy):
+    prestamos = {
+        fila[0]: fila[1:]
+        for fila in Prestamo.objects.select_for_update().filter(pk__in=ids).values_list(
+            'id', 'libro_id', 'lector_id', 'fecha_devolucion_esperada', 'devuelto', 'libro__titulo'
+        )
+    }
+    activos = [prestamo_id for prestamo_id, fila in prestamos.items() if not fila[3]]
+    if Prestamo.objects.filter(pk__in=activos, devuelto=False).update(devuelto=True) != len(activos):
+        raise _CambioConcurrente
+    Libro.objects.bulk_update(
+        [
+            Libro(pk=libro_id, copias_disponibles=F('copias_disponibles') + n)
+            for libro_id, n in Counter(prestamos[prestamo_id][0] for prestamo_id in activos).items()
+        ],
+        ['copias_disponibles'],
+    )
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(
+            libro_id=prestamos[prestamo_id][0], cantidad=1, tipo=MovimientoStock.DEVOLUCION,
+            prestamo_id=prestamo_id, usuario=usuario,
+        )
+        for prestamo_id in activos
+    ])
+    avisar_stock(prestamos[prestamo_id][0] for prestamo_id in activos)
+    avisar_prestamos(activos, DEVUELTO)
+    # Las copias que vuelven se apartan primero para la lista de espera
+    apartar_copias({prestamos[prestamo_id][0] for prestamo_id in activos})
+    multas = cobrar_multas(
+        [(prestamo_id, prestamos[prestamo_id][1], prestamos[prestamo_id][2]) for prestamo_id in activos], hoy
+    )
+    return prestamos, set(activos), multas
+
+
+def registrar_devoluciones(prestamo_ids, usuario=None, hoy=None):
+    """
+    Devuelve en una transacción los préstamos de 'prestamo_ids': repone las copias
+    y cobra las multas de los vencidos. Los ya devueltos o inexistentes se informan.
+    Devuelve [{'codigo', 'estado', 'libro', 'prestamo', 'multa'}].
+    """
+    hoy = hoy or timezone.now().date()
+    codigos = list(prestamo_ids)[:MAX_LOTE]
+    ids = [_codigo_entero(codigo) for codigo in codigos]
+    validos = sorted({prestamo_id for prestamo_id in ids if prestamo_id is not None})
+    for intento in range(3):
+        try:
+            with transaction.atomic():
+                prestamos, devueltos, multas = _devolver(validos, usuario, hoy)
+            break
+        except _CambioConcurrente:
+            if intento == 2:
+                raise
+
+    resultados, vistos = [], set()
+    for codigo, prestamo_id in zip(codigos, ids):
+        resultado = {'codigo': str(codigo), 'estado': INVALIDO, 'libro': None, 'prestamo': prestamo_id, 'multa': None}
+        if prestamo_id is None:
+            resultado['prestamo'] = None
+        elif prestamo_id not in prestamos:
+            resultado['estado'] = NO_EXISTE
+        else:
+            resultado['libro'] = prestamos[prestamo_id][4]
+            # Un código repetido en el lote cuenta como devuelto una sola vez
+            if prestamo_id in devueltos and prestamo_id not in vistos:
+                resultado['estado'] = DEVUELTO
+                resultado['multa'] = multas.get(prestamo_id)
+            else:
+                resultado['estado'] = YA_DEVUELTO
+            vistos.add(prestamo_id)
+        resultados.append(resultado)
+    if devueltos:
+        invalidar_resumen()
+        marcar_cambio(PRESTAMOS, MULTAS, LIBROS)
+    return resultados
+
+
+def anular_devolucion(prestamo, usuario=None):
+    """ Vuelve a dejar activo un préstamo devuelto por error y descuenta la copia otra vez. """
+    with transaction.atomic():
+        if not Prestamo.objects.filter(pk=prestamo.pk, devuelto=True).update(devuelto=False):
+            return False
+        mover_stock(prestamo.libro_id, -1, MovimientoStock.PRESTAMO, prestamo=prestamo, usuario=usuario)
+        avisar_prestamos([prestamo.pk], PRESTADO)
+    invalidar_resumen()
+    marcar_cambio(PRESTAMOS)
+    prestamo.devuelto = False
+    return True
+
+
+def stock_segun_movimientos(libro_ids=None):
+    """ {libro_id: stock} recalculado sumando el registro de movimientos. """
+    movimientos = MovimientoStock.objects.all()
+    if libro_ids is not None:
+        movimientos = movimientos.filter(libro_id__in=libro_ids)
+    return dict(movimientos.values_list('libro_id').annotate(total=Sum('cantidad')).order_by())
+
+
+def diferencias_stock():
+    """ Libros cuyo stock no coincide con la suma de sus movimientos: [(libro_id, actual, esperado)]. """
+    esperado = stock_segun_movimientos()
+    return [
+        (libro_id, copias, esperado.get(libro_id, 0))
+        for libro_id, copias in Libro.objects.values_list('id', 'copias_disponibles').iterator()
+        if copias != esperado.get(libro_id, 0)
+    ]
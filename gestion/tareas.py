@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Prestamo, Multa, ControlTarea
+from .estadisticas import invalidar_resumen
+from .cambios import marcar_cambio, MULTAS
+from .saldos import actualizar_saldos
+
+# Valor de la multa por cada día de retraso
+MULTA_POR_DIA = Decimal('0.50')
+TAREA_MULTAS = 'acumular_multas'
+
+
+def calcular_monto(fecha_devolucion_esperada, hoy):
+    dias_retraso = (hoy - fecha_devolucion_esperada).days
+    return MULTA_POR_DIA * max(dias_retraso, 0)
+
+
+# --- MOTOR DE ACUMULACIÓN DE MULTAS (SE EJECUTA UNA VEZ AL DÍA) ---
+def acumular_multas(hoy=None, forzar=False):
+    """
+    Recalcula en bloque las multas de todos los préstamos vencidos.
+    Usa la marca 'ultima_fecha' de ControlTarea para no repetir el trabajo
+    si ya se procesó el día. Devuelve (creadas, actualizadas) o None si se omitió.
+    """
+    hoy = hoy or timezone.now().date()
+
+    with transaction.atomic():
+        control, _ = ControlTarea.objects.select_for_update().get_or_create(nombre=TAREA_MULTAS)
+        if not forzar and control.ultima_fecha and control.ultima_fecha >= hoy:
+            return None
+
+        vencidos = {
+            prestamo_id: (lector_id, fecha_esperada)
+            for prestamo_id, lector_id, fecha_esperada in Prestamo.objects.filter(
+                devuelto=False, fecha_devolucion_esperada__lt=hoy
+            ).values_list('id', 'lector_id', 'fecha_devolucion_esperada')
+        }
+
+        existentes = {}
+        for multa in Multa.objects.filter(prestamo_id__in=vencidos).only('id', 'prestamo_id', 'monto', 'pagada'):
+            existentes.setdefault(multa.prestamo_id, multa)
+
+        nuevas, cambiadas, lectores = [], [], set()
+        for prestamo_id, (lector_id, fecha_esperada) in vencidos.items():
+            monto = calcular_monto(fecha_esperada, hoy)
+            multa = existentes.get(prestamo_id)
+            if multa is None:
+                nuevas.append(Multa(prestamo_id=prestamo_id, monto=monto))
+            elif not multa.pagada and multa.monto != monto:
+                multa.monto = monto
+                cambiadas.append(multa)
+            else:
+                continue
+            lectores.add(lector_id)
+
+        Multa.objects.bulk_create(nuevas, batch_size=500)
+        Multa.objects.bulk_update(cambiadas, ['monto'], batch_size=500)
+        actualizar_saldos(lectores)
+
+        control.ultima_fecha = hoy
+        control.save(update_fields=['ultima_fecha', 'actualizado'])
+
+    # bulk_create/bulk_update no disparan señales: invalidamos a mano
+    invalidar_resumen()
+    marcar_cambio(MULTAS)
+    return len(nuevas), len(cambiadas)
+
+
+def cobrar_multas(prestamos, hoy=None):
+    """
+    Deja al día y cobra en bloque las multas de los préstamos que se están devolviendo.
+    'prestamos' son tuplas (prestamo_id, lector_id, fecha_devolucion_esperada).
+    Devuelve {prestamo_id: monto cobrado}; debe llamarse dentro de la transacción de la devolución.
+    """
+    hoy = hoy or timezone.now().date()
+    vencidos = {
+        prestamo_id: (lector_id, fecha_esperada)
+        for prestamo_id, lector_id, fecha_esperada in prestamos if fecha_esperada < hoy
+    }
+    existentes = {}
+    for multa in Multa.objects.filter(prestamo_id__in=vencidos).only('id', 'prestamo_id', 'monto', 'pagada'):
+        existentes.setdefault(multa.prestamo_id, multa)
+
+    # Las multas ya pagadas quedan como estaban (misma regla que la acumulación diaria)
+    nuevas, cobradas, lectores = [], [], set()
+    for prestamo_id, (lector_id, fecha_esperada) in vencidos.items():
+        monto = calcular_monto(fecha_esperada, hoy)
+        multa = existentes.get(prestamo_id)
+        if multa is None:
+            nuevas.append(Multa(prestamo_id=prestamo_id, monto=monto, pagada=True))
+        elif not multa.pagada:
+            multa.monto, multa.pagada = monto, True
+            cobradas.append(multa)
+            lectores.add(lector_id)
+
+    Multa.objects.bulk_create(nuevas, batch_size=500)
+    Multa.objects.bulk_update(cobradas, ['monto', 'pagada'], batch_size=500)
+    actualizar_saldos(lectores)
+    return {multa.prestamo_id: multa.monto for multa in nuevas + cobradas}
@@ -1,8 +1,21 @@
-from django import template
-from django.contrib.auth.models import Group
-
-register = template.Library()
-
-@register.filter(name='has_group')
-def has_group(user, group_name):
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+from django import template
+
+from gestion.roles import tiene_grupo, grupos_de, GRUPO_BIBLIOTECARIOS, GRUPO_BODEGERO
+
+register = template.Library()
+
+@register.filter(name='has_group')
+def has_group(user, group_name):
+    return tiene_grupo(user, group_name)
+
+@register.simple_tag
+def firma_rol(user):
+    """ Lo que cambia el menú según el usuario; es la clave del fragmento 'navbar' en caché. """
+    if not user.is_authenticated:
+        return 'anonimo'
+    partes = sorted(grupos_de(user) & {GRUPO_BIBLIOTECARIOS, GRUPO_BODEGERO})
+    if user.is_superuser:
+        partes.append('superusuario')
+    if user.is_staff:
+        partes.append('staff')
+    return '|'.join(partes) or 'lector'
@@ -0,0 +1,37 @@
+from django import template
+from django.urls import reverse
+
+from gestion.portadas import TAMANOS
+
+register = template.Library()
+
+
+def _url(huella, tamano, formato):
+    return reverse('gestion:miniatura_portada', kwargs={'huella': huella, 'tamano': tamano, 'formato': formato})
+
+
+@register.inclusion_tag('portada.html')
+def portada(libro, tamano='m'):
+    """
+    <picture> con las miniaturas locales (WebP y JPEG) y carga diferida.
+    Usa libro.portada, así que la consulta debe traerla con select_related('portada').
+    """
+    miniatura = getattr(libro, 'portada', None)
+    huella = miniatura.huella if miniatura is not None else ''
+    if not huella:
+        return {'huella': '', 'alt': libro.titulo}
+    ancho = alto = None
+    if miniatura.ancho and miniatura.alto:
+        # Solo para reservar el espacio (relación de aspecto) antes de que llegue la imagen
+        ancho = min(TAMANOS[tamano], miniatura.ancho)
+        alto = round(miniatura.alto * ancho / miniatura.ancho)
+    return {
+        'huella': huella,
+        'alt': libro.titulo,
+        'src': _url(huella, tamano, 'jpg'),
+        'srcset_webp': ', '.join(f'{_url(huella, nombre, "webp")} {px}w' for nombre, px in TAMANOS.items()),
+        'srcset_jpg': ', '.join(f'{_url(huella, nombre, "jpg")} {px}w' for nombre, px in TAMANOS.items()),
+        'sizes': f'{TAMANOS[tamano]}px',
+        'ancho': ancho,
+        'alto': alto,
+    }
@@ -1,3 +1,1610 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xmlrpc.server import MultiPathXMLRPCServer, SimpleXMLRPCDispatcher, SimpleXMLRPCRequestHandler
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, close_old_connections
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.http import QueryDict
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Autor, Libro, Lector, Prestamo, Multa, OperacionOdoo, MetadatoISBN, MovimientoStock, Portada, SaldoLector,
+    Reserva, IngestaCatalogo,
+)
+from .tareas import acumular_multas
+from .estadisticas import obtener_resumen
+from .roles import grupos_de, tiene_grupo
+from .busqueda import buscador
+from .paginacion import PaginadorEstimado, paginar
+from .odoo import ClienteOdoo, encolar_libro, encolar_libros, procesar_pendientes
+from .openlibrary import consultar_isbns, consultar_isbns_async, leer_isbns, estadisticas_cache
+from .importacion import importar_libros
+from .rendimiento import OrigenLento
+from .portadas import procesar_portadas
+from . import monitoreo
+from .cache import estadisticas as estadisticas_cache_paginas, reiniciar_estadisticas
+from .cambios import marcar_cambio
+from .saldos import actualizar_saldos, diferencias_saldos
+from .basedatos import RouterReplica, leyendo_de_replica, pragmas_actuales
+from .ingesta import ingestar
+from .eventos import BrokerLocal, avisar_prestamos, PANEL, BODEGA, RECARGAR
+from .reservas import cancelar_reserva, posicion, reservar, reservas_de, siguiente_en_espera, vencer_reservas
+from .stock import (
+    StockInsuficiente, ajustar_stock, diferencias_stock, registrar_devolucion, registrar_devoluciones,
+    registrar_prestamo, registrar_prestamos,
+)
+
+
+def crear_datos_base():
+    autor = Autor.objects.create(nombre="Gabriel", apellido="García Márquez")
+    libro = Libro.objects.create(titulo="Cien años de soledad", autor=autor, copias_disponibles=3)
+    user = User.objects.create_user(username="lector1", password="clave-segura-123")
+    lector = Lector.objects.create(user=user, identificacion="1700000001")
+    return autor, libro, lector
+
+
+# --- MOTOR DE MULTAS ---
+class AcumularMultasTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.hoy = timezone.now().date()
+
+    def prestar(self, dias_vencido, devuelto=False):
+        return Prestamo.objects.create(
+            libro=self.libro, lector=self.lector, devuelto=devuelto,
+            fecha_devolucion_esperada=self.hoy - timedelta(days=dias_vencido),
+        )
+
+    def test_crea_y_actualiza_multas_en_bloque(self):
+        vencido = self.prestar(4)
+        self.prestar(-2)  # Todavía no vence
+        self.prestar(10, devuelto=True)
+
+        self.assertEqual(acumular_multas(hoy=self.hoy), (1, 0))
+        self.assertEqual(Multa.objects.get(prestamo=vencido).monto, Decimal('2.00'))
+
+        self.assertEqual(acumular_multas(hoy=self.hoy + timedelta(days=2)), (0, 1))
+        self.assertEqual(Multa.objects.get(prestamo=vencido).monto, Decimal('3.00'))
+
+    def test_no_repite_el_mismo_dia(self):
+        self.prestar(3)
+        acumular_multas(hoy=self.hoy)
+        self.assertIsNone(acumular_multas(hoy=self.hoy))
+        self.assertEqual(acumular_multas(hoy=self.hoy, forzar=True), (0, 0))
+
+    def test_no_toca_multas_pagadas(self):
+        prestamo = self.prestar(5)
+        Multa.objects.create(prestamo=prestamo, monto=Decimal('1.00'), pagada=True)
+        acumular_multas(hoy=self.hoy)
+        self.assertEqual(Multa.objects.get(prestamo=prestamo).monto, Decimal('1.00'))
+
+    def test_las_vistas_no_generan_multas(self):
+        self.prestar(3)
+        self.client.get(reverse('gestion:inicio'))
+        self.client.get(reverse('gestion:multas'))
+        self.assertFalse(Multa.objects.exists())
+
+    def test_devolucion_cobra_la_multa_del_prestamo(self):
+        prestamo = self.prestar(2)
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        self.client.get(reverse('gestion:devolver_prestamo', args=[prestamo.pk]))
+        multa = Multa.objects.get(prestamo=prestamo)
+        self.assertTrue(multa.pagada)
+        self.assertEqual(multa.monto, Decimal('1.00'))
+
+
+# --- RESUMEN DEL PANEL ---
+class ResumenPanelTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        cache.clear()
+
+    def test_segunda_visita_lee_de_cache(self):
+        url = reverse('gestion:panel_bibliotecario')
+        self.client.get(url)
+        with self.assertNumQueries(2):  # Sesión y usuario
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.context['total_libros'], 1)
+
+    def test_las_senales_invalidan_el_resumen(self):
+        self.assertEqual(obtener_resumen()['total_libros'], 1)
+        Libro.objects.create(titulo="El otoño del patriarca", autor=self.autor)
+        self.assertEqual(obtener_resumen()['total_libros'], 2)
+
+    def test_forzar_reconstruye(self):
+        resumen = obtener_resumen()
+        self.assertGreater(obtener_resumen(forzar=True)['generado'], resumen['generado'])
+
+
+# --- ROLES EN CACHÉ ---
+class RolesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bodega1", password="clave-segura-123")
+        self.bodega = Group.objects.create(name="Bodegero")
+        cache.clear()
+
+    def recargar(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_una_consulta_por_usuario(self):
+        self.user.groups.add(self.bodega)
+        user = self.recargar()
+        with self.assertNumQueries(1):
+            self.assertTrue(tiene_grupo(user, "Bodegero"))
+            self.assertFalse(tiene_grupo(user, "Bibliotecarios"))
+        user = self.recargar()
+        with self.assertNumQueries(0):
+            self.assertEqual(grupos_de(user), frozenset({"Bodegero"}))
+
+    def test_cambios_de_grupo_invalidan_la_cache(self):
+        grupos_de(self.recargar())
+        self.user.groups.add(self.bodega)
+        self.assertIn("Bodegero", grupos_de(self.recargar()))
+        self.bodega.user_set.remove(self.user)
+        self.assertNotIn("Bodegero", grupos_de(self.recargar()))
+        self.user.groups.add(self.bodega)
+        grupos_de(self.recargar())
+        self.bodega.user_set.clear()
+        self.assertEqual(grupos_de(self.recargar()), frozenset())
+
+    def test_guardar_el_usuario_invalida_la_cache(self):
+        self.user.groups.add(self.bodega)
+        grupos_de(self.recargar())
+        # Otro worker quitó el grupo sin que este proceso se enterara
+        User.groups.through.objects.filter(user=self.user).delete()
+        self.assertIn("Bodegero", grupos_de(self.recargar()))
+        user = self.recargar()
+        user.is_staff = False
+        user.save()
+        self.assertEqual(grupos_de(self.recargar()), frozenset())
+
+
+# --- BÚSQUEDA DE TEXTO COMPLETO ---
+class BusquedaTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        Libro.objects.create(titulo="El amor en los tiempos del cólera", autor=self.autor, copias_disponibles=1)
+        otro = Autor.objects.create(nombre="Julio", apellido="Cortázar")
+        Libro.objects.create(titulo="Rayuela", autor=otro, copias_disponibles=2, estante="Pasillo B")
+
+    def titulos(self, texto):
+        motor = buscador()
+        libros = motor.ordenar_libros(Libro.objects.filter(motor.q_libros(texto)), texto)
+        return [libro.titulo for libro in libros]
+
+    def test_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(self.titulos("anos soled"), ["Cien años de soledad"])
+        self.assertEqual(self.titulos("colera"), ["El amor en los tiempos del cólera"])
+        self.assertEqual(self.titulos("cortaz"), ["Rayuela"])
+        self.assertEqual(self.titulos("pasillo b"), ["Rayuela"])
+        self.assertEqual(self.titulos("***"), [])
+
+    def test_se_sincroniza_con_los_modelos(self):
+        self.autor.apellido = "Márquez"
+        self.autor.save()
+        self.assertEqual(len(self.titulos("marquez")), 2)
+        self.libro.delete()
+        self.assertEqual(len(self.titulos("marquez")), 1)
+
+    def test_busqueda_de_prestamos_por_lector(self):
+        Prestamo.objects.create(libro=self.libro, lector=self.lector, fecha_devolucion_esperada=timezone.now().date())
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        respuesta = self.client.get(reverse('gestion:prestamos'), {'q': '170000'})
+        self.assertEqual(len(respuesta.context['prestamos_activos']), 1)
+        self.lector.user.username = "lectora"
+        self.lector.user.save()
+        respuesta = self.client.get(reverse('gestion:prestamos'), {'q': 'lectora'})
+        self.assertEqual(len(respuesta.context['prestamos_activos']), 1)
+
+
+# --- PAGINACIÓN POR CURSOR Y EXPORTACIONES ---
+class PaginacionTests(TestCase):
+    def setUp(self):
+        self.autor = Autor.objects.create(nombre="Isabel", apellido="Allende")
+        for i in range(7):
+            Libro.objects.create(titulo=f"Libro {i % 3}", autor=self.autor, estante=None if i % 2 else "A1")
+
+    def recorrer(self, orden, tamano=2):
+        vistos, cursor = [], None
+        while True:
+            request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+            pagina = paginar(request, Libro.objects.annotate(estante_orden=Coalesce('estante', Value(''))), orden, tamano=tamano)
+            vistos.extend(libro.pk for libro in pagina)
+            if not pagina.url_siguiente:
+                return vistos
+            cursor = QueryDict(pagina.url_siguiente[1:])['cursor']
+
+    def test_recorre_todo_sin_repetir(self):
+        for orden in [('titulo', 'id'), ('-titulo', '-id'), ('estante_orden', 'titulo', 'id')]:
+            esperado = list(Libro.objects.annotate(
+                estante_orden=Coalesce('estante', Value(''))
+            ).order_by(*orden).values_list('pk', flat=True))
+            self.assertEqual(self.recorrer(orden), esperado)
+
+    def test_cursor_invalido_empieza_de_cero(self):
+        request = RequestFactory().get('/', {'cursor': 'basura'})
+        pagina = paginar(request, Libro.objects.all(), ('titulo', 'id'), tamano=3)
+        self.assertEqual(len(pagina), 3)
+        self.assertIsNone(pagina.url_primera)
+
+    def test_exportacion_csv_en_streaming(self):
+        respuesta = self.client.get(reverse('gestion:libros'), {'formato': 'csv'})
+        self.assertTrue(respuesta.streaming)
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual(len(lineas), 8)
+        self.assertTrue(lineas[0].startswith('id,titulo'))
+
+    def test_exportar_lectores_y_multas_exige_personal(self):
+        for nombre in ('gestion:lectores', 'gestion:multas'):
+            respuesta = self.client.get(reverse(nombre), {'formato': 'json'})
+            self.assertEqual(respuesta.status_code, 302)
+            self.assertIn(reverse('gestion:ingresar'), respuesta.url)
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        respuesta = self.client.get(reverse('gestion:lectores'), {'formato': 'csv'})
+        self.assertIn('user__email', b''.join(respuesta.streaming_content).decode())
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        hoy = timezone.now().date()
+        self.vencido = registrar_prestamo(self.libro.pk, self.lector, hoy - timedelta(days=3))
+        self.activo = registrar_prestamo(self.libro.pk, self.lector, hoy + timedelta(days=7))
+
+    def test_filtra_como_la_vista(self):
+        respuesta = self.client.get(reverse('gestion:prestamos'), {'formato': 'csv', 'estado': 'vencidos'})
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([linea.split(',')[0] for linea in lineas], ['id', str(self.vencido.pk)])
+
+    def test_xlsx_en_streaming(self):
+        respuesta = self.client.get(reverse('gestion:inventario_bodega'), {'formato': 'xlsx', 'q': 'soledad'})
+        self.assertTrue(respuesta.streaming)
+        with zipfile.ZipFile(BytesIO(b''.join(respuesta.streaming_content))) as libro:
+            hoja = libro.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(hoja.count('<row>'), 2)
+        self.assertIn('Cien años de soledad', hoja)
+
+    def test_comando_escribe_el_reporte(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            salida = f"{carpeta}/prestamos.csv"
+            call_command('exportar_reporte', 'prestamos', '--estado', 'activos', '--salida', salida, stderr=StringIO())
+            with open(salida, encoding='utf-8') as archivo:
+                self.assertEqual(len(archivo.read().splitlines()), 3)
+            with self.assertRaises(CommandError):
+                call_command('exportar_reporte', 'facturas', '--estado', 'vencidos', '--salida', salida)
+
+
+# --- PRESUPUESTO DE CONSULTAS (DETECTA N+1) ---
+@contextmanager
+def presupuesto_consultas(test, maximo):
+    """ Falla si dentro del bloque se ejecutan más de 'maximo' consultas SQL. """
+    with CaptureQueriesContext(connection) as contexto:
+        yield contexto
+    consultas = "\n".join(q['sql'] for q in contexto.captured_queries)
+    test.assertLessEqual(len(contexto), maximo, f"{len(contexto)} consultas:\n{consultas}")
+
+
+def poblar(n, desde=0):
+    """ Crea n libros, lectores, préstamos (mitad devueltos) y multas con inserciones en bloque. """
+    hoy = timezone.now().date()
+    autores = Autor.objects.bulk_create([
+        Autor(nombre=f"Nombre{i}", apellido=f"Apellido{i}") for i in range(desde, desde + n)
+    ])
+    libros = Libro.objects.bulk_create([
+        Libro(titulo=f"Libro {i}", autor=autores[i - desde], copias_disponibles=i % 7, estante=f"E{i % 10}")
+        for i in range(desde, desde + n)
+    ])
+    usuarios = User.objects.bulk_create([User(username=f"usuario{i}") for i in range(desde, desde + n)])
+    lectores = Lector.objects.bulk_create([
+        Lector(user=usuario, identificacion=f"ID{i:07d}") for i, usuario in enumerate(usuarios, desde)
+    ])
+    prestamos = Prestamo.objects.bulk_create([
+        Prestamo(libro=libro, lector=lector, devuelto=i % 2 == 0,
+                 fecha_devolucion_esperada=hoy - timedelta(days=i % 9))
+        for i, (libro, lector) in enumerate(zip(libros, lectores))
+    ])
+    Multa.objects.bulk_create([Multa(prestamo=prestamo, monto=Decimal('1.50')) for prestamo in prestamos])
+    actualizar_saldos(lector.pk for lector in lectores)
+    # Sin señales: se invalidan a mano las páginas y fragmentos en caché, como en generar_datos
+    marcar_cambio()
+
+
+class PresupuestoConsultasMixin:
+    """
+    Carga la misma vista con pocos y muchos registros: el número de consultas
+    debe ser igual en ambos casos (sin N+1) y no superar 'maximo'.
+    """
+    tamanos = (10, 1000)
+
+    def comprobar_presupuesto(self, url, maximo, **parametros):
+        conteos = []
+        creados = 0
+        self.client.get(url, parametros)  # Calienta las cachés (roles, sesión)
+        for tamano in self.tamanos:
+            poblar(tamano - creados, desde=creados)
+            creados = tamano
+            with presupuesto_consultas(self, maximo) as contexto:
+                respuesta = self.client.get(url, parametros)
+            self.assertEqual(respuesta.status_code, 200)
+            conteos.append(len(contexto))
+        self.assertEqual(len(set(conteos)), 1, f"Las consultas crecen con los datos: {conteos}")
+
+
+class ConsultasVistasTests(PresupuestoConsultasMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        cache.clear()
+
+    def test_lista_libros(self):
+        self.comprobar_presupuesto(reverse('gestion:libros'), 4)
+
+    def test_lista_autores(self):
+        self.comprobar_presupuesto(reverse('gestion:autores'), 4)
+
+    def test_lista_lectores(self):
+        self.comprobar_presupuesto(reverse('gestion:lectores'), 4)
+
+    def test_lista_prestamos(self):
+        self.comprobar_presupuesto(reverse('gestion:prestamos'), 5)
+
+    def test_lista_prestamos_con_busqueda(self):
+        self.comprobar_presupuesto(reverse('gestion:prestamos'), 5, q='libro')
+
+    def test_lista_multas(self):
+        self.comprobar_presupuesto(reverse('gestion:multas'), 4)
+
+    def test_lista_facturas(self):
+        self.comprobar_presupuesto(reverse('gestion:facturas'), 4)
+
+    def test_inventario_bodega(self):
+        self.comprobar_presupuesto(reverse('gestion:inventario_bodega'), 6)
+
+    def test_catalogo_lector(self):
+        self.comprobar_presupuesto(reverse('gestion:catalogo_lector'), 4)
+
+    def test_nuevo_prestamo(self):
+        self.comprobar_presupuesto(reverse('gestion:nuevo_prestamo'), 5)
+
+    def test_admin_multas(self):
+        self.comprobar_presupuesto(reverse('admin:gestion_multa_changelist'), 10)
+
+    def test_admin_prestamos(self):
+        self.comprobar_presupuesto(reverse('admin:gestion_prestamo_changelist'), 10)
+
+    def test_admin_libros(self):
+        self.comprobar_presupuesto(reverse('admin:gestion_libro_changelist'), 10)
+
+
+# --- ADMIN PARA TABLAS GRANDES ---
+class AdminEscalableTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+        self.client.force_login(self.admin)
+        self.hoy = timezone.now().date()
+
+    def test_filtro_de_lector_no_lista_a_todos(self):
+        poblar(20)
+        lector = Lector.objects.get(identificacion="ID0000007")
+        url = reverse('admin:gestion_prestamo_changelist')
+        # Ningún enlace por lector en el panel de filtros
+        self.assertNotContains(self.client.get(url), "lector__pk__exact=")
+        respuesta = self.client.get(url, {'lector__pk__exact': lector.pk})
+        self.assertEqual(respuesta.context['cl'].result_count, 1)
+        self.assertContains(respuesta, 'data-field-name="lector"')
+        self.assertContains(respuesta, "usuario7 (ID0000007)")
+
+    def test_conteo_estimado(self):
+        poblar(30)
+        Prestamo.objects.filter(pk__in=Prestamo.objects.order_by('pk').values('pk')[:5]).delete()
+        maximo = Prestamo.objects.order_by('-pk').values_list('pk', flat=True)[0]
+        with mock.patch('gestion.paginacion.LIMITE_CONTEO', 10):
+            # Sin filtros en SQLite: el id más alto, sin COUNT(*)
+            self.assertEqual(PaginadorEstimado(Prestamo.objects.all(), 10).count, maximo)
+            # Con filtros se cuenta hasta el límite
+            self.assertEqual(PaginadorEstimado(Prestamo.objects.filter(devuelto=True), 10).count, 10)
+            self.assertEqual(PaginadorEstimado(Prestamo.objects.filter(lector__identificacion="ID0000029"), 10).count, 1)
+        self.assertEqual(PaginadorEstimado(Prestamo.objects.all(), 10).count, 25)
+
+    def test_marcar_devueltos_repone_el_stock(self):
+        vencido = registrar_prestamo(self.libro.pk, self.lector, self.hoy - timedelta(days=2))
+        vigente = registrar_prestamo(self.libro.pk, self.lector, self.hoy + timedelta(days=7))
+        respuesta = self.client.post(reverse('admin:gestion_prestamo_changelist'), {
+            'action': 'marcar_devueltos', '_selected_action': [vencido.pk, vigente.pk],
+        }, follow=True)
+        self.assertContains(respuesta, "2 préstamos marcados como devueltos")
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.copias_disponibles, 3)
+        self.assertFalse(Prestamo.objects.filter(devuelto=False).exists())
+        self.assertEqual(Multa.objects.filter(prestamo=vencido).count(), 1)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_marcar_pagadas_actualiza_saldos(self):
+        poblar(30)
+        self.assertTrue(SaldoLector.objects.filter(deuda__gt=0).exists())
+        respuesta = self.client.post(reverse('admin:gestion_multa_changelist'), {
+            'action': 'marcar_pagadas', 'select_across': '1',
+            '_selected_action': list(Multa.objects.values_list('pk', flat=True)[:1]),
+        }, follow=True)
+        self.assertContains(respuesta, "30 multas marcadas como pagadas")
+        self.assertFalse(Multa.objects.filter(pagada=False).exists())
+        self.assertFalse(SaldoLector.objects.filter(deuda__gt=0).exists())
+        self.assertEqual(diferencias_saldos(), [])
+
+
+# --- COLA DE ODOO CON UN SERVIDOR XML-RPC FALSO ---
+class ManejadorOdoo(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object')
+
+
+class OdooFalso:
+    """ Servidor XML-RPC local que imita los servicios 'common' y 'object' de Odoo. """
+    def __init__(self):
+        self.libros = {}
+        self.autenticaciones = 0
+        self.fallar = False
+        self.servidor = MultiPathXMLRPCServer(
+            ('127.0.0.1', 0), requestHandler=ManejadorOdoo, logRequests=False, allow_none=True
+        )
+        common = SimpleXMLRPCDispatcher(allow_none=True)
+        common.register_function(self.authenticate, 'authenticate')
+        objeto = SimpleXMLRPCDispatcher(allow_none=True)
+        objeto.register_function(self.execute_kw, 'execute_kw')
+        self.servidor.add_dispatcher('/xmlrpc/2/common', common)
+        self.servidor.add_dispatcher('/xmlrpc/2/object', objeto)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def authenticate(self, db, usuario, clave, contexto):
+        self.autenticaciones += 1
+        return 7
+
+    def execute_kw(self, db, uid, clave, modelo, metodo, args, kwargs):
+        if self.fallar:
+            raise ValueError("Odoo caído")
+        if metodo == 'search':
+            isbn = args[0][0][2]
+            return [i for i, datos in self.libros.items() if datos['isbn'] == isbn][:1]
+        nuevo_id = len(self.libros) + 1
+        self.libros[nuevo_id] = args[0]
+        return nuevo_id
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class ColaOdooTests(TestCase):
+    def setUp(self):
+        self.odoo = OdooFalso()
+        self.addCleanup(self.odoo.cerrar)
+        self.cliente = ClienteOdoo(url=self.odoo.url, db='test', usuario='u', clave='c', timeout=5)
+
+    def test_envia_en_lote_con_una_sola_autenticacion(self):
+        encolar_libro("Rayuela", "9788437604572")
+        encolar_libro("Ficciones", "9788420633114")
+        self.assertEqual(procesar_pendientes(self.cliente), (2, 0))
+        self.assertEqual(self.odoo.autenticaciones, 1)
+        self.assertEqual(OperacionOdoo.objects.filter(estado=OperacionOdoo.ENVIADA).count(), 2)
+
+    def test_isbn_repetido_no_duplica(self):
+        encolar_libro("Rayuela", "9788437604572")
+        procesar_pendientes(self.cliente)
+        encolar_libro("Rayuela", "9788437604572")
+        self.assertEqual(procesar_pendientes(self.cliente), (0, 0))
+        self.assertEqual(len(self.odoo.libros), 1)
+
+    def test_reencolar_en_bloque_actualiza_el_titulo(self):
+        encolar_libros([("Rayuela (borrador)", "9788437604572")])
+        encolar_libros([("Rayuela", "9788437604572"), ("Ficciones", "9788420633114")])
+        self.assertEqual(
+            dict(OperacionOdoo.objects.values_list('isbn', 'titulo')),
+            {"9788437604572": "Rayuela", "9788420633114": "Ficciones"},
+        )
+
+    def test_reintenta_con_espera_exponencial(self):
+        encolar_libro("Rayuela", "9788437604572")
+        self.odoo.fallar = True
+        self.assertEqual(procesar_pendientes(self.cliente), (0, 1))
+        operacion = OperacionOdoo.objects.get()
+        self.assertEqual(operacion.intentos, 1)
+        self.assertGreater(operacion.proximo_intento, timezone.now())
+        self.assertEqual(procesar_pendientes(self.cliente), (0, 0))  # Aún no toca reintentar
+
+        self.odoo.fallar = False
+        OperacionOdoo.objects.update(proximo_intento=timezone.now())
+        self.assertEqual(procesar_pendientes(self.cliente), (1, 0))
+
+    def test_odoo_apagado_no_bloquea(self):
+        self.odoo.cerrar()
+        encolar_libro("Rayuela", "9788437604572")
+        self.assertEqual(procesar_pendientes(self.cliente), (0, 1))
+        self.assertEqual(OperacionOdoo.objects.get().estado, OperacionOdoo.PENDIENTE)
+
+
+# --- IMPORTACIÓN POR LOTE CON UN OPEN LIBRARY FALSO ---
+LIBROS_OPENLIBRARY = {
+    '9788437604572': {'title': 'Rayuela', 'authors': [{'name': 'Julio Cortázar'}],
+                      'publish_date': '1963', 'number_of_pages': 600},
+    '9788420633114': {'title': 'Ficciones', 'authors': [{'name': 'Jorge Luis Borges'}],
+                      'publish_date': 'May 1944', 'cover': {'large': 'https://covers.example/f.jpg'}},
+    '9780307474728': {'title': 'Cien años de soledad', 'authors': [{'name': 'Gabriel García Márquez'}]},
+}
+
+
+class OpenLibraryFalso:
+    """ Servidor HTTP local que responde como /api/books de Open Library. """
+    def __init__(self, libros):
+        falso = self
+        self.llamadas = []
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parametros = parse_qs(urlparse(self.path).query)
+                claves = parametros['bibkeys'][0].split(',')
+                falso.llamadas.append(claves)
+                cuerpo = {clave: libros[clave[5:]] for clave in claves if clave[5:] in libros}
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class ImportacionLoteTests(TestCase):
+    def setUp(self):
+        self.api = OpenLibraryFalso(LIBROS_OPENLIBRARY)
+        self.addCleanup(self.api.cerrar)
+        ajustes = override_settings(OPENLIBRARY_URL=self.api.url)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        cache.clear()
+
+    def test_leer_isbns(self):
+        self.assertEqual(leer_isbns("978-84-376-0457-2, 9788420633114\n123\n9788437604572"),
+                         ['9788437604572', '9788420633114'])
+
+    def test_consulta_en_lotes(self):
+        isbns = list(LIBROS_OPENLIBRARY) + ['9780000000001']
+        encontrados, errores = consultar_isbns(isbns, por_llamada=2)
+        self.assertEqual(set(encontrados), set(LIBROS_OPENLIBRARY))
+        self.assertEqual(errores, {})
+        self.assertEqual(len(self.api.llamadas), 2)
+
+    def test_importa_y_reporta_por_isbn(self):
+        Autor.objects.create(nombre="Julio", apellido="Cortázar")
+        Libro.objects.create(titulo="Rayuela", autor=Autor.objects.get(), copias_disponibles=1)
+        archivo = SimpleUploadedFile("isbns.csv", b"isbn\n9788420633114\n")
+        respuesta = self.client.post(reverse('gestion:importar_lote'), {
+            'isbns': "9788437604572\n9780307474728\n9780000000001", 'archivo': archivo,
+        })
+        estados = {fila['isbn']: fila['estado'] for fila in respuesta.context['reporte']}
+        self.assertEqual(estados, {
+            '9788437604572': 'actualizado', '9780307474728': 'creado',
+            '9788420633114': 'creado', '9780000000001': 'no encontrado',
+        })
+        self.assertEqual(Libro.objects.count(), 3)
+        self.assertEqual(Autor.objects.count(), 3)
+        self.assertEqual(Libro.objects.get(titulo="Ficciones").publicacion, 1944)
+        self.assertEqual(OperacionOdoo.objects.count(), 3)
+        self.assertEqual([libro.titulo for libro in Libro.objects.filter(buscador().q_libros("borges"))], ["Ficciones"])
+
+    def test_importacion_individual(self):
+        self.client.get(reverse('gestion:buscar_api'), {'isbn': '978-84-376-0457-2'})
+        self.client.get(reverse('gestion:buscar_api'), {'isbn': '9788437604572', 'confirmar_importar': ''})
+        libro = Libro.objects.get()
+        self.assertEqual((libro.titulo, libro.copias_disponibles, libro.autor.apellido), ("Rayuela", 5, "Cortázar"))
+        self.assertEqual(len(self.api.llamadas), 1)  # La confirmación reutiliza la vista previa
+
+    def test_cache_de_isbn(self):
+        consultar_isbns(['9788437604572', '9780000000001'])
+        encontrados, _ = consultar_isbns(['9788437604572', '9780000000001'])
+        self.assertEqual(list(encontrados), ['9788437604572'])
+        self.assertEqual(len(self.api.llamadas), 1)  # El desconocido también quedó en caché
+        self.assertEqual(estadisticas_cache(), {'aciertos': 2, 'fallos': 2, 'guardados': 2})
+
+        MetadatoISBN.objects.update(consultado=timezone.now() - timedelta(days=2))
+        consultar_isbns(['9788437604572', '9780000000001'])
+        self.assertEqual(self.api.llamadas[-1], ['ISBN:9780000000001'])  # Venció solo la negativa
+
+    def test_cache_descarta_los_menos_usados(self):
+        with mock.patch('gestion.openlibrary.MAX_METADATOS', 2):
+            consultar_isbns(['9788437604572'])
+            MetadatoISBN.objects.update(ultimo_uso=timezone.now() - timedelta(days=1))
+            consultar_isbns(['9788420633114', '9780307474728'])
+        self.assertEqual(set(MetadatoISBN.objects.values_list('isbn', flat=True)), {'9788420633114', '9780307474728'})
+
+
+# --- CONTABILIDAD DE STOCK ---
+class StockTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+        self.vence = timezone.now().date() + timedelta(days=7)
+
+    def stock(self):
+        self.libro.refresh_from_db()
+        return self.libro.copias_disponibles
+
+    def test_prestamo_y_devolucion_mueven_el_stock(self):
+        prestamo = registrar_prestamo(self.libro.pk, self.lector, self.vence)
+        self.assertEqual(self.stock(), 2)
+        self.assertTrue(registrar_devolucion(prestamo))
+        self.assertFalse(registrar_devolucion(prestamo))  # Segunda devolución: no repone otra copia
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_no_presta_sin_copias(self):
+        ajustar_stock(self.libro.pk, 0)
+        with self.assertRaises(StockInsuficiente):
+            registrar_prestamo(self.libro.pk, self.lector, self.vence)
+        self.assertFalse(Prestamo.objects.exists())
+        self.assertEqual(self.stock(), 0)
+
+    def test_vista_de_bodega_valida_y_registra_el_ajuste(self):
+        self.client.force_login(self.admin)
+        url = reverse('gestion:actualizar_stock_bodega', args=[self.libro.pk])
+        self.client.post(url, {'stock': 'muchos', 'estante': 'A1'})
+        self.assertEqual(self.stock(), 3)
+        self.client.post(url, {'stock': '8', 'estante': 'A1'})
+        self.assertEqual(self.stock(), 8)
+        self.assertEqual(self.libro.estante, 'A1')
+        ajuste = MovimientoStock.objects.get(tipo=MovimientoStock.AJUSTE)
+        self.assertEqual((ajuste.cantidad, ajuste.usuario), (5, self.admin))
+
+    def test_vista_de_nuevo_prestamo(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('gestion:nuevo_prestamo'), {
+            'libro': self.libro.pk, 'lector': self.lector.pk, 'fecha_devolucion': self.vence.isoformat(),
+        })
+        self.assertEqual(Prestamo.objects.filter(libro=self.libro).count(), 1)
+        self.assertEqual(self.stock(), 2)
+
+    def test_reimportar_fija_el_stock_y_lo_registra(self):
+        registrar_prestamo(self.libro.pk, self.lector, self.vence)
+        importar_libros([{
+            'isbn': '9780307474728', 'titulo': self.libro.titulo, 'autor_principal': "Gabriel García Márquez",
+            'anio': 1967, 'paginas': 471, 'portada': '',
+        }], copias=5)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(MovimientoStock.objects.get(tipo=MovimientoStock.IMPORTACION).cantidad, 3)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_verificar_stock_detecta_y_corrige(self):
+        Libro.objects.filter(pk=self.libro.pk).update(copias_disponibles=10)  # Cambio por fuera del registro
+        self.assertEqual(diferencias_stock(), [(self.libro.pk, 10, 3)])
+        call_command('verificar_stock', '--corregir', stdout=StringIO())
+        self.assertEqual(diferencias_stock(), [])
+
+
+class OperacionesLoteTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+        self.hoy = timezone.now().date()
+
+    def test_prestamo_en_lote_valida_stock_de_todo_el_lote(self):
+        otro = Libro.objects.create(titulo="La hojarasca", autor=self.autor, copias_disponibles=1)
+        resultados = registrar_prestamos(
+            [otro.pk, otro.pk, self.libro.pk, 999999, 'abc'], self.lector, self.hoy + timedelta(days=7)
+        )
+        self.assertEqual(
+            [fila['estado'] for fila in resultados], ['prestado', 'sin_stock', 'prestado', 'no_existe', 'invalido']
+        )
+        self.assertEqual(Prestamo.objects.get(pk=resultados[0]['prestamo']).libro, otro)
+        otro.refresh_from_db()
+        self.libro.refresh_from_db()
+        self.assertEqual((otro.copias_disponibles, self.libro.copias_disponibles), (0, 2))
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_devolucion_en_lote_sin_consultas_por_prestamo(self):
+        Libro.objects.filter(pk=self.libro.pk).update(copias_disponibles=600)
+        MovimientoStock.objects.filter(libro=self.libro).update(cantidad=600)
+        vencido = self.hoy - timedelta(days=4)
+
+        def prestar(n):
+            ids = [fila['prestamo'] for fila in registrar_prestamos([self.libro.pk] * n, self.lector, vencido)]
+            acumular_multas(hoy=self.hoy - timedelta(days=2), forzar=True)
+            return ids
+
+        conteos = []
+        for n in (5, 500):
+            ids = prestar(n)
+            with CaptureQueriesContext(connection) as contexto:
+                resultados = registrar_devoluciones(ids + [ids[0]])
+            conteos.append(len(contexto))
+            self.assertEqual([fila['estado'] for fila in resultados], ['devuelto'] * n + ['ya_devuelto'])
+            # Multa al día de hoy (4 días), no la de la última acumulación (2 días)
+            self.assertEqual(resultados[0]['multa'], Decimal('2.00'))
+        # Sin N+1: solo crecen los lotes de las inserciones (SQLite admite 999 parámetros por consulta)
+        self.assertLessEqual(conteos[1] - conteos[0], 6, conteos)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.copias_disponibles, 600)
+        self.assertFalse(Multa.objects.filter(pagada=False).exists())
+        self.assertEqual(SaldoLector.objects.get(lector=self.lector).deuda, 0)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_vistas_en_lote_aceptan_json(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('gestion:prestar_lote'), {
+            'libros': [self.libro.pk, self.libro.pk], 'identificacion': self.lector.identificacion,
+            'fecha_devolucion': self.hoy.isoformat(),
+        }, content_type='application/json')
+        datos = respuesta.json()
+        self.assertEqual(datos['totales'], {'prestado': 2})
+
+        respuesta = self.client.post(
+            reverse('gestion:devolver_lote'), {'prestamos': f"{datos['resultados'][0]['prestamo']}\n777"}
+        )
+        self.assertEqual([fila['estado'] for fila in respuesta.context['reporte']], ['devuelto', 'no_existe'])
+        self.assertEqual(
+            self.client.post(reverse('gestion:prestar_lote'), {'libros': [1]}, content_type='application/json').status_code,
+            400,
+        )
+
+
+class StockConcurrenteTests(TransactionTestCase):
+    """ Varios hilos (cada uno con su conexión) compiten por el mismo libro o préstamo. """
+    hilos = 8
+
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+
+    def en_paralelo(self, funcion):
+        resultados, inicio = [], threading.Barrier(self.hilos)
+
+        def trabajo():
+            inicio.wait()
+            try:
+                # La base de pruebas en memoria de SQLite bloquea tablas enteras: se reintenta como haría el cliente
+                for _ in range(200):
+                    try:
+                        resultados.append(funcion())
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            except Exception as e:
+                resultados.append(e)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajo) for _ in range(self.hilos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados
+
+    def test_devoluciones_simultaneas_reponen_una_sola_copia(self):
+        prestamo = registrar_prestamo(self.libro.pk, self.lector, timezone.now().date())
+        resultados = self.en_paralelo(lambda: registrar_devolucion(Prestamo.objects.get(pk=prestamo.pk)))
+        self.assertEqual(resultados.count(True), 1, resultados)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.copias_disponibles, 3)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_prestamos_simultaneos_no_sobrevenden(self):
+        vence = timezone.now().date()
+        resultados = self.en_paralelo(lambda: registrar_prestamo(self.libro.pk, self.lector, vence))
+        prestados = [r for r in resultados if isinstance(r, Prestamo)]
+        self.assertEqual(len(prestados), 3, resultados)
+        self.assertEqual(sum(isinstance(r, StockInsuficiente) for r in resultados), self.hilos - 3)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.copias_disponibles, 3 - len(prestados))
+        self.assertEqual(Prestamo.objects.count(), len(prestados))
+        self.assertEqual(diferencias_stock(), [])
+
+
+# --- ÍNDICES Y BENCHMARK ---
+class IndicesTests(TestCase):
+    def test_benchmark_no_deja_datos_y_conserva_los_indices(self):
+        salida = StringIO()
+        call_command('benchmark_indices', '--libros', '50', '--repeticiones', '1', stdout=salida)
+        self.assertIn('Con índices', salida.getvalue())
+        self.assertFalse(Libro.objects.exists())
+        with connection.cursor() as cursor:
+            restricciones = connection.introspection.get_constraints(cursor, Prestamo._meta.db_table)
+        self.assertIn('prestamo_activo_idx', restricciones)
+
+
+# --- DATOS SINTÉTICOS Y BENCHMARK DE VISTAS ---
+class BenchmarkVistasTests(TestCase):
+    def test_datos_reproducibles_con_la_misma_semilla(self):
+        call_command('generar_datos', '--libros', '40', '--semilla', '7', '--sin-indexar', stdout=StringIO())
+        primeros = list(Libro.objects.order_by('id').values_list('titulo', 'copias_disponibles', 'estante'))
+        Libro.objects.all().delete()
+        call_command('generar_datos', '--libros', '40', '--semilla', '7', '--sin-indexar', stdout=StringIO())
+        segundos = list(Libro.objects.order_by('id').values_list('titulo', 'copias_disponibles', 'estante'))
+        self.assertEqual(primeros, segundos)
+        self.assertEqual(Prestamo.objects.count(), 80)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_genera_json_sin_modificar_datos(self):
+        call_command('generar_datos', '--libros', '40', '--sin-indexar', stdout=StringIO())
+        activos = Prestamo.objects.filter(devuelto=False).count()
+        salida = StringIO()
+        call_command('benchmark_vistas', '--repeticiones', '3', stdout=salida, stderr=StringIO())
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(set(resultado['vistas']), {
+            'panel_bibliotecario', 'lista_prestamos', 'lista_facturas',
+            'catalogo_lector', 'inventario_bodega', 'devolver_prestamo',
+        })
+        self.assertEqual(resultado['vistas']['lista_prestamos']['estados'], [200])
+        self.assertEqual(resultado['vistas']['devolver_prestamo']['estados'], [302])
+        self.assertEqual(Prestamo.objects.filter(devuelto=False).count(), activos)
+        self.assertFalse(User.objects.filter(username='benchmark-vistas').exists())
+
+
+# --- MONITOREO POR VISTA ---
+class MonitoreoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        monitoreo.reiniciar()
+        crear_datos_base()
+        self.admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+
+    def datos(self):
+        respuesta = self.client.get(reverse('gestion:monitoreo_datos'))
+        return {fila['vista']: fila for fila in respuesta.json()['vistas']}
+
+    def test_registra_tiempos_y_consultas_por_vista(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('gestion:libros'))
+        self.client.get(reverse('gestion:libros'))
+        fila = self.datos()['gestion:libros']
+        self.assertEqual(fila['peticiones'], 2)
+        self.assertGreater(fila['consultas']['max'], 0)
+        self.assertGreater(fila['plantillas_ms'], 0)
+        self.assertEqual(fila['alertas'], [])
+        self.assertContains(self.client.get(reverse('gestion:monitoreo')), 'gestion:libros')
+
+    async def test_con_asgi_cuenta_las_consultas_de_vistas_sincronas(self):
+        # La vista corre en un hilo de sync_to_async, con sus propias conexiones
+        await self.async_client.aforce_login(self.admin)
+        await self.async_client.get(reverse('gestion:inventario_bodega'))
+        await sync_to_async(self.client.force_login)(self.admin)
+        fila = (await sync_to_async(self.datos)())['gestion:inventario_bodega']
+        self.assertGreater(fila['consultas']['max'], 0)
+        self.assertGreater(fila['db_ms'], 0)
+
+    def test_detecta_consultas_que_crecen_con_los_datos(self):
+        for n in range(1, 8):
+            monitoreo.registrar('gestion:lenta', {
+                'tiempo_ms': n, 'db_ms': n, 'plantillas_ms': 0, 'consultas': n * 10,
+                'duplicadas': 0, 'similares': n * 10 - 1, 'bytes': n * 1000,
+            })
+        self.client.force_login(self.admin)
+        self.assertEqual(len(self.datos()['gestion:lenta']['alertas']), 2)
+
+    def test_perfil_solo_para_staff(self):
+        lector = User.objects.get(username="lector1")
+        self.client.force_login(lector)
+        respuesta = self.client.get(reverse('gestion:catalogo_lector'), {'profile': '1'})
+        self.assertEqual(respuesta['Content-Type'], 'text/html; charset=utf-8')
+        self.assertEqual(self.client.get(reverse('gestion:monitoreo')).status_code, 302)
+
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('gestion:catalogo_lector'), {'profile': '1'})
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain'))
+        self.assertIn('cumulative', respuesta.content.decode())
+
+
+# --- API REST (v1) ---
+class ApiTests(PresupuestoConsultasMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+        self.client.force_login(self.admin)
+
+    def url(self, nombre):
+        return reverse(f'gestion:{nombre}-list', kwargs={'version': 'v1'})
+
+    def test_libros(self):
+        self.comprobar_presupuesto(self.url('libro'), 3)
+
+    def test_disponibilidad(self):
+        self.comprobar_presupuesto(self.url('disponibilidad'), 3, disponible='true')
+
+    def test_autores(self):
+        self.comprobar_presupuesto(self.url('autor'), 3)
+
+    def test_prestamos(self):
+        self.comprobar_presupuesto(self.url('prestamo'), 3, vencido='true')
+
+    def test_multas(self):
+        self.comprobar_presupuesto(self.url('multa'), 3, pagada='false')
+
+    def test_campos_parciales_y_cursor(self):
+        poblar(5)
+        respuesta = self.client.get(self.url('libro'), {'fields': 'id,titulo', 'page_size': 2})
+        datos = respuesta.json()
+        self.assertEqual(set(datos['results'][0]), {'id', 'titulo'})
+        siguiente = self.client.get(datos['next']).json()
+        self.assertEqual(len(siguiente['results']), 2)
+        self.assertNotEqual(datos['results'][0]['id'], siguiente['results'][0]['id'])
+
+    def test_prestamos_y_multas_solo_para_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url('prestamo')).status_code, 403)
+        self.assertEqual(self.client.get(self.url('libro')).status_code, 200)
+
+    def test_sondeo_repetido_recibe_304_sin_consultas(self):
+        self.client.logout()
+        poblar(3)
+        respuesta = self.client.get(self.url('libro'))
+        self.assertIn('Last-Modified', respuesta)
+        with self.assertNumQueries(0):
+            repetida = self.client.get(self.url('libro'), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        Libro.objects.first().save()
+        cambiada = self.client.get(self.url('libro'), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertNotEqual(cambiada['ETag'], respuesta['ETag'])
+
+
+# --- CACHÉ DE PÁGINAS Y FRAGMENTOS ---
+class CachePaginasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reiniciar_estadisticas()
+        self.autor, self.libro, self.lector = crear_datos_base()
+
+    def test_pagina_anonima_se_sirve_desde_cache(self):
+        url = reverse('gestion:libros')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(url)
+        self.assertContains(respuesta, "Cien años de soledad")
+        self.assertEqual(estadisticas_cache_paginas()['espacios']['gestion:pagina']['aciertos'], 1)
+
+    def test_guardar_libro_o_autor_invalida(self):
+        url = reverse('gestion:detalle_libro', args=[self.libro.pk])
+        self.client.get(url)
+        self.libro.titulo = "El otoño del patriarca"
+        self.libro.save()
+        self.assertContains(self.client.get(url), "El otoño del patriarca")
+
+        self.client.get(reverse('gestion:libros'))
+        self.autor.apellido = "Márquez"
+        self.autor.save()
+        self.assertContains(self.client.get(reverse('gestion:libros')), "Gabriel Márquez")
+
+    def test_catalogo_lector_usa_fragmento_y_ve_el_stock(self):
+        self.client.force_login(self.lector.user)
+        url = reverse('gestion:catalogo_lector')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(url)
+        self.assertFalse(any('gestion_libro' in q['sql'] for q in contexto.captured_queries))
+
+        registrar_prestamo(self.libro.pk, self.lector, timezone.now().date())
+        self.assertContains(self.client.get(url), "2 en stock")
+
+    def test_navbar_varia_segun_el_rol(self):
+        staff = User.objects.create_superuser("admin", "a@a.com", "clave-admin-123")
+        self.client.force_login(staff)
+        self.assertContains(self.client.get(reverse('gestion:libros')), reverse('gestion:monitoreo'))
+        self.client.force_login(self.lector.user)
+        respuesta = self.client.get(reverse('gestion:libros'))
+        self.assertNotContains(respuesta, reverse('gestion:monitoreo'))
+        self.assertContains(respuesta, "lector1")
+
+    def test_no_guarda_exportaciones(self):
+        url = reverse('gestion:libros')
+        self.client.get(url, {'formato': 'csv'})
+        respuesta = self.client.get(url, {'formato': 'csv'})
+        self.assertTrue(respuesta.streaming)
+
+
+# --- VISTAS ASÍNCRONAS (ASGI) ---
+class VistasAsincronasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.origen = OrigenLento(retardo=0)
+        self.addCleanup(self.origen.cerrar)
+        ajustes = override_settings(OPENLIBRARY_URL=self.origen.url)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_lotes_concurrentes(self):
+        origen = OrigenLento(retardo=0.3)
+        self.addCleanup(origen.cerrar)
+        isbns = [f"979{i:010d}" for i in range(6)]
+        inicio = time.perf_counter()
+        with override_settings(OPENLIBRARY_URL=origen.url):
+            encontrados, errores = async_to_sync(consultar_isbns_async)(isbns, por_llamada=1)
+        self.assertEqual((len(encontrados), errores), (6, {}))
+        self.assertLess(time.perf_counter() - inicio, 1.5)  # Uno tras otro serían 1,8 s
+
+    def test_plazo_agotado_queda_como_error(self):
+        origen = OrigenLento(retardo=1)
+        self.addCleanup(origen.cerrar)
+        with override_settings(OPENLIBRARY_URL=origen.url), mock.patch('gestion.openlibrary.TIMEOUT', 0.2):
+            encontrados, errores = async_to_sync(consultar_isbns_async)(['9790000000001'])
+        self.assertEqual(encontrados, {})
+        self.assertIn('9790000000001', errores)
+        self.assertFalse(MetadatoISBN.objects.exists())  # Los errores no se guardan en la caché
+
+    def test_buscar_api_informa_el_error(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        with override_settings(OPENLIBRARY_URL='http://127.0.0.1:9'):  # Puerto cerrado
+            respuesta = self.client.get(reverse('gestion:buscar_api'), {'isbn': '9790000000001'})
+        self.assertIsNone(respuesta.context['libro'])
+        self.assertTrue(any(
+            str(mensaje).startswith("Error al buscar el libro") for mensaje in respuesta.context['messages']
+        ))
+
+    def test_portada(self):
+        autor = Autor.objects.create(nombre="Julio", apellido="Cortázar")
+        con_portada = Libro.objects.create(titulo="Rayuela", autor=autor, portada_url=f"{self.origen.url}/portadas/r.gif")
+        sin_portada = Libro.objects.create(titulo="Final del juego", autor=autor)
+        respuesta = self.client.get(reverse('gestion:portada_libro', args=[con_portada.pk]))
+        self.assertEqual((respuesta.status_code, respuesta['Content-Type']), (200, 'image/gif'))
+        self.assertEqual(self.client.get(reverse('gestion:portada_libro', args=[sin_portada.pk])).status_code, 404)
+
+    def test_estado_de_servicios_externos(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        OperacionOdoo.objects.create(isbn="9788437604572", titulo="Rayuela", ultimo_error="sin conexión")
+        odoo = {**settings.ODOO, 'URL': 'http://127.0.0.1:9', 'TIMEOUT': 1}  # Puerto cerrado
+        with override_settings(ODOO=odoo):
+            datos = self.client.get(reverse('gestion:estado_sincronizacion')).json()
+        self.assertEqual(datos['servicios']['openlibrary']['estado'], 'ok')
+        self.assertEqual(datos['servicios']['odoo']['estado'], 'error')
+        self.assertEqual(datos['cola_odoo']['conteos'], {OperacionOdoo.PENDIENTE: 1})
+        self.assertEqual(datos['cola_odoo']['fallas'][0]['isbn'], "9788437604572")
+
+    def test_prueba_de_carga(self):
+        salida = StringIO()
+        call_command('prueba_carga', '--peticiones', '6', '--concurrencia', '3', '--retardo', '0.05',
+                     '--hilos', '2', stdout=salida, stderr=StringIO())
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['asincrona']['estados'], {'200': 6})
+        self.assertEqual(resultado['bloqueante']['estados'], {'ok': 6})
+        self.assertFalse(User.objects.filter(username='prueba-carga').exists())
+        self.assertFalse(MetadatoISBN.objects.exists())
+
+
+# --- PORTADAS LOCALES ---
+class PortadasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.origen = OrigenLento(retardo=0)
+        self.addCleanup(self.origen.cerrar)
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=carpeta.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.autor = Autor.objects.create(nombre="Julio", apellido="Cortázar")
+
+    def crear_libro(self, nombre='rayuela'):
+        return Libro.objects.create(
+            titulo=nombre.title(), autor=self.autor, copias_disponibles=2,
+            portada_url=f"{self.origen.url}/portadas/{nombre}.gif",
+        )
+
+    def test_descarga_una_vez_y_sirve_con_cache_larga(self):
+        libro = self.crear_libro()
+        self.assertEqual(libro.portada.estado, Portada.PENDIENTE)
+        self.assertEqual(procesar_portadas(), (1, 0))
+        portada = Portada.objects.get()
+        self.assertEqual((portada.estado, len(portada.huella)), (Portada.LISTA, 16))
+        self.assertEqual(procesar_portadas(), (0, 0))  # Ya no queda nada pendiente
+
+        self.client.force_login(User.objects.create_user("lector1", password="clave-segura-123"))
+        catalogo = self.client.get(reverse('gestion:catalogo_lector')).content.decode()
+        url = reverse('gestion:miniatura_portada', kwargs={'huella': portada.huella, 'tamano': 'm', 'formato': 'webp'})
+        self.assertIn(url, catalogo)
+        self.assertIn('loading="lazy"', catalogo)
+        self.assertNotIn(self.origen.url, catalogo)
+
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertRedirects(
+            self.client.get(reverse('gestion:portada_libro', args=[libro.pk])),
+            reverse('gestion:miniatura_portada', kwargs={'huella': portada.huella, 'tamano': 'g', 'formato': 'jpg'}),
+            fetch_redirect_response=False,
+        )
+
+    def test_cambio_de_url_y_portada_borrada(self):
+        libro = self.crear_libro()
+        procesar_portadas()
+        huella = Portada.objects.get().huella
+        libro.portada_url = f"{self.origen.url}/portadas/otra.gif"
+        libro.save()
+        portada = Portada.objects.get()
+        self.assertEqual((portada.estado, portada.huella), (Portada.PENDIENTE, huella))  # Se sigue mostrando la vieja
+        ajustar_stock(libro.pk, 5)
+        self.assertEqual(Portada.objects.get().estado, Portada.PENDIENTE)
+
+        libro.portada_url = ''
+        libro.save()
+        self.assertFalse(Portada.objects.exists())
+
+    def test_error_se_reintenta_mas_tarde(self):
+        Libro.objects.create(titulo="Rota", autor=self.autor, portada_url="http://127.0.0.1:9/rota.jpg")
+        self.assertEqual(procesar_portadas(), (0, 1))
+        portada = Portada.objects.get()
+        self.assertEqual((portada.estado, portada.intentos), (Portada.PENDIENTE, 1))
+        self.assertGreater(portada.proximo_intento, timezone.now())
+
+    def test_rellenar_libros_existentes(self):
+        # bulk_create no dispara señales: son los libros "de antes"
+        Libro.objects.bulk_create([
+            Libro(titulo=f"Libro {i}", autor=self.autor, portada_url=f"{self.origen.url}/portadas/{i}.gif")
+            for i in range(3)
+        ] + [Libro(titulo="Sin portada", autor=self.autor)])
+        salida = StringIO()
+        call_command('descargar_portadas', '--rellenar', stdout=salida)
+        self.assertIn("Portadas encoladas: 3", salida.getvalue())
+        self.assertEqual(Portada.objects.filter(estado=Portada.LISTA).count(), 3)
+        self.assertEqual(len(set(Portada.objects.values_list('huella', flat=True))), 1)  # Misma imagen, mismos archivos
+
+
+# --- SALDOS DE LOS LECTORES ---
+class SaldosTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.hoy = timezone.now().date()
+        cache.clear()
+
+    def prestar(self, dias_vencido, lector=None):
+        return Prestamo.objects.create(
+            libro=self.libro, lector=lector or self.lector,
+            fecha_devolucion_esperada=self.hoy - timedelta(days=dias_vencido),
+        )
+
+    def saldo(self, lector=None):
+        saldo = SaldoLector.objects.get(lector=lector or self.lector)
+        return saldo.deuda, saldo.multas_pendientes
+
+    def test_acumular_y_cobrar_multas_mueve_el_saldo(self):
+        prestamo = self.prestar(4)
+        self.prestar(2)
+        acumular_multas(hoy=self.hoy)
+        self.assertEqual(self.saldo(), (Decimal('3.00'), 2))
+
+        acumular_multas(hoy=self.hoy + timedelta(days=2))
+        self.assertEqual(self.saldo(), (Decimal('5.00'), 2))
+
+        registrar_devolucion(prestamo)
+        # Queda solo la multa del otro préstamo (4 días de retraso al acumular)
+        self.assertEqual(self.saldo(), (Decimal('2.00'), 1))
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_guardados_sueltos_actualizan_el_saldo(self):
+        multa = Multa.objects.create(prestamo=self.prestar(1), monto=Decimal('4.00'))
+        self.assertEqual(self.saldo(), (Decimal('4.00'), 1))
+        multa.pagada = True
+        multa.save()
+        self.assertEqual(self.saldo(), (Decimal('0.00'), 0))
+        Multa.objects.create(prestamo=self.prestar(1), monto=Decimal('2.50')).delete()
+        self.assertEqual(self.saldo(), (Decimal('0.00'), 0))
+        # Borrar al lector borra sus multas y su saldo sin dejar filas huérfanas
+        Multa.objects.create(prestamo=self.prestar(1), monto=Decimal('2.50'))
+        self.lector.delete()
+        self.assertFalse(SaldoLector.objects.exists())
+
+    def test_verificar_saldos_corrige_diferencias(self):
+        prestamo = self.prestar(3)
+        Multa.objects.bulk_create([Multa(prestamo=prestamo, monto=Decimal('1.50'))])  # Sin señales
+        self.assertEqual(diferencias_saldos(), [(self.lector.pk, (Decimal('0.00'), 0), (Decimal('1.50'), 1))])
+
+        salida = StringIO()
+        call_command('verificar_saldos', stdout=salida)
+        self.assertIn("1 lectores no cuadran", salida.getvalue())
+        call_command('verificar_saldos', '--corregir', stdout=salida)
+        self.assertEqual(self.saldo(), (Decimal('1.50'), 1))
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_facturacion_y_panel_leen_los_saldos(self):
+        otro = Lector.objects.create(user=User.objects.create_user(username="lector2"), identificacion="1700000002")
+        Multa.objects.create(prestamo=self.prestar(1), monto=Decimal('2.00'))
+        Multa.objects.create(prestamo=self.prestar(1, lector=otro), monto=Decimal('7.00'))
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+
+        respuesta = self.client.get(reverse('gestion:facturas'))
+        self.assertEqual([saldo.lector for saldo in respuesta.context['facturas']], [otro, self.lector])
+        self.assertEqual(respuesta.context['total_deuda'], Decimal('9.00'))
+        respuesta = self.client.get(reverse('gestion:facturas'), {'q': '1700000001'})
+        self.assertEqual([saldo.lector for saldo in respuesta.context['facturas']], [self.lector])
+
+        morosos = self.client.get(reverse('gestion:panel_bibliotecario')).context['morosos_top']
+        self.assertEqual([(saldo.lector, saldo.deuda) for saldo in morosos], [(otro, 7), (self.lector, 2)])
+
+    def test_lista_de_lectores_con_deuda_solo_para_personal(self):
+        Multa.objects.create(prestamo=self.prestar(1), monto=Decimal('2.00'))
+        url = reverse('gestion:lectores')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.lector.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        self.assertContains(self.client.get(url), "$2,00")
+
+
+# --- PERFIL DE BASE DE DATOS ---
+class BaseDatosTests(TestCase):
+    def test_pragmas_al_conectar(self):
+        self.assertEqual(pragmas_actuales(connection)['busy_timeout'], settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(pragmas_actuales(connection)['synchronous'], 1)  # NORMAL
+
+    def test_router_usa_la_replica_solo_en_reportes(self):
+        router = RouterReplica()
+        self.assertIsNone(router.db_for_read(Multa))
+        with leyendo_de_replica():
+            self.assertIsNone(router.db_for_read(Multa))  # Sin réplica configurada
+            with mock.patch.dict(settings.DATABASES, {'replica': {}}):
+                self.assertEqual(router.db_for_read(Multa), 'replica')
+                self.assertEqual(router.db_for_write(Multa), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'gestion'))
+
+
+class BenchmarkConcurrenciaTests(TransactionTestCase):
+    def test_mide_y_borra_sus_datos(self):
+        salida = StringIO()
+        call_command('benchmark_concurrencia', '--hilos', '2', '--segundos', '0.5', stdout=salida, stderr=StringIO())
+        resultado = json.loads(salida.getvalue())
+        self.assertGreater(resultado['carga']['peticiones'], 0)
+        self.assertEqual(resultado['transaction_mode'], 'IMMEDIATE')
+        self.assertFalse(Libro.objects.exists() or Lector.objects.exists() or Autor.objects.exists())
+
+
+# --- RESERVAS Y LISTA DE ESPERA ---
+class ReservasTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        ajustar_stock(self.libro.pk, 1)
+        self.otros = [
+            Lector.objects.create(user=User.objects.create_user(username=f"espera{i}"), identificacion=f"E{i}")
+            for i in range(3)
+        ]
+
+    def stock(self):
+        self.libro.refresh_from_db()
+        return self.libro.copias_disponibles
+
+    def test_aparta_la_copia_y_luego_pone_en_fila(self):
+        primera, creada = reservar(self.libro.pk, self.lector)
+        self.assertTrue(creada)
+        self.assertEqual((primera.estado, self.stock()), (Reserva.APARTADA, 0))
+        self.assertEqual(reservar(self.libro.pk, self.lector), (primera, False))
+        esperando = [reservar(self.libro.pk, lector)[0] for lector in self.otros]
+        self.assertEqual([posicion(reserva) for reserva in esperando], [1, 2, 3])
+        self.assertEqual(siguiente_en_espera(self.libro.pk), esperando[0])
+        self.assertEqual([r.puesto for r in reservas_de(self.otros[2])], [3])
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_la_devolucion_pasa_la_copia_al_siguiente(self):
+        prestamo = registrar_prestamo(self.libro.pk, self.lector, timezone.now().date())
+        espera, _ = reservar(self.libro.pk, self.otros[0])
+        self.assertEqual(espera.estado, Reserva.EN_ESPERA)
+        registrar_devolucion(prestamo)
+        espera.refresh_from_db()
+        self.assertEqual((espera.estado, self.stock()), (Reserva.APARTADA, 0))
+        # Al prestársela, la copia apartada no se descuenta otra vez
+        entregado = registrar_prestamos([self.libro.pk], self.otros[0], timezone.now().date())[0]
+        espera.refresh_from_db()
+        self.assertEqual((entregado['estado'], espera.estado, espera.prestamo_id), ('prestado', 'entregada', entregado['prestamo']))
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_vencer_y_cancelar_liberan_la_copia(self):
+        apartada, _ = reservar(self.libro.pk, self.lector)
+        siguiente, _ = reservar(self.libro.pk, self.otros[0])
+        ultima, _ = reservar(self.libro.pk, self.otros[1])
+        self.assertEqual(vencer_reservas(), 0)
+        self.assertEqual(vencer_reservas(timezone.now() + timedelta(hours=settings.RESERVA_HORAS + 1)), 1)
+        apartada.refresh_from_db()
+        siguiente.refresh_from_db()
+        self.assertEqual((apartada.estado, siguiente.estado), (Reserva.VENCIDA, Reserva.APARTADA))
+        self.assertTrue(cancelar_reserva(siguiente))
+        self.assertFalse(cancelar_reserva(siguiente))
+        ultima.refresh_from_db()
+        self.assertEqual((ultima.estado, self.stock()), (Reserva.APARTADA, 0))
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_reimportar_con_mas_copias_atiende_la_fila(self):
+        reservar(self.libro.pk, self.lector)
+        esperando = [reservar(self.libro.pk, lector)[0] for lector in self.otros]
+        importar_libros([{
+            'isbn': '9780307474728', 'titulo': self.libro.titulo, 'autor_principal': "Gabriel García Márquez",
+            'anio': 1967, 'paginas': 471, 'portada': '',
+        }], copias=2)
+        self.assertEqual(
+            [Reserva.objects.get(pk=reserva.pk).estado for reserva in esperando],
+            [Reserva.APARTADA, Reserva.APARTADA, Reserva.EN_ESPERA],
+        )
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_admin_presta_la_copia_apartada_y_no_reabre_sin_stock(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        apartada, _ = reservar(self.libro.pk, self.lector)
+        espera, _ = reservar(self.libro.pk, self.otros[0])
+        hoy = timezone.now().date()
+        datos = {
+            'libro': self.libro.pk, 'lector': self.lector.pk, 'fecha_prestamo': hoy.isoformat(),
+            'fecha_devolucion_esperada': (hoy + timedelta(days=7)).isoformat(), 'notas_entrega': '',
+        }
+        url = reverse('admin:gestion_prestamo_add')
+        # Sin copias en el estante solo se le presta a quien tiene una apartada
+        self.assertContains(self.client.post(url, {**datos, 'lector': self.otros[1].pk}), "no tiene copias disponibles")
+        self.assertEqual(self.client.post(url, datos).status_code, 302)
+        prestamo = Prestamo.objects.get()
+        apartada.refresh_from_db()
+        self.assertEqual((apartada.estado, apartada.prestamo, self.stock()), (Reserva.ENTREGADA, prestamo, 0))
+        # La copia devuelta pasa al siguiente: desmarcar 'devuelto' ya no puede descontarla
+        registrar_devolucion(prestamo)
+        respuesta = self.client.post(
+            reverse('admin:gestion_prestamo_change', args=[prestamo.pk]), {**datos, 'devuelto': ''}, follow=True
+        )
+        self.assertContains(respuesta, "el libro no tiene copias disponibles")
+        prestamo.refresh_from_db()
+        espera.refresh_from_db()
+        self.assertEqual((prestamo.devuelto, espera.estado, self.stock()), (True, Reserva.APARTADA, 0))
+        self.assertEqual(diferencias_stock(), [])
+
+    def test_admin_sin_copia_al_guardar(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        ajustar_stock(self.libro.pk, 0)
+        hoy = timezone.now().date()
+        with mock.patch('gestion.admin.hay_copia_para', return_value=True):  # Validó antes de que se agotara
+            respuesta = self.client.post(reverse('admin:gestion_prestamo_add'), {
+                'libro': self.libro.pk, 'lector': self.lector.pk, 'fecha_prestamo': hoy.isoformat(),
+                'fecha_devolucion_esperada': hoy.isoformat(), 'notas_entrega': '',
+            }, follow=True)
+        self.assertContains(respuesta, "ya no tiene copias disponibles")
+        self.assertFalse(Prestamo.objects.exists())
+
+    def test_vistas_del_lector(self):
+        ajustar_stock(self.libro.pk, 0)
+        self.client.force_login(self.lector.user)
+        self.assertContains(self.client.get(reverse('gestion:catalogo_lector')), "Agotado")
+        respuesta = self.client.post(reverse('gestion:escoger_libro', args=[self.libro.pk]), follow=True)
+        reserva = Reserva.objects.get(lector=self.lector)
+        self.assertEqual((reserva.estado, respuesta.context['reservas'][0].puesto), (Reserva.EN_ESPERA, 1))
+        self.assertContains(respuesta, "puesto 1 de la lista de espera")
+        self.client.post(reverse('gestion:cancelar_reserva', args=[reserva.pk]))
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.estado, Reserva.CANCELADA)
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    def test_reservas_simultaneas_no_apartan_copias_de_mas(self):
+        salida = StringIO()
+        call_command(
+            'prueba_reservas', '--lectores', '300', '--libros', '2', '--copias', '10', '--hilos', '8',
+            stdout=salida, stderr=StringIO(),
+        )
+        self.assertIn("Sin sobreventa", salida.getvalue())
+        self.assertFalse(Libro.objects.exists() or Reserva.objects.exists())
+
+
+# --- INGESTA DE CATÁLOGOS ---
+def registro_marc(campos):
+    """ Registro MARC21 mínimo (ISO 2709) con campos de datos {etiqueta: [(código, valor)]}. """
+    directorio, datos = b'', b''
+    for etiqueta, subcampos in campos.items():
+        campo = b'  ' + b''.join(b'\x1f' + codigo.encode() + valor.encode() for codigo, valor in subcampos) + b'\x1e'
+        directorio += f"{etiqueta}{len(campo):04d}{len(datos):05d}".encode()
+        datos += campo
+    base = 24 + len(directorio) + 1
+    largo = base + len(datos) + 1
+    return f"{largo:05d}nam a22{base:05d}   4500".encode() + directorio + b'\x1e' + datos + b'\x1d'
+
+
+class IngestaTests(TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.carpeta.cleanup)
+        Autor.objects.create(nombre="Gabriel", apellido="García Márquez")
+
+    def archivo(self, nombre, contenido):
+        ruta = f"{self.carpeta.name}/{nombre}"
+        with open(ruta, 'wb') as archivo:
+            archivo.write(contenido.encode() if isinstance(contenido, str) else contenido)
+        return ruta
+
+    def test_csv_reutiliza_autores_y_retoma_tras_un_corte(self):
+        ruta = self.archivo('catalogo.csv', (
+            "titulo,autor,anio,copias,estante\n"
+            "Cien años de soledad,Gabriel García Márquez,1967,2,A1\n"
+            ",Sin título,2000,1,\n"
+            "El amor en los tiempos del cólera,Gabriel García Márquez,1985,,\n"
+            "Rayuela,Julio Cortázar,1963,3,B2\n"
+        ))
+        # El segundo lote falla: su transacción se deshace con su punto de control
+        with mock.patch('gestion.ingesta.encolar_portadas', side_effect=[None, OSError("disco lleno")]):
+            with self.assertRaises(OSError):
+                ingestar(ruta, lote=2)
+        self.assertEqual(IngestaCatalogo.objects.get().registros, 2)
+        self.assertEqual(Libro.objects.count(), 1)
+
+        ingesta = ingestar(ruta, lote=2)
+        self.assertEqual((ingesta.registros, ingesta.libros, ingesta.omitidos, ingesta.terminada), (4, 3, 1, True))
+        self.assertEqual(Autor.objects.count(), 2)  # Solo Cortázar es nuevo
+        self.assertEqual(Libro.objects.get(titulo="Rayuela").copias_disponibles, 3)
+        self.assertEqual(diferencias_stock(), [])
+        self.assertEqual(ingestar(ruta).libros, 3)  # Ya terminada: no vuelve a cargar
+
+    def test_jsonl_y_marc(self):
+        ingestar(self.archivo('catalogo.jsonl', (
+            '{"title": "Ficciones", "author": "Jorge Luis Borges", "year": 1944, "copias": 1}\n'
+            'no es json\n'
+        )))
+        ingestar(self.archivo('catalogo.mrc', registro_marc({
+            '020': [('a', '9788497592208 (rústica)')],
+            '100': [('a', 'García Márquez, Gabriel,')],
+            '245': [('a', 'Crónica de una muerte anunciada /'), ('c', 'Gabriel García Márquez.')],
+            '260': [('c', 'c1981.')],
+            '300': [('a', '120 p.')],
+        }) * 2))
+        self.assertEqual(Libro.objects.get(titulo="Ficciones").publicacion, 1944)
+        cronica = Libro.objects.filter(titulo="Crónica de una muerte anunciada").select_related('autor')
+        self.assertEqual(cronica.count(), 2)
+        self.assertEqual((cronica[0].autor.apellido, cronica[0].publicacion, cronica[0].paginas), ("García Márquez", 1981, 120))
+        self.assertEqual(Autor.objects.count(), 2)
+        self.assertEqual(IngestaCatalogo.objects.get(formato='jsonl').omitidos, 1)
+
+    def test_volcados_con_igual_cabecera_y_tamano_no_comparten_punto_de_control(self):
+        cabecera = "titulo,autor\n" + "Relleno,Autor Anónimo\n" * 60_000  # Más de 1 MB igual en ambos
+        uno, otro = self.archivo('a.csv', cabecera + "Rayuela,Julio Cortazar\n"), self.archivo('b.csv', cabecera + "Ficciones,Jorge Borges\n")
+        self.assertEqual(os.path.getsize(uno), os.path.getsize(otro))
+        primero, segundo = ingestar(uno, lote=20_000), ingestar(otro, lote=20_000)
+        self.assertNotEqual(primero.pk, segundo.pk)
+        self.assertTrue(Libro.objects.filter(titulo="Ficciones").exists())
+
+
+# --- CAMBIOS EN VIVO (SSE) ---
+class EventosTests(TestCase):
+    def setUp(self):
+        self.autor, self.libro, self.lector = crear_datos_base()
+        self.broker = BrokerLocal(maximo=3)
+        reemplazo = mock.patch('gestion.eventos._broker', self.broker)
+        reemplazo.start()
+        self.addCleanup(reemplazo.stop)
+        self.hoy = timezone.now().date()
+
+    def publicados(self, canal):
+        return [(evento.tipo, evento.datos) for evento in self.broker._recientes if evento.canal == canal]
+
+    def test_deltas_del_panel_y_la_bodega(self):
+        self.broker.ultimo(PANEL)
+        self.broker.ultimo(BODEGA)  # Página recién abierta: se publica aunque todavía no haya conexión
+        with self.captureOnCommitCallbacks(execute=True):
+            prestado = registrar_prestamos([self.libro.pk], self.lector, self.hoy - timedelta(days=4))[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            acumular_multas(forzar=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_devoluciones([prestado['prestamo']])
+        with self.captureOnCommitCallbacks(execute=True):
+            ajustar_stock(self.libro.pk, 1)
+
+        panel = self.publicados(PANEL)
+        self.assertEqual([tipo for tipo, _ in panel], ['prestamos', 'deuda', 'prestamos', 'deuda'])
+        self.assertEqual((panel[0][1]['estado'], panel[0][1]['vencidos']), ('prestado', 1))
+        self.assertEqual(panel[0][1]['detalle'][0]['lector'], self.lector.identificacion)
+        self.assertEqual(panel[1][1]['diferencia'], Decimal('2.00'))
+        self.assertEqual((panel[2][1]['estado'], panel[2][1]['vencidos']), ('devuelto', -1))
+        self.assertEqual(panel[3][1]['diferencia'], Decimal('-2.00'))
+        self.assertEqual(
+            [datos['libros'][0]['copias'] for _, datos in self.publicados(BODEGA)], [2, 3, 1]
+        )
+        self.assertEqual(self.publicados(BODEGA)[-1][1]['criticos'], 1)
+
+    def test_sin_nadie_escuchando_no_consulta(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo = registrar_prestamo(self.libro.pk, self.lector, self.hoy + timedelta(days=7))
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            avisar_prestamos([prestamo.pk], 'devuelto')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.publicados(PANEL), [(RECARGAR, {})])
+
+    def test_importacion_avisa_a_la_bodega(self):
+        self.broker.ultimo(BODEGA)
+        with self.captureOnCommitCallbacks(execute=True):
+            importar_libros([{
+                'isbn': '9780307474728', 'titulo': self.libro.titulo, 'autor_principal': "Gabriel García Márquez",
+                'anio': 1967, 'paginas': 471, 'portada': '',
+            }], copias=7)
+        self.assertEqual(self.publicados(BODEGA)[-1][1]['libros'][0]['copias'], 7)
+
+    def test_error_al_preparar_no_afecta_la_escritura(self):
+        self.broker.ultimo(PANEL)
+        with mock.patch('gestion.eventos._evento_prestamos', side_effect=OperationalError('database table is locked')), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            prestamo = registrar_prestamo(self.libro.pk, self.lector, self.hoy + timedelta(days=7))
+        self.assertTrue(Prestamo.objects.filter(pk=prestamo.pk).exists())
+        # Quien se reconecte desde antes recarga la página
+        self.assertEqual(self.publicados(PANEL), [(RECARGAR, {})])
+
+    async def test_cliente_lento_recibe_recargar(self):
+        suscripcion = self.broker.suscribir(PANEL)
+        for numero in range(5):
+            self.broker.publicar(PANEL, 'deuda', {'diferencia': numero})
+        await asyncio.sleep(0)
+        self.assertEqual((await suscripcion.siguiente(1)).tipo, RECARGAR)
+        self.assertIsNone(await suscripcion.siguiente(0.01))
+        self.assertEqual(self.broker.desbordes, 1)
+        suscripcion.cerrar()
+        self.assertEqual(self.broker.suscriptores(), 0)
+
+    async def test_reconexion_con_last_event_id(self):
+        primero = self.broker.publicar(PANEL, 'deuda', {'diferencia': 1})
+        self.broker.publicar(BODEGA, 'stock', {'libros': [], 'criticos': 0})
+        self.broker.publicar(PANEL, 'deuda', {'diferencia': 2})
+        suscripcion = self.broker.suscribir(PANEL, self.broker.identificador(primero))
+        self.assertEqual((await suscripcion.siguiente(1)).datos, {'diferencia': 2})
+        # Un identificador de otro proceso (o de antes de reiniciar) no se puede completar
+        otra = self.broker.suscribir(PANEL, 'abcdef12-1')
+        self.assertEqual((await otra.siguiente(1)).tipo, RECARGAR)
+
+    async def test_flujo_sse(self):
+        admin = await sync_to_async(User.objects.create_superuser)("admin", "a@a.com", "clave-admin-123")
+        await self.async_client.aforce_login(admin)
+        respuesta = await self.async_client.get(reverse('gestion:eventos_panel'))
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        contenido = aiter(respuesta.streaming_content)
+        self.assertEqual(await asyncio.wait_for(anext(contenido), 1), b'retry: 3000\n\n')
+        siguiente = asyncio.ensure_future(anext(contenido))
+        await asyncio.sleep(0.05)
+        evento = self.broker.publicar(PANEL, 'deuda', {'diferencia': Decimal('1.50')})
+        self.assertEqual(
+            await asyncio.wait_for(siguiente, 1),
+            f'id: {self.broker.identificador(evento)}\nevent: deuda\ndata: {{"diferencia": "1.50"}}\n\n'.encode(),
+        )
+        # El cliente se desconecta: el servidor ASGI cancela la tarea que espera el próximo evento
+        pendiente = asyncio.ensure_future(anext(contenido))
+        await asyncio.sleep(0.05)
+        pendiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pendiente
+        self.assertEqual(self.broker.suscriptores(), 0)
+
+    def test_con_wsgi_no_abre_el_flujo(self):
+        self.client.force_login(User.objects.create_superuser("admin", "a@a.com", "clave-admin-123"))
+        self.assertEqual(self.client.get(reverse('gestion:eventos_bodega')).status_code, 204)
+        self.assertContains(self.client.get(reverse('gestion:inventario_bodega')), 'data-libro=')
 
-# Create your tests here.
@@ -1,5 +1,5 @@
-from django.urls import path
-from . import views
+from django.urls import include, path, re_path
+from . import views, api
 
 app_name = 'gestion'
 
@@ -12,20 +12,33 @@ urlpatterns = [
     
     # Bibliotecario y Gestión
     path('bibliotecario/', views.panel_bibliotecario, name='panel_bibliotecario'),
+    path('bibliotecario/eventos/', views.eventos_panel, name='eventos_panel'),
     path('libros/', views.lista_libros, name='libros'),
     path('libros/<int:pk>/', views.detalle_libro, name='detalle_libro'),
+    path('libros/<int:pk>/portada/', views.portada_libro, name='portada_libro'),
+    re_path(
+        r'^portadas/(?P<huella>[0-9a-f]{16})-(?P<tamano>[pmg])\.(?P<formato>webp|jpg)$',
+        views.miniatura_portada, name='miniatura_portada',
+    ),
     path('autores/', views.lista_autores, name='autores'),
     path('prestamos/', views.lista_prestamos, name='prestamos'),
     path('prestamos/nuevo/', views.nuevo_prestamo, name='nuevo_prestamo'),
     path('prestamos/devolver/<int:pk>/', views.devolver_prestamo, name='devolver_prestamo'),
+    path('prestamos/lote/prestar/', views.prestar_lote, name='prestar_lote'),
+    path('prestamos/lote/devolver/', views.devolver_lote, name='devolver_lote'),
     path('lectores/', views.lista_lectores, name='lectores'),
     path('registro-lector/', views.registro_lector, name='registro_lector'),
     path('multas/', views.lista_multas, name='multas'),
     path('facturas/', views.lista_facturas, name='facturas'),
+    path('monitoreo/', views.monitoreo, name='monitoreo'),
+    path('monitoreo/datos/', views.monitoreo_datos, name='monitoreo_datos'),
+    path('monitoreo/externos/', views.estado_sincronizacion, name='estado_sincronizacion'),
 
     # Bodeguero (Rutas internas)
     path('bodega/', views.inventario_bodega, name='inventario_bodega'),
+    path('bodega/eventos/', views.eventos_bodega, name='eventos_bodega'),
     path('bodega/buscar/', views.buscar_libro_api, name='buscar_api'),
+    path('bodega/importar-lote/', views.importar_lote, name='importar_lote'),
     # --- RUTA NUEVA PARA ACTUALIZAR STOCK ---
     path('bodega/actualizar/<int:libro_id>/', views.actualizar_stock_bodega, name='actualizar_stock_bodega'),
 
@@ -33,4 +46,8 @@ urlpatterns = [
     path('catalogo/', views.catalogo_lector, name='catalogo_lector'),
     path('mis-prestamos/', views.mis_prestamos, name='mis_prestamos'),
     path('escoger/<int:libro_id>/', views.escoger_libro, name='escoger_libro'),
+    path('reservas/<int:pk>/cancelar/', views.cancelar_reserva_lector, name='cancelar_reserva'),
+
+    # API REST de solo lectura (versionada)
+    re_path(r'^api/(?P<version>v1)/', include(api.router.urls)),
 ]
\ No newline at end of file
@@ -1,70 +1,67 @@
-import requests  # Para Open Library
-import xmlrpc.client  # Para conectar con Odoo (Incluido en Python)
+import json
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Libro, Autor, Prestamo, Lector, Multa
-from django.db.models import Sum, Q, Avg, Max, Min, Count
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+from .models import Libro, Autor, Prestamo, Lector, Reserva
+from django.db.models import Sum, Avg, Max, Min, Count
 from django.utils import timezone
 from datetime import datetime
+from django.utils.dateparse import parse_date
 from .forms import UsuarioForm
+from .stock import (
+    ajustar_stock, registrar_prestamo, registrar_devolucion, registrar_prestamos, registrar_devoluciones,
+    leer_codigos, StockInsuficiente, MAX_LOTE,
+)
+from .reservas import reservar, cancelar_reserva, posicion, reservas_de
+from .estadisticas import obtener_resumen
+from .roles import tiene_grupo, GRUPO_BIBLIOTECARIOS, GRUPO_BODEGERO
+from .busqueda import buscador
+from .paginacion import paginar
+from .exportar import (
+    exportar, exportar_reporte, prestamos_filtrados, saldos_filtrados, multas_filtradas, inventario_filtrado, FORMATOS,
+)
+from .openlibrary import (
+    consultar_isbns_async, leer_isbns, limpiar_isbn, estadisticas_cache, datos_libro as datos_desde_openlibrary
+)
+from .importacion import importar_libros
+from .asincrono import descargar_portada, estado_externo, PortadaNoDisponible
+from .portadas import ruta_miniatura, FORMATOS as FORMATOS_MINIATURA
+from . import monitoreo as metricas
+from .cache import cachear_para_anonimos, estadisticas as estadisticas_cache_paginas, reiniciar_estadisticas
+from .cambios import LIBROS, AUTORES
+from .basedatos import desde_replica
+from .eventos import broker, formato_sse, Saturado, MAX_SUSCRIPTORES, PANEL, BODEGA, RECARGAR
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 from django.urls import reverse
 
-# --- CONFIGURACIÓN DE ODOO (TUS CREDENCIALES VERIFICADAS) ---
-ODOO_URL = 'http://localhost:8069'
-ODOO_DB = '01'
-ODOO_USER = 'coraquillafreddy@gmail.com'
-ODOO_PASS = '1726391673'
-
-def sincronizar_con_odoo(titulo, isbn):
-    """ 
-    Sincronización definitiva: Enviamos solo los campos que sabemos que Odoo acepta
-    para evitar el error 'ValueError: Invalid field'.
-    """
-    try:
-        common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASS, {})
-        if uid:
-            models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
-            
-            # Solo dejamos los campos que NO dan error en tu terminal
-            data = {
-                'nombre_libro': titulo,  # Campo Nombre Libro
-                'isbn': isbn,            # Campo ISBN
-            }
-            
-            nuevo_id = models.execute_kw(ODOO_DB, uid, ODOO_PASS, 'biblioteca.libro', 'create', [data])
-            print(f"✅ ÉXITO: Libro creado en Odoo con ID: {nuevo_id}")
-            return True
-            
-    except Exception as e:
-        print(f"❌ Error en la sincronización: {e}")
-    return False
+# Máximo de ISBN por importación en bloque (una tarima grande)
+MAX_ISBNS_LOTE = 5000
+# Comentario SSE cada tantos segundos: mantiene viva la conexión en proxies y detecta al cliente que se fue
+LATIDO_EVENTOS = 15
+DURACION_MINIATURAS = 60 * 60 * 24 * 365
 
 # --- FUNCIONES DE APOYO ---
 def es_staff(user):
     return user.is_staff or user.is_superuser
 
 def es_bodegero(user):
-    return user.groups.filter(name='Bodegero').exists() or user.is_superuser
-
-# --- FUNCIÓN CENTRAL: DETECTA VENCIDOS ---
-def actualizar_multas_vencidas():
-    hoy = timezone.now().date()
-    prestamos_vencidos = Prestamo.objects.filter(
-        devuelto=False, 
-        fecha_devolucion_esperada__lt=hoy
-    )
-    
-    for prestamo in prestamos_vencidos:
-        dias_retraso = (hoy - prestamo.fecha_devolucion_esperada).days
-        monto_total = dias_retraso * 0.50
-        
-        multa, created = Multa.objects.get_or_create(prestamo=prestamo)
-        if not multa.pagada:
-            multa.monto = monto_total
-            multa.save()
+    return tiene_grupo(user, GRUPO_BODEGERO) or user.is_superuser
+
+def exige_personal(request):
+    """ Para las exportaciones de listas públicas: como login_required + es_staff, o None si puede pasar. """
+    if request.user.is_authenticated and es_staff(request.user):
+        return None
+    return redirect_to_login(request.get_full_path())
 
 # --- VISTAS DE AUTENTICACIÓN ---
 def ingresar(request):
@@ -74,9 +71,9 @@ def ingresar(request):
         user = authenticate(username=u, password=p)
         if user is not None:
             login(request, user)
-            if user.is_superuser or user.groups.filter(name='Bibliotecarios').exists():
+            if user.is_superuser or tiene_grupo(user, GRUPO_BIBLIOTECARIOS):
                 return redirect('gestion:panel_bibliotecario')
-            elif user.groups.filter(name='Bodegero').exists():
+            elif tiene_grupo(user, GRUPO_BODEGERO):
                 return redirect('gestion:inventario_bodega')
             else:
                 return redirect('gestion:catalogo_lector')
@@ -89,64 +86,57 @@ def salir(request):
     return redirect('gestion:ingresar')
 
 def index(request):
-    actualizar_multas_vencidas()
     return render(request, 'inicio.html')
 
 # --- ROL BIBLIOTECARIO: GESTIÓN DE CONTROL Y CAJA ---
 @login_required
 @user_passes_test(es_staff)
 def panel_bibliotecario(request):
-    actualizar_multas_vencidas()
-    hoy = timezone.now().date()
-    total_deuda = Multa.objects.filter(pagada=False).aggregate(Sum('monto'))['monto__sum'] or 0
-    total_recaudado = Multa.objects.filter(pagada=True).aggregate(Sum('monto'))['monto__sum'] or 0
-    
-    context = {
-        'total_libros': Libro.objects.count(),
-        'total_autores': Autor.objects.count(),
-        'total_lectores': Lector.objects.count(),
-        'vencidos_count': Prestamo.objects.filter(devuelto=False, fecha_devolucion_esperada__lt=hoy).count(),
-        'total_multas_valor': total_deuda,
-        'total_recaudado': total_recaudado,
-        'prestamos_recientes': Prestamo.objects.all().order_by('-fecha_prestamo')[:10],
-        'morosos_top': Multa.objects.filter(pagada=False).order_by('-monto')[:5]
-    }
+    # El último evento se toma antes del resumen: lo que llegue después se aplica en vivo
+    ultimo_evento = broker().ultimo(PANEL)
+    # Una sola lectura del resumen precalculado; ?actualizar=1 fuerza la reconstrucción
+    context = {**obtener_resumen(forzar='actualizar' in request.GET), 'ultimo_evento': ultimo_evento}
     return render(request, 'panel_bibliotecario.html', context)
 
 @login_required
 @user_passes_test(es_staff)
 def lista_prestamos(request):
-    prestamos = Prestamo.objects.all().select_related('libro', 'lector')
     query = request.GET.get('q')
-    if query:
-        prestamos = prestamos.filter(
-            Q(libro__titulo__icontains=query) | Q(lector__identificacion__icontains=query)
-        ).distinct()
-    
+    estado = request.GET.get('estado')
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar_reporte('prestamos', formato, query, estado)
+    prestamos = prestamos_filtrados(query, estado).select_related('libro__autor', 'lector__user')
+
     context = {
-        'prestamos_activos': prestamos.filter(devuelto=False).order_by('fecha_devolucion_esperada'),
-        'prestamos_historicos': prestamos.filter(devuelto=True).order_by('-fecha_prestamo'),
+        'prestamos_activos': paginar(
+            request, prestamos.filter(devuelto=False), ('fecha_devolucion_esperada', 'id'), 'cursor_activos'
+        ),
+        'prestamos_historicos': paginar(
+            request, prestamos.filter(devuelto=True), ('-fecha_prestamo', '-id'), 'cursor_historicos'
+        ),
         'now': timezone.now().date(),
         'query': query,
+        'estado': estado,
     }
     return render(request, 'lista_prestamos.html', context)
 
 @login_required
 @user_passes_test(es_staff)
+@desde_replica
 def lista_facturas(request):
-    actualizar_multas_vencidas()
-    multas_pendientes = Multa.objects.filter(pagada=False)
+    # Saldos precalculados (gestion.saldos): se recorre el índice de deuda en lugar de agrupar multas
     query = request.GET.get('q')
-    if query:
-        multas_pendientes = multas_pendientes.filter(
-            Q(prestamo__lector__identificacion__icontains=query) |
-            Q(prestamo__lector__user__username__icontains=query)
-        )
-    facturas = multas_pendientes.values(
-        'prestamo__lector__identificacion', 'prestamo__lector__user__username'
-    ).annotate(total_deuda=Sum('monto'), cantidad_libros=Count('id')).order_by('-total_deuda')
-    
-    return render(request, 'lista_facturas.html', {'facturas': facturas, 'query': query})
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar_reporte('facturas', formato, query)
+    saldos = saldos_filtrados(query).select_related('lector__user')
+    context = {
+        'facturas': paginar(request, saldos, ('-deuda', 'lector_id')),
+        'total_deuda': saldos.aggregate(total=Sum('deuda'))['total'] or 0,
+        'query': query,
+    }
+    return render(request, 'lista_facturas.html', context)
 
 # --- ROL BODEGUERO: GESTIÓN FÍSICA E IMPORTACIÓN ---
 @login_required
@@ -154,18 +144,14 @@ def lista_facturas(request):
 def inventario_bodega(request):
     estado = request.GET.get('estado')
     query = request.GET.get('q')
-    libros = Libro.objects.all().order_by('estante', 'titulo')
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar_reporte('inventario', formato, query, estado)
+    libros = inventario_filtrado(query, estado).select_related('autor')
 
-    if estado == 'critico':
-        libros = libros.filter(copias_disponibles__lte=2)
-    elif estado == 'bajo':
-        libros = libros.filter(copias_disponibles__gt=2, copias_disponibles__lte=5)
-    
-    if query:
-        libros = libros.filter(Q(titulo__icontains=query) | Q(estante__icontains=query))
-    
     return render(request, 'inventario_bodega.html', {
-        'libros': libros, 
+        'ultimo_evento': broker().ultimo(BODEGA),
+        'libros': paginar(request, libros, ('estante_orden', 'titulo', 'id')),
         'alertas': Libro.objects.filter(copias_disponibles__lte=2),
         'query': query,
         'filtro_actual': estado
@@ -176,112 +162,243 @@ def inventario_bodega(request):
 def actualizar_stock_bodega(request, libro_id):
     if request.method == 'POST':
         libro = get_object_or_404(Libro, id=libro_id)
-        libro.copias_disponibles = request.POST.get('stock')
-        libro.estante = request.POST.get('estante')
-        libro.save()
-        messages.success(request, f"¡{libro.titulo} actualizado con éxito!")
+        try:
+            stock = int(request.POST.get('stock', ''))
+            ajustar_stock(libro.pk, stock, usuario=request.user, estante=request.POST.get('estante'))
+        except ValueError:
+            messages.error(request, "El stock debe ser un número entero mayor o igual a cero.")
+        else:
+            messages.success(request, f"¡{libro.titulo} actualizado con éxito!")
     return redirect('gestion:inventario_bodega')
 
 @login_required
 @user_passes_test(es_staff)
-def buscar_libro_api(request):
-    isbn = request.GET.get('isbn')
+async def buscar_libro_api(request):
+    isbn = limpiar_isbn(request.GET.get('isbn'))
     datos_libro = None
     if isbn:
-        url = f"https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
         try:
-            response = requests.get(url)
-            data = response.json()
-            key = f"ISBN:{isbn}"
-            if key in data:
-                info = data[key]
-                nombres_autores = [a['name'] for a in info.get('authors', [])]
-                anio_entero = timezone.now().year
-                try:
-                    anio_entero = int(''.join(filter(str.isdigit, info.get('publish_date', '')))[:4])
-                except: pass
-                
-                datos_libro = {
-                    'isbn': isbn, 'titulo': info.get('title'),
-                    'autores': ", ".join(nombres_autores),
-                    'paginas': info.get('number_of_pages', 0),
-                    'portada': info.get('cover', {}).get('large', ''), 
-                    'anio': anio_entero
-                }
+            encontrados, errores = await consultar_isbns_async([isbn])
+            if isbn in errores:
+                # Open Library no respondió (plazo agotado o error HTTP): no es lo mismo que no encontrarlo
+                messages.error(request, f"Error al buscar el libro: {errores[isbn]}")
+            elif isbn in encontrados:
+                datos_libro = datos_desde_openlibrary(isbn, encontrados[isbn])
                 
                 if 'confirmar_importar' in request.GET:
-                    nombre_completo = nombres_autores[0] if nombres_autores else "Autor Desconocido"
-                    partes = nombre_completo.split(' ', 1)
-                    nom, ape = partes[0], (partes[1] if len(partes) > 1 else " ")
-                    autor_obj, _ = Autor.objects.get_or_create(nombre=nom, apellido=ape)
-                    
-                    Libro.objects.update_or_create(
-                        titulo=datos_libro['titulo'], 
-                        defaults={
-                            'autor': autor_obj, 'copias_disponibles': 5, 
-                            'publicacion': datos_libro['anio'], 'paginas': datos_libro['paginas'],
-                            'portada_url': datos_libro['portada']
-                        }
-                    )
-                    
-                    if sincronizar_con_odoo(datos_libro['titulo'], isbn):
-                        messages.success(request, f"Éxito: {datos_libro['titulo']} guardado en Django y Odoo.")
-                    else:
-                        messages.warning(request, "Guardado en Django, pero falló el envío a Odoo. Revisa la terminal.")
+                    # El libro y su envío a Odoo se guardan juntos o no se guarda nada
+                    await sync_to_async(importar_libros)([datos_libro])
+                    messages.success(request, f"Éxito: {datos_libro['titulo']} guardado. Se enviará a Odoo en segundo plano.")
                     return redirect('gestion:inventario_bodega')
         except Exception as e: 
             print(f"Error API: {e}")
             messages.error(request, "Error al buscar el libro.")
-    return render(request, 'buscar_api.html', {'libro': datos_libro, 'isbn': isbn})
+    # render es síncrono: la plantilla base consulta el usuario y sus grupos
+    return await sync_to_async(render)(request, 'buscar_api.html', {'libro': datos_libro, 'isbn': isbn})
+
+@login_required
+@user_passes_test(es_staff)
+async def importar_lote(request):
+    reporte = []
+    if request.method == 'POST':
+        texto = request.POST.get('isbns', '')
+        archivo = request.FILES.get('archivo')
+        if archivo:
+            texto += '\n' + archivo.read().decode('utf-8', errors='ignore')
+        isbns = leer_isbns(texto)[:MAX_ISBNS_LOTE]
+
+        encontrados, errores = await consultar_isbns_async(isbns)
+        resultado = await sync_to_async(importar_libros)(
+            [datos_desde_openlibrary(isbn, info) for isbn, info in encontrados.items()]
+        )
+        for isbn in isbns:
+            if isbn in resultado:
+                reporte.append({'isbn': isbn, 'estado': resultado[isbn], 'titulo': encontrados[isbn].get('title')})
+            elif isbn in errores:
+                reporte.append({'isbn': isbn, 'estado': 'error', 'detalle': errores[isbn]})
+            else:
+                reporte.append({'isbn': isbn, 'estado': 'no encontrado'})
+        messages.success(request, f"Se importaron {len(resultado)} de {len(isbns)} ISBN.")
+    return await sync_to_async(render)(request, 'importar_lote.html', {
+        'reporte': reporte, 'maximo': MAX_ISBNS_LOTE, 'cache_isbn': await sync_to_async(estadisticas_cache)()
+    })
+
+async def portada_libro(request, pk):
+    """
+    Redirige a la miniatura local si ya existe; si no, sirve la portada desde el
+    origen sin bloquear un worker mientras llega.
+    """
+    libro = await Libro.objects.filter(pk=pk).select_related('portada').only(
+        'portada_url', 'portada__huella'
+    ).afirst()
+    if libro is None or not libro.portada_url:
+        raise Http404("El libro no tiene portada")
+    huella = getattr(getattr(libro, 'portada', None), 'huella', '')
+    if huella:
+        return redirect('gestion:miniatura_portada', huella=huella, tamano='g', formato='jpg')
+    try:
+        contenido, tipo = await descargar_portada(libro.portada_url)
+    except PortadaNoDisponible as e:
+        return HttpResponse(str(e), status=e.estado, content_type='text/plain; charset=utf-8')
+    return HttpResponse(contenido, content_type=tipo)
+
+# La URL lleva la huella del contenido: el navegador puede guardarla un año sin volver a preguntar
+@cache_control(public=True, max_age=DURACION_MINIATURAS, immutable=True)
+@etag(lambda request, huella, tamano, formato: f'{huella}-{tamano}-{formato}')
+def miniatura_portada(request, huella, tamano, formato):
+    ruta = ruta_miniatura(huella, tamano, formato)
+    if not default_storage.exists(ruta):
+        raise Http404("Miniatura no encontrada")
+    return FileResponse(default_storage.open(ruta), content_type=FORMATOS_MINIATURA[formato][1])
 
 # --- MODO LECTOR ---
 @login_required
 def catalogo_lector(request):
-    libros = Libro.objects.filter(copias_disponibles__gt=0).select_related('autor')
+    # Los agotados también se muestran: se pueden reservar para la lista de espera
+    libros = Libro.objects.select_related('autor', 'portada')
     query = request.GET.get('q')
     if query:
-        libros = libros.filter(Q(titulo__icontains=query) | Q(autor__nombre__icontains=query))
+        motor = buscador()
+        libros = motor.ordenar_libros(libros.filter(motor.q_libros(query)), query)
     return render(request, 'catalogo_lector.html', {'libros': libros, 'query': query})
 
 @login_required
 def mis_prestamos(request):
-    actualizar_multas_vencidas()
     prestamos = Prestamo.objects.filter(lector__user=request.user, devuelto=False).select_related('libro')
-    return render(request, 'mis_prestamos.html', {'prestamos': prestamos})
+    reservas = reservas_de(Lector.objects.filter(user=request.user).first())
+    return render(request, 'mis_prestamos.html', {'prestamos': prestamos, 'reservas': reservas})
 
 # --- OTRAS FUNCIONES ---
+@cachear_para_anonimos(LIBROS, AUTORES)
 def lista_libros(request):
-    libros = Libro.objects.all().select_related('autor').order_by('titulo')
-    return render(request, 'libros.html', {'libros': libros})
+    libros = Libro.objects.all().select_related('autor')
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar(
+            libros.order_by('titulo', 'id'),
+            ['id', 'titulo', 'autor__nombre', 'autor__apellido', 'publicacion', 'copias_disponibles'],
+            formato, 'libros',
+        )
+    return render(request, 'libros.html', {'libros': paginar(request, libros, ('titulo', 'id'))})
 
+@cachear_para_anonimos(AUTORES)
 def lista_autores(request):
-    autores = Autor.objects.all().order_by('nombre').prefetch_related('libro_set')
-    return render(request, 'lista_autores.html', {'autores': autores})
+    autores = Autor.objects.annotate(num_libros=Count('libro'))
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar(
+            autores.order_by('nombre', 'id'),
+            ['id', 'nombre', 'apellido', 'nacionalidad', 'fecha_nacimiento'],
+            formato, 'autores',
+        )
+    return render(request, 'lista_autores.html', {'autores': paginar(request, autores, ('nombre', 'id'))})
 
+@login_required
+@user_passes_test(es_staff)
 def lista_lectores(request):
-    lectores = Lector.objects.all().order_by('identificacion')
-    return render(request, 'lista_lectores.html', {'lectores': lectores})
+    # Solo personal: la lista muestra la deuda de cada lector y la exportación sus correos y teléfonos
+    lectores = Lector.objects.select_related('user', 'saldo')
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exportar(
+            lectores.order_by('identificacion'),
+            ['identificacion', 'user__username', 'user__email', 'telefono'],
+            formato, 'lectores',
+        )
+    # 'identificacion' es única, así que basta para un orden estable
+    return render(request, 'lista_lectores.html', {'lectores': paginar(request, lectores, ('identificacion',))})
 
 @login_required
+@user_passes_test(es_staff)
 def nuevo_prestamo(request):
+    if request.method == 'POST':
+        lector = get_object_or_404(Lector, pk=request.POST.get('lector'))
+        fecha = parse_date(request.POST.get('fecha_devolucion') or '')
+        if fecha is None:
+            messages.error(request, "Indique una fecha de devolución válida.")
+        else:
+            try:
+                registrar_prestamo(request.POST.get('libro'), lector, fecha, usuario=request.user)
+            except StockInsuficiente:
+                messages.error(request, "Ese libro ya no tiene copias disponibles.")
+            else:
+                messages.success(request, "Préstamo registrado con éxito.")
+                return redirect('gestion:prestamos')
     return render(request, 'nuevo_prestamo.html', {
         'libros': Libro.objects.filter(copias_disponibles__gt=0), 
-        'lectores': Lector.objects.all()
+        'lectores': Lector.objects.select_related('user')
     })
 
 @login_required
 def devolver_prestamo(request, pk):
     prestamo = get_object_or_404(Prestamo, pk=pk)
-    if not prestamo.devuelto:
-        actualizar_multas_vencidas()
-        Multa.objects.filter(prestamo=prestamo, pagada=False).update(pagada=True)
-        prestamo.devuelto = True
-        prestamo.save()
-        libro = prestamo.libro
-        libro.copias_disponibles += 1
-        libro.save()
+    if registrar_devolucion(prestamo, usuario=request.user):
         messages.success(request, f"Libro devuelto con éxito.")
-    return redirect('gestion:lista_prestamos')
+    return redirect('gestion:prestamos')
+
+# --- PRÉSTAMOS Y DEVOLUCIONES EN LOTE (MOSTRADOR) ---
+def _datos_lote(request):
+    """ (datos, es_json): acepta un formulario o un cuerpo JSON con listas de códigos. """
+    if request.content_type == 'application/json':
+        try:
+            datos = json.loads(request.body)
+        except ValueError:
+            datos = None
+        return (datos if isinstance(datos, dict) else {}), True
+    return request.POST, False
+
+def _codigos_lote(datos, es_json, campo):
+    codigos = datos.get(campo) if es_json else leer_codigos(datos.get(campo))
+    return codigos if isinstance(codigos, list) else []
+
+def _lector_lote(datos):
+    if datos.get('identificacion'):
+        return Lector.objects.filter(identificacion=str(datos['identificacion']).strip()).first()
+    lector_id = str(datos.get('lector') or '')
+    return Lector.objects.filter(pk=lector_id).first() if lector_id.isdigit() else None
+
+def _respuesta_lote(request, es_json, reporte, error=None):
+    totales = dict(Counter(fila['estado'] for fila in reporte))
+    if es_json:
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        return JsonResponse({'resultados': reporte, 'totales': totales})
+    if error:
+        messages.error(request, error)
+    elif reporte:
+        messages.success(request, ", ".join(f"{estado}: {total}" for estado, total in totales.items()))
+    return render(request, 'prestamos_lote.html', {'reporte': reporte, 'maximo': MAX_LOTE})
+
+@login_required
+@user_passes_test(es_staff)
+def prestar_lote(request):
+    if request.method != 'POST':
+        return _respuesta_lote(request, False, [])
+    datos, es_json = _datos_lote(request)
+    codigos = _codigos_lote(datos, es_json, 'libros')
+    lector = _lector_lote(datos)
+    try:
+        fecha = parse_date(str(datos.get('fecha_devolucion') or ''))
+    except ValueError:
+        fecha = None
+    if lector is None:
+        return _respuesta_lote(request, es_json, [], "Lector no encontrado.")
+    if fecha is None:
+        return _respuesta_lote(request, es_json, [], "Indique una fecha de devolución válida.")
+    if not codigos:
+        return _respuesta_lote(request, es_json, [], "No se indicó ningún libro.")
+    return _respuesta_lote(request, es_json, registrar_prestamos(codigos, lector, fecha, usuario=request.user))
+
+@login_required
+@user_passes_test(es_staff)
+def devolver_lote(request):
+    if request.method != 'POST':
+        return _respuesta_lote(request, False, [])
+    datos, es_json = _datos_lote(request)
+    codigos = _codigos_lote(datos, es_json, 'prestamos')
+    if not codigos:
+        return _respuesta_lote(request, es_json, [], "No se indicó ningún préstamo.")
+    return _respuesta_lote(request, es_json, registrar_devoluciones(codigos, usuario=request.user))
 
 def registro_usuario(request):
     if request.method == 'POST':
@@ -292,14 +409,20 @@ def registro_usuario(request):
     else: form = UsuarioForm()
     return render(request, 'registro_usuario.html', {'form': form})
 
+@cachear_para_anonimos(LIBROS, AUTORES)
 def detalle_libro(request, pk):
-    libro = get_object_or_404(Libro, pk=pk)
+    libro = get_object_or_404(Libro.objects.select_related('autor', 'portada'), pk=pk)
     return render(request, 'detalle_libro.html', {'libro': libro})
 
+@desde_replica
 def lista_multas(request):
-    actualizar_multas_vencidas()
-    multas = Multa.objects.filter(pagada=False)
-    return render(request, 'lista_multas.html', {'multas': multas})
+    query = request.GET.get('q')
+    estado = request.GET.get('estado')
+    formato = request.GET.get('formato')
+    if formato in FORMATOS:
+        return exige_personal(request) or exportar_reporte('multas', formato, query, estado)
+    multas = multas_filtradas(query, estado).select_related('prestamo__lector__user', 'prestamo__libro')
+    return render(request, 'lista_multas.html', {'multas': paginar(request, multas, ('id',))})
 
 def registro_lector(request):
     if request.method == 'POST':
@@ -314,4 +437,101 @@ def registro_lector(request):
 @login_required
 def escoger_libro(request, libro_id):
     libro = get_object_or_404(Libro, id=libro_id)
-    return render(request, 'confirmar_reserva.html', {'libro': libro})
\ No newline at end of file
+    if request.method == 'POST':
+        lector = Lector.objects.filter(user=request.user).first()
+        if lector is None:
+            messages.error(request, "Tu usuario no está registrado como lector.")
+            return redirect('gestion:catalogo_lector')
+        reserva, creada = reservar(libro.pk, lector)
+        if not creada:
+            messages.info(request, f"Ya tenías una reserva de '{libro.titulo}'.")
+        elif reserva.estado == Reserva.APARTADA:
+            messages.success(
+                request, f"Te apartamos una copia de '{libro.titulo}': retírala antes del {reserva.vence:%d/%m/%Y %H:%M}."
+            )
+        else:
+            messages.success(
+                request, f"No hay copias libres: estás en el puesto {posicion(reserva)} de la lista de espera."
+            )
+        return redirect('gestion:mis_prestamos')
+    return render(request, 'confirmar_reserva.html', {
+        'libro': libro, 'horas': settings.RESERVA_HORAS,
+        'en_espera': Reserva.objects.filter(libro=libro, estado=Reserva.EN_ESPERA).count(),
+    })
+
+@login_required
+def cancelar_reserva_lector(request, pk):
+    reserva = get_object_or_404(Reserva, pk=pk, lector__user=request.user)
+    if request.method == 'POST':
+        if cancelar_reserva(reserva):
+            messages.success(request, f"Reserva de '{reserva.libro.titulo}' cancelada.")
+        else:
+            messages.warning(request, "La reserva ya no estaba activa.")
+    return redirect('gestion:mis_prestamos')
+
+# --- CAMBIOS EN VIVO (SERVER-SENT EVENTS, VER gestion/eventos.py) ---
+def _flujo_eventos(request, canal):
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI la conexión ocuparía un worker entero: 204 le indica al navegador que no reintente
+        return HttpResponse(status=204)
+    if broker().suscriptores() >= MAX_SUSCRIPTORES:
+        return HttpResponse("Demasiadas conexiones en vivo", status=503)
+    desde = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+
+    async def eventos():
+        try:
+            suscripcion = broker().suscribir(canal, desde)
+        except Saturado:
+            # Se llenó entre la comprobación y la suscripción: el navegador reintenta más tarde
+            return
+        try:
+            # Si se corta, el navegador se reconecta a los 3 s enviando el Last-Event-ID
+            yield 'retry: 3000\n\n'
+            while True:
+                evento = await suscripcion.siguiente(LATIDO_EVENTOS)
+                if evento is None:
+                    yield ': latido\n\n'
+                    continue
+                yield formato_sse(evento, broker().identificador(evento))
+                if evento.tipo == RECARGAR:
+                    break
+        finally:
+            suscripcion.cerrar()
+
+    respuesta = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    # nginx no debe acumular el flujo
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@login_required
+@user_passes_test(es_staff)
+async def eventos_panel(request):
+    return _flujo_eventos(request, PANEL)
+
+@login_required
+@user_passes_test(es_bodegero)
+async def eventos_bodega(request):
+    return _flujo_eventos(request, BODEGA)
+
+# --- MONITOREO DE RENDIMIENTO (SOLO STAFF) ---
+@login_required
+@user_passes_test(es_staff)
+def monitoreo(request):
+    if request.method == 'POST':
+        metricas.reiniciar()
+        reiniciar_estadisticas()
+        messages.success(request, "Métricas reiniciadas.")
+        return redirect('gestion:monitoreo')
+    return render(request, 'monitoreo.html', {'vistas': metricas.resumen(), 'cache': estadisticas_cache_paginas()})
+
+@login_required
+@user_passes_test(es_staff)
+def monitoreo_datos(request):
+    return JsonResponse({'vistas': metricas.resumen(), 'cache': estadisticas_cache_paginas()})
+
+@login_required
+@user_passes_test(es_staff)
+async def estado_sincronizacion(request):
+    """ Odoo, Open Library y la cola de envíos; los servicios se consultan a la vez. """
+    return JsonResponse(await estado_externo())
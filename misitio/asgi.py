@@ -5,6 +5,27 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Modo ASGI (recomendado para las vistas async: búsqueda e importación por ISBN,
+portadas y estado de Odoo/Open Library). Mientras esperan al servicio externo
+no ocupan un worker, así un Open Library lento no frena el resto del sitio:
+
+    pip install "uvicorn[standard]"
+    uvicorn misitio.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+o con daphne:
+
+    pip install daphne
+    daphne -b 0.0.0.0 -p 8000 misitio.asgi:application
+
+Los estáticos no los sirve el servidor ASGI: 'collectstatic' y un proxy
+(nginx) delante, o whitenoise. Con varios workers use CACHE_BACKEND=file o
+redis para que todos compartan las marcas de cambio de la caché.
+ASYNC_HILOS limita los hilos para el código bloqueante (XML-RPC de Odoo).
+
+El modo WSGI (misitio/wsgi.py, runserver) sigue funcionando: Django ejecuta
+las vistas async en un event loop propio por petición, sin la ventaja de la
+concurrencia. 'python manage.py prueba_carga' mide la diferencia.
 """
 
 import os
@@ -41,8 +41,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Métricas por vista y ?profile=1 para staff (necesita el usuario ya autenticado)
+    'gestion.monitoreo.MonitoreoMiddleware',
 ]
 
+# Últimas peticiones que se guardan por vista para la página de monitoreo
+MONITOREO_MUESTRAS = 200
+
 ROOT_URLCONF = 'misitio.urls'
 
 TEMPLATES = [
@@ -57,6 +62,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gestion.contexto.cache_catalogo',
             ],
         },
     },
@@ -66,12 +72,101 @@ WSGI_APPLICATION = 'misitio.wsgi.application'
 
 
 # --- BASE DE DATOS ---
-DATABASES = {
+# DB_MOTOR=sqlite (por defecto, un servidor) o postgres (varios workers escribiendo a la vez).
+# Con DB_REPLICA_HOST (postgres) o DB_REPLICA_NAME (sqlite) las vistas de reportes leen de
+# una réplica de solo lectura (ver gestion/basedatos.py).
+DB_MOTOR = os.environ.get('DB_MOTOR', 'sqlite')
+# DB_SQLITE_AJUSTES=0 deja SQLite con sus valores por defecto, para comparar en el benchmark
+DB_SQLITE_AJUSTES = os.environ.get('DB_SQLITE_AJUSTES', '1') == '1'
+
+if DB_MOTOR == 'postgres':
+    def _postgres(host):
+        base = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'biblioteca'),
+            'USER': os.environ.get('DB_USER', 'biblioteca'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Conexiones persistentes; se comprueban antes de reutilizarlas tras un corte
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 5},
+        }
+        if os.environ.get('DB_POOL') == '1':
+            # Pool de psycopg 3 (psycopg[pool]) dentro de cada proceso: excluye CONN_MAX_AGE
+            base['CONN_MAX_AGE'] = 0
+            base['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+                'timeout': 10,
+            }
+        return base
+
+    DATABASES = {'default': _postgres(os.environ.get('DB_HOST', 'localhost'))}
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {**_postgres(os.environ['DB_REPLICA_HOST']), 'TEST': {'MIRROR': 'default'}}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Segundos que se espera un bloqueo antes de 'database is locked'
+                'timeout': 20,
+                # BEGIN IMMEDIATE: la transacción toma el bloqueo de escritura al empezar; sin esto,
+                # una transacción que lee y luego escribe falla sin esperar si otra escribió entre medio
+                'transaction_mode': 'IMMEDIATE',
+            } if DB_SQLITE_AJUSTES else {},
+        }
+    }
+    if os.environ.get('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['DB_REPLICA_NAME'],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['gestion.basedatos.RouterReplica']
+
+# PRAGMA que se aplican a cada conexión SQLite nueva (gestion.basedatos.ajustar_sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',        # Lectores y un escritor a la vez, sin bloquearse
+    'busy_timeout': 20000,        # ms
+    'synchronous': 'NORMAL',      # Seguro con WAL; solo se pierde la última transacción si se cae el equipo
+    'mmap_size': 256 * 1024 * 1024,
+} if DB_SQLITE_AJUSTES else {}
+
+
+# --- CACHÉ ---
+# CACHE_BACKEND=locmem (por defecto, un proceso), file (varios workers en una máquina)
+# o redis (varias máquinas). Con varios procesos conviene una caché compartida:
+# las marcas de cambio que invalidan las páginas viven aquí.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+_CACHES_DISPONIBLES = {
+    'locmem': {
+        'BACKEND': 'gestion.cache.LocMemConEstadisticas',
+        'LOCATION': 'biblioteca',
+    },
+    'file': {
+        'BACKEND': 'gestion.cache.ArchivoConEstadisticas',
+        'LOCATION': os.environ.get('CACHE_URL', str(BASE_DIR / 'cache')),
+    },
+    'redis': {
+        'BACKEND': 'gestion.cache.RedisConEstadisticas',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        **_CACHES_DISPONIBLES[CACHE_BACKEND],
+        'KEY_PREFIX': 'biblioteca',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '300')),
+        'OPTIONS': {'MAX_ENTRIES': 5000} if CACHE_BACKEND != 'redis' else {},
     }
 }
+# Duración de las páginas y fragmentos del catálogo (se invalidan antes por versión)
+CACHE_CATALOGO_SEGUNDOS = 60 * 60
 
 
 # --- VALIDACIÓN DE CONTRASEÑAS ---
@@ -97,6 +192,11 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 # Carpeta donde se recolectarán los estáticos en producción
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Archivos generados (miniaturas de las portadas). En producción conviene que
+# el proxy (nginx) sirva MEDIA_ROOT/portadas directamente con caché de un año.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
 
 # --- CONFIGURACIÓN DE CAMPOS ---
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -114,8 +214,38 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    # La versión va en la URL: /api/v1/...
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
+    'ALLOWED_VERSIONS': ('v1',),
+    'DEFAULT_VERSION': 'v1',
+    'DEFAULT_PAGINATION_CLASS': 'gestion.paginacion.PaginacionCursor',
+    'PAGE_SIZE': 50,
+    'DEFAULT_PERMISSION_CLASSES': (
+        'rest_framework.permissions.IsAuthenticated',
+    ),
 }
 
+# --- ODOO (XML-RPC) ---
+# Se pueden sobrescribir con variables de entorno en cada servidor
+ODOO = {
+    'URL': os.environ.get('ODOO_URL', 'http://localhost:8069'),
+    'DB': os.environ.get('ODOO_DB', '01'),
+    'USER': os.environ.get('ODOO_USER', 'coraquillafreddy@gmail.com'),
+    'PASSWORD': os.environ.get('ODOO_PASSWORD', '1726391673'),
+    'TIMEOUT': int(os.environ.get('ODOO_TIMEOUT', '10')),
+}
+
+# --- OPEN LIBRARY (IMPORTACIÓN POR ISBN) ---
+OPENLIBRARY_URL = os.environ.get('OPENLIBRARY_URL', 'https://openlibrary.org')
+
+# --- VISTAS ASÍNCRONAS ---
+# Hilos para código bloqueante sin ORM (XML-RPC de Odoo) llamado desde las vistas async
+ASYNC_HILOS = int(os.environ.get('ASYNC_HILOS', '8'))
+
+# --- RESERVAS ---
+# Horas que se guarda una copia apartada antes de pasar al siguiente de la lista de espera
+RESERVA_HORAS = int(os.environ.get('RESERVA_HORAS', '48'))
+
 # Mensajes de Bootstrap (opcional, mejora la visualización de alertas)
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {